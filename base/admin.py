@@ -30,4 +30,11 @@ admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Income)
 admin.site.register(Category)
 admin.site.register(Budget)
-admin.site.register(Savings)
\ No newline at end of file
+admin.site.register(Savings)
+admin.site.register(DescriptionCache)
+admin.site.register(CategoryJob)
+admin.site.register(EmailOutbox)
+admin.site.register(UserSummary)
+admin.site.register(MonthlyIncomeSummary)
+admin.site.register(BudgetSummary)
+admin.site.register(Tombstone)
@@ -0,0 +1,55 @@
+from decimal import Decimal, ROUND_DOWN
+
+
+CENT = Decimal('0.01')
+
+
+def is_extra(cat):
+    return cat['name'].strip().lower() == 'extra'
+
+
+def rebalance_categories(categories_data, total):
+    """
+    Adjust parsed category amounts so they add up to exactly `total`.
+
+    Any shortfall goes into the "Extra" category, as the prompt already asks
+    the model to do. If the model asked to delete "Extra", that entry is kept
+    after all so the shortfall still lands somewhere. When the model
+    overspends, the kept categories are scaled down proportionally and the
+    leftover cents go to the largest remainders. Other entries flagged for
+    deletion are left untouched and don't count towards the total.
+    """
+    total = Decimal(total).quantize(CENT)
+    kept = [cat for cat in categories_data if not cat.get('delete')]
+    for cat in kept:
+        cat['amount'] = max(Decimal(cat['amount']), Decimal('0.00')).quantize(CENT, rounding=ROUND_DOWN)
+
+    allocated = sum((cat['amount'] for cat in kept), Decimal('0.00'))
+
+    if allocated > total:
+        remainders = []
+        for cat in kept:
+            exact = cat['amount'] * total / allocated
+            cat['amount'] = exact.quantize(CENT, rounding=ROUND_DOWN)
+            remainders.append((exact - cat['amount'], cat))
+
+        # Hand out the cents lost to rounding, largest remainder first
+        leftover = int((total - sum(cat['amount'] for cat in kept)) / CENT)
+        remainders.sort(key=lambda item: item[0], reverse=True)
+        for _, cat in remainders[:leftover]:
+            cat['amount'] += CENT
+
+    elif allocated < total:
+        residual = total - allocated
+        extra = next((cat for cat in kept if is_extra(cat)), None)
+        deleted_extra = next((cat for cat in categories_data if cat.get('delete') and is_extra(cat)), None)
+        if extra:
+            extra['amount'] += residual
+        elif deleted_extra:
+            # Appending a new "Extra" would match the row being deleted and be dropped with it
+            deleted_extra['delete'] = False
+            deleted_extra['amount'] = residual
+        else:
+            categories_data.append({'name': 'Extra', 'amount': residual, 'delete': False})
+
+    return categories_data
@@ -1,6 +1,24 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
+
+
+def install_search(sender, using='default', **kwargs):
+    from .search import install_search_index
+    install_search_index(using)
 
 
 class BaseConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'base'
+
+    def ready(self):
+        # The full-text tables and triggers live outside the models, create them after every migrate
+        post_migrate.connect(install_search, sender=self)
+
+        # Keep the summary tables in step with income, savings and category writes
+        from . import summaries
+        summaries.connect()
+
+        # Record deletions for the sync endpoint
+        from . import sync
+        sync.connect()
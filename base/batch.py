@@ -0,0 +1,165 @@
+import io
+import json
+import re
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+
+
+METHODS = ('GET', 'POST', 'PUT', 'PATCH', 'DELETE')
+API_PREFIX = '/api/v1/'
+
+# Caller headers a sub-request keeps: auth, content negotiation and what
+# building absolute URLs needs. Others, e.g. If-None-Match, were meant for
+# the batch call itself and would turn unrelated sub-requests into 304s.
+INHERITED_HEADERS = (
+    'HTTP_AUTHORIZATION',
+    'HTTP_ACCEPT',
+    'HTTP_ACCEPT_LANGUAGE',
+    'HTTP_USER_AGENT',
+    'HTTP_HOST',
+    'HTTP_X_FORWARDED_HOST',
+    'HTTP_X_FORWARDED_PROTO',
+)
+
+# ${name.field.0.field} points into the body of the earlier sub-request called `name`
+REFERENCE = re.compile(r'\$\{([\w-]+)((?:\.[\w-]+)*)\}')
+
+
+class BatchError(Exception):
+    def __init__(self, status, detail):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+class SubRequest(HttpRequest):
+    """
+    A request for one operation of a batch. It inherits the caller's
+    scheme and INHERITED_HEADERS, and DRF reuses the caller's already
+    authenticated user instead of checking the token again.
+    """
+
+    def __init__(self, parent, method, path, body):
+        super().__init__()
+        url = urlsplit(path)
+        raw = json.dumps(body, cls=DjangoJSONEncoder).encode() if body is not None else b''
+        self.method = method
+        self.path = self.path_info = url.path
+        self.META = {
+            **{key: value for key, value in parent.META.items() if key in INHERITED_HEADERS or key.startswith(('SERVER_', 'REMOTE_'))},
+            'REQUEST_METHOD': method,
+            'PATH_INFO': url.path,
+            'QUERY_STRING': url.query,
+            'CONTENT_TYPE': 'application/json',
+            'CONTENT_LENGTH': str(len(raw)),
+        }
+        self.GET = QueryDict(url.query)
+        self._stream = io.BytesIO(raw)
+        self._read_started = False
+        self._scheme = parent.scheme
+        self.user = parent.user
+        self._force_auth_user = parent.user
+        self._force_auth_token = parent.auth
+
+    def _get_scheme(self):
+        return self._scheme
+
+
+def lookup(results, name, path):
+    if name not in results:
+        raise BatchError(400, f'${{{name}}} does not name an earlier request.')
+    value = results[name]
+    for part in path.split('.')[1:] if path else []:
+        try:
+            value = value[int(part)] if isinstance(value, list) else value[part]
+        except (KeyError, IndexError, TypeError, ValueError):
+            raise BatchError(400, f'${{{name}{path}}} is not in the response of "{name}".')
+    return value
+
+
+def resolve_references(value, results):
+    if isinstance(value, str):
+        whole = REFERENCE.fullmatch(value)
+        if whole:
+            # Keep the referenced value's type when it's the whole string
+            return lookup(results, *whole.groups())
+        return REFERENCE.sub(lambda match: str(lookup(results, *match.groups())), value)
+    if isinstance(value, dict):
+        return {key: resolve_references(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [resolve_references(item, results) for item in value]
+    return value
+
+
+def response_body(response):
+    if hasattr(response, 'data'):
+        return response.data
+    try:
+        return json.loads(response.content)
+    except ValueError:
+        return response.content.decode(response.charset, 'replace')
+
+
+def run_operation(request, operation, results):
+    if not isinstance(operation, dict):
+        raise BatchError(400, 'Each request must be an object with method and path.')
+    method = str(operation.get('method', 'GET')).upper()
+    if method not in METHODS:
+        raise BatchError(405, f'Method "{method}" not allowed.')
+    path = str(resolve_references(operation.get('path') or '', results))
+    body = resolve_references(operation.get('body'), results)
+
+    path = path if path.startswith('/') else API_PREFIX + path
+    if not path.startswith(API_PREFIX):
+        raise BatchError(400, f'Only {API_PREFIX} endpoints can be batched.')
+    try:
+        match = resolve(urlsplit(path).path)
+    except Resolver404:
+        raise BatchError(404, 'Not found.')
+    if not getattr(getattr(match.func, 'view_class', None), 'batchable', True):
+        raise BatchError(400, 'This endpoint can\'t be batched.')
+
+    response = match.func(SubRequest(request, method, path, body), *match.args, **match.kwargs)
+    if response.streaming:
+        raise BatchError(400, 'Streaming endpoints can\'t be batched.')
+    return response.status_code, response_body(response)
+
+
+def run_batch(request, operations, atomic=False):
+    """
+    Run `operations` in order through the existing views and return one
+    {id, status, body} per operation plus whether the writes were kept.
+
+    The batch stops at the first operation that fails (status 400 or
+    above): later ones may depend on it. They're reported with status 424.
+    With `atomic`, every write happens in one transaction, and a failure
+    rolls back the operations before it as well.
+    """
+    responses = []
+    results = {}
+    failed = False
+
+    with transaction.atomic() if atomic else nullcontext():
+        for index, operation in enumerate(operations):
+            name = str(operation.get('id', index)) if isinstance(operation, dict) else str(index)
+            if failed:
+                responses.append({'id': name, 'status': 424, 'body': {'detail': 'Not run, an earlier request failed.'}})
+                continue
+            try:
+                code, body = run_operation(request, operation, results)
+            except BatchError as e:
+                code, body = e.status, {'detail': e.detail}
+            responses.append({'id': name, 'status': code, 'body': body})
+            if code >= 400:
+                failed = True
+            else:
+                results[name] = body
+        if failed and atomic:
+            transaction.set_rollback(True)
+
+    return {'committed': not (failed and atomic), 'responses': responses}
@@ -0,0 +1,137 @@
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import DescriptionCache as DescriptionCacheEntry
+
+
+def normalize_name(name):
+    # "  Car  savings " and "car Savings" share one cache entry
+    return ' '.join(name.split()).lower()[:255]
+
+
+class DescriptionCache:
+    """
+    Two tier cache for generated category descriptions.
+
+    Lookups hit an in-process LRU first and fall back to the DescriptionCache
+    table, so a description generated by one worker is reused by every other
+    worker. Entries expire after `ttl` seconds and both tiers are trimmed to
+    their configured size.
+    """
+
+    def __init__(self, max_entries=1024, max_rows=10000, ttl=30 * 24 * 60 * 60):
+        self.max_entries = max_entries
+        self.max_rows = max_rows
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, names, prompt_version):
+        found = {}
+        pending = {}
+        now = timezone.now()
+
+        with self._lock:
+            for name in names:
+                key = (prompt_version, normalize_name(name))
+                entry = self._entries.get(key)
+                if entry and now - entry[1] < timedelta(seconds=self.ttl):
+                    self._entries.move_to_end(key)
+                    found[name] = entry[0]
+                    self.memory_hits += 1
+                else:
+                    if entry:
+                        del self._entries[key]
+                    pending.setdefault(key[1], []).append(name)
+
+        if not pending:
+            return found
+
+        rows = DescriptionCacheEntry.objects.filter(
+            prompt_version=prompt_version,
+            normalized_name__in=list(pending),
+            created_at__gte=now - timedelta(seconds=self.ttl),
+        ).values_list('normalized_name', 'description', 'created_at')
+
+        with self._lock:
+            for normalized_name, description, created_at in rows:
+                for name in pending.pop(normalized_name, []):
+                    found[name] = description
+                    self.db_hits += 1
+                self._remember((prompt_version, normalized_name), description, created_at)
+            self.misses += sum(len(group) for group in pending.values())
+
+        return found
+
+    def set_many(self, descriptions, prompt_version):
+        if not descriptions:
+            return
+
+        now = timezone.now()
+        entries = {normalize_name(name): description for name, description in descriptions.items()}
+
+        # Replace stale rows for these names, then insert the fresh ones in one query
+        DescriptionCacheEntry.objects.filter(prompt_version=prompt_version, normalized_name__in=list(entries)).delete()
+        DescriptionCacheEntry.objects.bulk_create([
+            DescriptionCacheEntry(normalized_name=name, prompt_version=prompt_version, description=description)
+            for name, description in entries.items()
+        ], ignore_conflicts=True)
+
+        with self._lock:
+            for name, description in entries.items():
+                self._remember((prompt_version, name), description, now)
+
+        self.prune()
+
+    def prune(self):
+        # Drop expired rows, then the oldest rows beyond max_rows
+        cutoff = timezone.now() - timedelta(seconds=self.ttl)
+        expired, _ = DescriptionCacheEntry.objects.filter(created_at__lt=cutoff).delete()
+        overflow_ids = list(
+            DescriptionCacheEntry.objects.order_by('-created_at').values_list('id', flat=True)[self.max_rows:]
+        )
+        if overflow_ids:
+            DescriptionCacheEntry.objects.filter(id__in=overflow_ids).delete()
+        with self._lock:
+            self.evictions += expired + len(overflow_ids)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.db_hits
+            lookups = hits + self.misses
+            return {
+                'memory_hits': self.memory_hits,
+                'db_hits': self.db_hits,
+                'hits': hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': hits / lookups if lookups else 0.0,
+                'memory_entries': len(self._entries),
+            }
+
+    def _remember(self, key, description, stored_at):
+        # Caller holds the lock
+        self._entries[key] = (description, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+description_cache = DescriptionCache(
+    max_entries=settings.DESCRIPTION_CACHE_MAX_ENTRIES,
+    max_rows=settings.DESCRIPTION_CACHE_MAX_ROWS,
+    ttl=settings.DESCRIPTION_CACHE_TTL,
+)
@@ -0,0 +1,64 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Budget, Category, Income, Savings
+
+
+# Exported columns per record type, read with values_list() so no model
+# instances or serializers are built per row
+EXPORTS = {
+    'income': (Income, ['id', 'date_received', 'source', 'amount', 'description', 'created_at', 'updated_at'], ['date_received', 'id']),
+    'budgets': (Budget, ['id', 'income_id', 'name', 'total_expenses', 'start_date', 'end_date', 'description', 'created_at', 'updated_at'], ['id']),
+    'categories': (Category, ['id', 'budget_id', 'name', 'amount', 'description', 'created_at'], ['id']),
+    'savings': (Savings, ['id', 'goal_name', 'target_amount', 'amount_saved', 'description', 'created_at', 'updated_at'], ['id']),
+}
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    # csv.writer only needs write(); hand each formatted line straight back
+    def write(self, value):
+        return value
+
+
+def export_rows(user, record_type, chunk_size=CHUNK_SIZE):
+    model, fields, ordering = EXPORTS[record_type]
+    queryset = model.objects.owned_by(user).order_by(*ordering).values_list(*fields)
+    # Server-side cursor on Postgres, fetchmany() batches on SQLite
+    return fields, queryset.iterator(chunk_size=chunk_size)
+
+
+def batched(lines, size=CHUNK_SIZE):
+    # Send a few hundred KB per write instead of one tiny chunk per row
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= size:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+def stream_csv(user, record_type):
+    writer = csv.writer(Echo())
+    fields, rows = export_rows(user, record_type)
+    # The header goes out before the query runs
+    yield writer.writerow(fields)
+    yield from batched(writer.writerow(row) for row in rows)
+
+
+def stream_ndjson(user, record_types):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+
+    def lines():
+        for record_type in record_types:
+            fields, rows = export_rows(user, record_type)
+            for row in rows:
+                record = dict(zip(fields, row))
+                record['type'] = record_type
+                yield encoder.encode(record) + '\n'
+
+    yield from batched(lines())
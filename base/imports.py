@@ -0,0 +1,141 @@
+import codecs
+import csv
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.parsers import BaseParser
+
+from .models import Income
+from .summaries import incomes_added, month_of
+
+
+MIN_AMOUNT = Decimal('1000')
+MAX_AMOUNT = Decimal('1000000000')
+# Income.amount is max_digits=10, decimal_places=2
+MAX_STORED = Decimal('99999999.99')
+CENT = Decimal('0.01')
+
+
+class CSVParser(BaseParser):
+    """
+    Hands the view a csv.DictReader over the request body instead of a
+    parsed copy, so a large upload is read line by line as it's consumed.
+    """
+    media_type = 'text/csv'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if encoding.lower().replace('_', '-') in ('utf-8', 'utf8'):
+            # Spreadsheet exports often start with a BOM
+            encoding = 'utf-8-sig'
+        return csv.DictReader(codecs.iterdecode(stream, encoding))
+
+
+def clean_income(row, today):
+    """
+    Validate one imported row. Returns (fields, errors), one of them empty.
+    """
+    if not isinstance(row, dict):
+        return None, {'non_field_errors': 'Expected an object with amount, source and date_received.'}
+
+    errors = {}
+    amount = row.get('amount')
+    if amount is None or amount == '':
+        errors['amount'] = 'This field is required.'
+    else:
+        try:
+            amount = Decimal(str(amount).strip())
+        except InvalidOperation:
+            amount = None
+        if amount is None or not amount.is_finite():
+            errors['amount'] = 'Enter a valid amount.'
+        elif not MIN_AMOUNT <= amount <= MAX_AMOUNT:
+            errors['amount'] = 'Enter an amount in the range of 1000 and 1 billion.'
+        elif amount > MAX_STORED:
+            errors['amount'] = 'Ensure that there are no more than 10 digits in total.'
+        elif amount != amount.quantize(CENT):
+            errors['amount'] = 'Ensure that there are no more than 2 decimal places.'
+
+    source = row.get('source')
+    source = str(source).strip() if source is not None else ''
+    if not source:
+        errors['source'] = 'This field is required.'
+    elif len(source) > 255:
+        errors['source'] = 'Ensure this field has no more than 255 characters.'
+
+    received = row.get('date_received')
+    if received is None or received == '':
+        # Same default as a single create
+        received = today
+    else:
+        try:
+            received = date.fromisoformat(str(received).strip())
+        except ValueError:
+            errors['date_received'] = 'Date has wrong format. Use YYYY-MM-DD.'
+
+    if errors:
+        return None, errors
+    description = row.get('description')
+    return {
+        'amount': amount,
+        'source': source,
+        'date_received': received,
+        'description': str(description) if description not in (None, '') else None,
+    }, {}
+
+
+def import_incomes(user, rows, skip_invalid=False, batch_size=None, max_errors=None):
+    """
+    Validate and insert `rows` (any iterable of dicts) as incomes of `user`
+    in a single pass, bulk inserting every `batch_size` valid rows.
+
+    By default the import is all or nothing: one bad row rolls back the rows
+    already inserted. With `skip_invalid` the valid rows are kept. Either way
+    every bad row is counted and the first `max_errors` are reported with
+    their 1-based row number.
+    """
+    batch_size = batch_size or settings.INCOME_IMPORT_BATCH_SIZE
+    max_errors = settings.INCOME_IMPORT_MAX_ERRORS if max_errors is None else max_errors
+    today = timezone.now().date()
+
+    result = {'rows': 0, 'created': 0, 'failed': 0, 'errors': []}
+    # Summary deltas per month, applied once at the end with incomes_added
+    months = {}
+    batch = []
+
+    with transaction.atomic():
+        for number, row in enumerate(rows, start=1):
+            result['rows'] = number
+            fields, errors = clean_income(row, today)
+            if errors:
+                result['failed'] += 1
+                if len(result['errors']) < max_errors:
+                    result['errors'].append({'row': number, 'errors': errors})
+                continue
+            # Nothing is written once the import is going to be rolled back anyway
+            if result['failed'] and not skip_invalid:
+                continue
+
+            batch.append(Income(user=user, **fields))
+            totals = months.setdefault(month_of(fields['date_received']), [Decimal('0.00'), 0])
+            totals[0] += fields['amount']
+            totals[1] += 1
+            if len(batch) >= batch_size:
+                Income.objects.bulk_create(batch)
+                result['created'] += len(batch)
+                batch = []
+
+        if result['failed'] and not skip_invalid:
+            transaction.set_rollback(True)
+            result['created'] = 0
+            return result
+
+        if batch:
+            Income.objects.bulk_create(batch)
+            result['created'] += len(batch)
+        if months:
+            incomes_added(user.id, months)
+    return result
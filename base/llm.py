@@ -0,0 +1,355 @@
+import contextvars
+import json
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+
+from .llm_metrics import record_usage
+
+
+class LLMError(Exception):
+    pass
+
+
+class GeminiProvider:
+    name = 'gemini'
+
+    def __init__(self, model_name='gemini-1.5-flash', api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._model = None
+        self._lock = threading.Lock()
+
+    def get_model(self):
+        # google.generativeai pulls in grpc and protobuf, so it is only imported
+        # and configured on the first call instead of at worker boot
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+
+                    genai.configure(api_key=self.api_key)
+                    self._model = genai.GenerativeModel(self.model_name)
+        return self._model
+
+    def generate(self, prompt, timeout=None, json_mode=False):
+        request_options = {'timeout': timeout} if timeout else None
+        generation_config = {'response_mime_type': 'application/json'} if json_mode else None
+        try:
+            response = self.get_model().generate_content(
+                prompt,
+                generation_config=generation_config,
+                request_options=request_options,
+            )
+        except Exception as e:
+            raise LLMError(f"Gemini request failed: {e}") from e
+
+        if not hasattr(response, '_result'):
+            raise LLMError("Gemini response has no result.")
+
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            record_usage(prompt_tokens=usage.prompt_token_count, response_tokens=usage.candidates_token_count)
+        return response._result.candidates[0].content.parts[0].text
+
+
+class OpenAIProvider:
+    name = 'openai'
+
+    def __init__(self, model_name='gpt-4o-mini', api_key=None):
+        self.model_name = model_name
+        self.api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+
+    def get_client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+
+                    self._client = OpenAI(api_key=self.api_key, max_retries=0)
+        return self._client
+
+    def generate(self, prompt, timeout=None, json_mode=False):
+        options = {'response_format': {'type': 'json_object'}} if json_mode else {}
+        try:
+            response = self.get_client().chat.completions.create(
+                model=self.model_name,
+                messages=[{'role': 'user', 'content': prompt}],
+                timeout=timeout,
+                **options,
+            )
+        except Exception as e:
+            raise LLMError(f"OpenAI request failed: {e}") from e
+
+        if not response.choices:
+            raise LLMError("OpenAI response has no choices.")
+
+        if response.usage is not None:
+            record_usage(prompt_tokens=response.usage.prompt_tokens, response_tokens=response.usage.completion_tokens)
+        return response.choices[0].message.content or ''
+
+
+DEFAULT_FAKE_RESPONSES = [
+    {'match': 'Update the following budget categories', 'response': json.dumps({'categories': [
+        {'name': 'Rent', 'amount': 400, 'delete': False},
+        {'name': 'Food', 'amount': 250, 'delete': False},
+        {'name': 'Transport', 'amount': 150, 'delete': False},
+        {'name': 'Emergency Savings', 'amount': 100, 'delete': False},
+        {'name': 'Extra', 'amount': 100, 'delete': False},
+    ]})},
+    {'match': 'Generate a unique description', 'response': "A category for planned spending in this budget."},
+]
+
+
+class FakeProvider:
+    """
+    Offline stand-in for Gemini used for local development and benchmarks.
+
+    Responses come from `responses`, a list of {"match", "response"} pairs where
+    the first entry whose match string appears in the prompt wins. Every call
+    sleeps for `latency` +/- `jitter` seconds and fails with probability
+    `error_rate`, so the rest of the LLM path can be measured under load.
+    """
+
+    name = 'fake'
+
+    def __init__(self, responses=None, latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        self.responses = responses if responses is not None else DEFAULT_FAKE_RESPONSES
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        # Recorded responses, e.g. captured from a real Gemini session
+        with open(path) as f:
+            return cls(responses=json.load(f), **kwargs)
+
+    def generate(self, prompt, timeout=None, json_mode=False):
+        with self._lock:
+            self.calls += 1
+            delay = max(0.0, self.latency + self._random.uniform(-self.jitter, self.jitter))
+            failed = self._random.random() < self.error_rate
+
+        if timeout and delay > timeout:
+            time.sleep(timeout)
+            raise LLMError("Fake provider timed out.")
+        time.sleep(delay)
+
+        if failed:
+            raise LLMError("Fake provider injected error.")
+
+        for entry in self.responses:
+            if entry['match'] in prompt:
+                return entry['response']
+        return ''
+
+
+class CircuitBreaker:
+    """
+    Stops sending traffic to a provider after `failure_threshold` consecutive
+    failures. After `reset_timeout` seconds one trial call is let through and
+    its outcome either closes the breaker again or restarts the wait.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._trial_running or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class Route:
+    def __init__(self, provider, timeout=None, breaker=None):
+        self.provider = provider
+        self.timeout = timeout
+        self.breaker = breaker or CircuitBreaker()
+        self.latency = None
+
+    def record_latency(self, elapsed, weight=0.2):
+        # Exponentially weighted moving average of recent successful calls
+        self.latency = elapsed if self.latency is None else (1 - weight) * self.latency + weight * elapsed
+
+
+class RoutedProvider:
+    """
+    Sends each call to the fastest healthy provider, based on recent latency.
+
+    Providers whose circuit breaker is open are skipped. A failed call falls
+    through to the next provider. With `hedge_delay` set, a second provider is
+    also asked once the first one has been running that long, and whichever
+    answers first wins.
+    """
+
+    name = 'router'
+
+    def __init__(self, routes, hedge_delay=None, max_workers=16):
+        self.routes = routes
+        self.hedge_delay = hedge_delay
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='llm-hedge')
+
+    def candidates(self):
+        # Measured providers fastest first, then those without samples yet in
+        # their configured order (the sort is stable)
+        healthy = [route for route in self.routes if route.breaker.state != 'open']
+        return sorted(healthy, key=lambda route: (route.latency is None, route.latency or 0.0))
+
+    def stats(self):
+        return [
+            {
+                'provider': route.provider.name,
+                'latency': route.latency,
+                'breaker': route.breaker.state,
+                'failures': route.breaker.failures,
+            }
+            for route in self.routes
+        ]
+
+    def generate(self, prompt, timeout=None, json_mode=False):
+        pending = list(self.candidates())
+        running = {}
+        errors = []
+
+        while pending or running:
+            if not running:
+                future = self._start(pending, prompt, timeout, json_mode)
+                if future is None:
+                    break
+                running[future] = True
+                continue
+
+            hedge = self.hedge_delay if pending and len(running) == 1 else None
+            done, _ = wait(list(running), timeout=hedge, return_when=FIRST_COMPLETED)
+            if not done:
+                # The first provider is slow: hedge with the next one
+                future = self._start(pending, prompt, timeout, json_mode)
+                if future is not None:
+                    running[future] = True
+                continue
+
+            for future in done:
+                del running[future]
+                try:
+                    return future.result()
+                except LLMError as e:
+                    errors.append(str(e))
+
+        raise LLMError("All LLM providers failed: " + ("; ".join(errors) or "no provider available"))
+
+    def _start(self, pending, prompt, timeout, json_mode):
+        while pending:
+            route = pending.pop(0)
+            if route.breaker.allow():
+                # Run in a copy of the caller's context so usage reaches the call being measured
+                return self._executor.submit(contextvars.copy_context().run, self._call, route, prompt, timeout, json_mode)
+        return None
+
+    def _call(self, route, prompt, timeout, json_mode):
+        timeouts = [t for t in (timeout, route.timeout) if t]
+        start = time.monotonic()
+        try:
+            text = route.provider.generate(prompt, timeout=min(timeouts) if timeouts else None, json_mode=json_mode)
+        except Exception as e:
+            route.breaker.record_failure()
+            if isinstance(e, LLMError):
+                raise
+            raise LLMError(f"{route.provider.name} failed: {e}") from e
+        route.breaker.record_success()
+        route.record_latency(time.monotonic() - start)
+        record_usage(provider=route.provider.name)
+        return text
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def build_single_provider(name):
+    if name == 'fake':
+        options = {
+            'latency': settings.LLM_FAKE_LATENCY,
+            'jitter': settings.LLM_FAKE_JITTER,
+            'error_rate': settings.LLM_FAKE_ERROR_RATE,
+        }
+        if settings.LLM_FAKE_RESPONSES:
+            return FakeProvider.from_file(settings.LLM_FAKE_RESPONSES, **options)
+        return FakeProvider(**options)
+    if name == 'gemini':
+        return GeminiProvider(model_name=settings.GEMINI_MODEL, api_key=settings.GOOGLE_API_KEY)
+    if name == 'openai':
+        return OpenAIProvider(model_name=settings.OPENAI_MODEL, api_key=settings.OPENAI_API_KEY)
+    raise ValueError(f"Unknown LLM provider: {name}")
+
+
+def build_provider():
+    names = [name.strip() for name in settings.LLM_PROVIDER.split(',') if name.strip()]
+    if len(names) == 1:
+        return build_single_provider(names[0])
+
+    # Several providers: route between them with per-provider timeouts and breakers
+    routes = [
+        Route(
+            build_single_provider(name),
+            timeout=settings.LLM_PROVIDER_TIMEOUTS.get(name),
+            breaker=CircuitBreaker(settings.LLM_BREAKER_FAILURES, settings.LLM_BREAKER_RESET),
+        )
+        for name in names
+    ]
+    return RoutedProvider(routes, hedge_delay=settings.LLM_HEDGE_DELAY)
+
+
+def get_provider():
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_provider()
+    return _provider
+
+
+def set_provider(provider):
+    # Swap the process-wide provider, e.g. for benchmarks; None rebuilds it from settings
+    global _provider
+    with _provider_lock:
+        _provider = provider
@@ -0,0 +1,184 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger('base.llm')
+
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOKEN_BUCKETS = (50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+_current_call = contextvars.ContextVar('llm_current_call', default=None)
+_current_request = contextvars.ContextVar('llm_current_request', default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def snapshot(self):
+        # Cumulative counts per upper bound, the last one being +Inf
+        cumulative = []
+        total = 0
+        for bound, count in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {'count': self.count, 'sum': self.sum, 'buckets': cumulative}
+
+
+class LLMCall:
+    def __init__(self, kind, provider, attempt, prompt_chars):
+        self.kind = kind
+        self.provider = provider
+        self.attempt = attempt
+        self.prompt_chars = prompt_chars
+        self.response_chars = 0
+        self.prompt_tokens = None
+        self.response_tokens = None
+        self.duration = 0.0
+        self.outcome = 'pending'
+
+
+class LLMMetrics:
+    """
+    Process-wide counters and histograms for LLM calls, labelled by call kind
+    (e.g. "categories", "description"), provider and outcome.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = {}
+            self.sizes = {}
+            self.tokens = {}
+            self.durations = {}
+            self.token_histograms = {}
+
+    def record(self, call):
+        key = (call.kind, call.provider)
+        with self._lock:
+            outcome_key = key + (call.outcome,)
+            self.calls[outcome_key] = self.calls.get(outcome_key, 0) + 1
+            self.durations.setdefault(key, Histogram(DURATION_BUCKETS)).observe(call.duration)
+            sizes = self.sizes.setdefault(key, {'prompt_chars': 0, 'response_chars': 0})
+            sizes['prompt_chars'] += call.prompt_chars
+            sizes['response_chars'] += call.response_chars
+
+            if call.prompt_tokens is not None or call.response_tokens is not None:
+                prompt_tokens = call.prompt_tokens or 0
+                response_tokens = call.response_tokens or 0
+                totals = self.tokens.setdefault(key, {'prompt': 0, 'response': 0})
+                totals['prompt'] += prompt_tokens
+                totals['response'] += response_tokens
+                self.token_histograms.setdefault(key, Histogram(TOKEN_BUCKETS)).observe(prompt_tokens + response_tokens)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'calls': [
+                    {'kind': kind, 'provider': provider, 'outcome': outcome, 'count': count}
+                    for (kind, provider, outcome), count in sorted(self.calls.items())
+                ],
+                'sizes': [
+                    {'kind': kind, 'provider': provider, **sizes}
+                    for (kind, provider), sizes in sorted(self.sizes.items())
+                ],
+                'tokens': [
+                    {'kind': kind, 'provider': provider, **totals}
+                    for (kind, provider), totals in sorted(self.tokens.items())
+                ],
+                'duration_seconds': [
+                    {'kind': kind, 'provider': provider, **histogram.snapshot()}
+                    for (kind, provider), histogram in sorted(self.durations.items())
+                ],
+                'tokens_per_call': [
+                    {'kind': kind, 'provider': provider, **histogram.snapshot()}
+                    for (kind, provider), histogram in sorted(self.token_histograms.items())
+                ],
+            }
+
+
+llm_metrics = LLMMetrics()
+
+
+def record_usage(prompt_tokens=None, response_tokens=None, provider=None):
+    # Called by providers to attach token counts to the call being measured
+    call = _current_call.get()
+    if call is None or call.outcome != 'pending':
+        return
+    if prompt_tokens is not None:
+        call.prompt_tokens = prompt_tokens
+    if response_tokens is not None:
+        call.response_tokens = response_tokens
+    if provider is not None:
+        call.provider = provider
+
+
+def instrumented_generate(provider, prompt, kind, attempt=1, **kwargs):
+    call = LLMCall(kind, provider.name, attempt, len(prompt))
+    token = _current_call.set(call)
+    start = time.perf_counter()
+    try:
+        text = provider.generate(prompt, **kwargs)
+    except Exception:
+        call.outcome = 'error'
+        raise
+    else:
+        call.outcome = 'success'
+        call.response_chars = len(text)
+        return text
+    finally:
+        call.duration = time.perf_counter() - start
+        _current_call.reset(token)
+        llm_metrics.record(call)
+        calls = _current_request.get()
+        if calls is not None:
+            calls.append(call)
+
+
+def summarize(calls):
+    return {
+        'calls': len(calls),
+        'failed': sum(1 for call in calls if call.outcome != 'success'),
+        'max_attempt': max((call.attempt for call in calls if call.kind == 'categories'), default=0),
+        'llm_seconds': round(sum(call.duration for call in calls), 3),
+        'slowest_seconds': round(max((call.duration for call in calls), default=0.0), 3),
+        'prompt_chars': sum(call.prompt_chars for call in calls),
+        'response_chars': sum(call.response_chars for call in calls),
+        'prompt_tokens': sum(call.prompt_tokens or 0 for call in calls),
+        'response_tokens': sum(call.response_tokens or 0 for call in calls),
+        'by_kind': {
+            kind: sum(1 for call in calls if call.kind == kind)
+            for kind in sorted({call.kind for call in calls})
+        },
+    }
+
+
+@contextmanager
+def track_request(label):
+    # Collects every instrumented call made while the block runs, including
+    # calls made from threads started with contextvars.copy_context()
+    calls = []
+    token = _current_request.set(calls)
+    start = time.perf_counter()
+    try:
+        yield calls
+    finally:
+        _current_request.reset(token)
+        summary = summarize(calls)
+        summary['request_seconds'] = round(time.perf_counter() - start, 3)
+        logger.debug("LLM summary for %s: %s", label, summary)
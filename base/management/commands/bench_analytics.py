@@ -0,0 +1,106 @@
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from base.management.commands.bench_categories import percentile
+from base.models import Budget, Category, CustomUser, Income, Savings
+from base.summaries import bulk_written
+
+
+BENCH_EMAIL = 'analytics-{}@bench.invalid'
+CATEGORY_NAMES = ['Rent', 'Food', 'Transport', 'Utilities', 'Entertainment', 'Emergency Savings']
+
+
+class Command(BaseCommand):
+    help = 'Seed users with a large income history and time the analytics endpoint against them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1, help='Users to seed.')
+        parser.add_argument('--incomes', type=int, default=100000, help='Incomes seeded per user.')
+        parser.add_argument('--years', type=int, default=10, help='Years the income history is spread over.')
+        parser.add_argument('--runs', type=int, default=20, help='Requests timed per range.')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the seeded data.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded users for another run.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = [self.seed(i, options, rng) for i in range(options['users'])]
+
+        client = APIClient()
+        ranges = [
+            ('last 12 months', {}),
+            ('last 3 years', {'start': (date.today() - timedelta(days=3 * 365)).strftime('%Y-%m')}),
+            ('full history', {'start': (date.today() - timedelta(days=options['years'] * 366)).strftime('%Y-%m')}),
+        ]
+        try:
+            for label, params in ranges:
+                timings = []
+                for run in range(options['runs']):
+                    client.force_authenticate(users[run % len(users)])
+                    with CaptureQueriesContext(connection) as ctx:
+                        start = time.perf_counter()
+                        response = client.get('/api/v1/analytics/', params)
+                        timings.append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        self.stderr.write(f'{label}: HTTP {response.status_code} {response.content[:200]}')
+                        return
+                timings.sort()
+                self.stdout.write(
+                    f"{label:16} p50 {percentile(timings, 50) * 1000:6.1f}ms  p95 {percentile(timings, 95) * 1000:6.1f}ms  "
+                    f"mean {statistics.mean(timings) * 1000:6.1f}ms  queries {len(ctx.captured_queries)}  "
+                    f"months {len(response.data['income']['months'])}"
+                )
+        finally:
+            if not options['keep']:
+                CustomUser.objects.filter(email__startswith='analytics-', email__endswith='@bench.invalid').delete()
+
+    def seed(self, index, options, rng):
+        email = BENCH_EMAIL.format(index)
+        user = CustomUser.objects.filter(email=email).first()
+        if user and Income.objects.filter(user=user).count() >= options['incomes']:
+            return user
+        if not user:
+            user = CustomUser.objects.create_user(email=email, username=email, password=None)
+
+        start = time.perf_counter()
+        days = options['years'] * 365
+        today = date.today()
+        batch = []
+        for i in range(options['incomes']):
+            batch.append(Income(
+                user=user,
+                amount=Decimal(rng.randrange(100000, 1000000)) / 100,
+                source=rng.choice(['Salary', 'Freelance', 'Dividends', 'Rental', 'Bonus']),
+                date_received=today - timedelta(days=rng.randrange(days)),
+            ))
+            if len(batch) == 5000:
+                Income.objects.bulk_create(batch)
+                batch = []
+        Income.objects.bulk_create(batch)
+
+        # One budget per month, each from one of that month's incomes
+        months = {}
+        for income in Income.objects.filter(user=user).order_by('date_received').only('id', 'amount', 'date_received').iterator():
+            months.setdefault(income.date_received.replace(day=1), income)
+        budgets = Budget.objects.bulk_create([
+            Budget(name=f'{month:%B %Y}', income=income, total_expenses=income.amount, start_date=month, end_date=month + timedelta(days=27))
+            for month, income in months.items()
+        ])
+        Category.objects.bulk_create([
+            Category(budget=budget, name=name, amount=(budget.total_expenses / len(CATEGORY_NAMES)).quantize(Decimal('0.01')))
+            for budget in budgets for name in CATEGORY_NAMES
+        ])
+        Savings.objects.bulk_create([
+            Savings(user=user, goal_name=goal, amount_saved=Decimal(rng.randrange(0, 500000)) / 100, target_amount=Decimal('5000.00'))
+            for goal in ['Emergency Savings', 'Holiday Savings', 'Car Savings']
+        ])
+        bulk_written(user.id)
+        self.stdout.write(f'seeded {email}: {options["incomes"]} incomes, {len(budgets)} budgets in {time.perf_counter() - start:.1f}s')
+        return user
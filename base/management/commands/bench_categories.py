@@ -0,0 +1,132 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from rest_framework.test import APIClient
+
+from base.description_cache import description_cache
+from base.llm import FakeProvider, set_provider
+from base.llm_metrics import llm_metrics
+from base.models import Budget, Category, CustomUser, DescriptionCache, Income
+from base.summaries import bulk_written
+
+
+BENCH_EMAIL = 'bench-{}@bench.invalid'
+
+
+def percentile(values, pct):
+    # Nearest-rank percentile over an already sorted list
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(pct / 100 * len(values))) - 1))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = 'Run concurrent categories/create/ requests against seeded budgets and report latency and LLM calls.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Total number of category requests.')
+        parser.add_argument('--concurrency', type=int, default=5, help='Requests in flight at once.')
+        parser.add_argument('--categories', type=int, default=6, help='Existing categories seeded per budget.')
+        parser.add_argument('--latency', type=float, default=0.5, help='Fake LLM latency in seconds.')
+        parser.add_argument('--jitter', type=float, default=0.1, help='Fake LLM latency jitter in seconds.')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of fake LLM calls that fail.')
+        parser.add_argument('--responses', help='JSON file of recorded responses for the fake provider.')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed for the fake provider.')
+        parser.add_argument('--live', action='store_true', help='Use the configured provider instead of the fake one.')
+        parser.add_argument('--clear-cache', action='store_true', help='Start with an empty description cache.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded users, incomes and budgets.')
+
+    def handle(self, *args, **options):
+        provider = None
+        if not options['live']:
+            fake_options = {
+                'latency': options['latency'],
+                'jitter': options['jitter'],
+                'error_rate': options['error_rate'],
+                'seed': options['seed'],
+            }
+            if options['responses']:
+                provider = FakeProvider.from_file(options['responses'], **fake_options)
+            else:
+                provider = FakeProvider(**fake_options)
+            set_provider(provider)
+
+        llm_metrics.reset()
+
+        if options['clear_cache']:
+            description_cache.clear()
+            DescriptionCache.objects.all().delete()
+
+        budgets = self.seed(options['requests'], options['categories'])
+
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+        local = threading.local()
+
+        def run(budget):
+            if not hasattr(local, 'client'):
+                local.client = APIClient(raise_request_exception=False)
+            local.client.force_authenticate(budget.income.user)
+            start = time.perf_counter()
+            response = local.client.post('/api/v1/categories/create/', {
+                'budget': budget.id,
+                'description': 'Move 50 from Transport to Food and put anything left into Emergency Savings',
+            }, format='json')
+            elapsed = time.perf_counter() - start
+            close_old_connections()
+            with lock:
+                latencies.append(elapsed)
+                if response.status_code >= 400:
+                    failures.append(response.status_code)
+
+        wall_start = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+                list(executor.map(run, budgets))
+        finally:
+            wall = time.perf_counter() - wall_start
+            if provider:
+                set_provider(None)
+            if not options['keep']:
+                CustomUser.objects.filter(email__startswith='bench-', email__endswith='@bench.invalid').delete()
+
+        latencies.sort()
+        self.stdout.write(f"requests:        {len(latencies)} ({len(failures)} failed)")
+        self.stdout.write(f"concurrency:     {options['concurrency']}")
+        self.stdout.write(f"wall time:       {wall:.3f}s ({len(latencies) / wall:.2f} req/s)")
+        for pct in (50, 95, 99):
+            self.stdout.write(f"p{pct}:             {percentile(latencies, pct) * 1000:.1f}ms")
+        calls = sum(entry['count'] for entry in llm_metrics.snapshot()['calls'])
+        self.stdout.write(f"LLM calls/req:   {calls / max(len(latencies), 1):.2f}")
+        self.stdout.write(f"description cache: {description_cache.stats()}")
+
+    def seed(self, count, categories):
+        budgets = []
+        for i in range(count):
+            email = BENCH_EMAIL.format(i)
+            user = CustomUser.objects.filter(email=email).first()
+            if not user:
+                user = CustomUser.objects.create_user(email=email, username=email, password=None)
+            income = Income.objects.create(user=user, amount=Decimal('5000.00'), source='Benchmark', date_received=date.today())
+            budget = Budget.objects.create(
+                name='Benchmark budget',
+                income=income,
+                total_expenses=income.amount,
+                start_date=date.today(),
+                end_date=date.today(),
+            )
+            share = (income.amount / max(categories, 1)).quantize(Decimal('0.01'))
+            Category.objects.bulk_create([
+                Category(budget=budget, name=f'Category {n}', amount=share, description='Seeded category')
+                for n in range(categories)
+            ])
+            bulk_written(budget_ids=[budget.id])
+            budgets.append(budget)
+        return budgets
@@ -0,0 +1,68 @@
+import io
+import tempfile
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from base.utils import send_bulk_email, send_normal_email
+
+
+BACKENDS = {
+    'locmem': 'django.core.mail.backends.locmem.EmailBackend',
+    'console': 'django.core.mail.backends.console.EmailBackend',
+    'file': 'django.core.mail.backends.filebased.EmailBackend',
+}
+
+
+class Command(BaseCommand):
+    help = 'Compare bulk email sending against one connection per message using an offline backend.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=1000, help='Number of emails to send.')
+        parser.add_argument('--batch-size', type=int, default=None, help='Emails per session (defaults to EMAIL_BULK_BATCH_SIZE).')
+        parser.add_argument('--rate', type=float, default=0, help='Maximum emails per second, 0 for unthrottled.')
+        parser.add_argument('--backend', choices=sorted(BACKENDS), default='file', help='Offline backend to send through.')
+        parser.add_argument('--file-path', help='Directory for the file backend (defaults to a temporary directory).')
+        parser.add_argument('--no-baseline', action='store_true', help='Skip the one-connection-per-message run.')
+
+    def handle(self, *args, **options):
+        backend = BACKENDS[options['backend']]
+        with tempfile.TemporaryDirectory() as tmp:
+            kwargs = {}
+            if options['backend'] == 'file':
+                kwargs['file_path'] = options['file_path'] or tmp
+            elif options['backend'] == 'console':
+                # Keep the rendered emails out of the report
+                kwargs['stream'] = io.StringIO()
+
+            if not options['no_baseline']:
+                start = time.perf_counter()
+                for data in self.messages(options['messages']):
+                    send_normal_email(data, connection=get_connection(backend, **kwargs))
+                seconds = time.perf_counter() - start
+                self.stdout.write(
+                    f"{'per message':12} {options['messages']} sent in {seconds:.3f}s "
+                    f"({options['messages'] / seconds:.1f}/s, {options['messages']} sessions)"
+                )
+
+            report = send_bulk_email(
+                self.messages(options['messages']),
+                batch_size=options['batch_size'],
+                rate=options['rate'],
+                backend=backend,
+                **kwargs
+            )
+            self.stdout.write(
+                f"{'bulk':12} {report['sent']} sent, {report['failed']} failed in {report['seconds']}s "
+                f"({report['messages_per_second']}/s, {report['sessions']} sessions)"
+            )
+
+    def messages(self, count):
+        for i in range(count):
+            yield {
+                'email_subject': f'Your weekly budget digest #{i}',
+                'email_body': 'Here is how your spending compared to your budget this week.',
+                'to_email': f'bench-{i}@bench.invalid',
+                'from_email': 'digest@bench.invalid',
+            }
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from base.models import CustomUser, Income
+from base.summaries import verify_user_summary
+
+
+BENCH_EMAIL = 'import@bench.invalid'
+FIELDS = ['amount', 'source', 'date_received', 'description']
+
+
+class Command(BaseCommand):
+    help = 'Time importing incomes through the bulk import endpoint against one POST per income.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000, help='Incomes per bulk import.')
+        parser.add_argument('--single', type=int, default=500, help='Incomes posted one at a time for comparison.')
+        parser.add_argument('--seed', type=int, default=1, help='Random seed for the generated rows.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        CustomUser.objects.filter(email=BENCH_EMAIL).delete()
+        user = CustomUser.objects.create_user(email=BENCH_EMAIL, username=BENCH_EMAIL, password=None)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        try:
+            rows = self.rows(options['single'], rng)
+            start = time.perf_counter()
+            for row in rows:
+                response = client.post('/api/v1/income/', row, format='json')
+                if response.status_code != 201:
+                    self.stderr.write(f'single: HTTP {response.status_code} {response.content[:200]}')
+                    return
+            self.report('one POST each', len(rows), time.perf_counter() - start)
+
+            rows = self.rows(options['rows'], rng)
+            start = time.perf_counter()
+            response = client.post('/api/v1/income/import/', rows, format='json')
+            self.expect_created(response)
+            self.report('JSON import', len(rows), time.perf_counter() - start)
+
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+            writer.writeheader()
+            writer.writerows(self.rows(options['rows'], rng))
+            body = buffer.getvalue().encode()
+            start = time.perf_counter()
+            response = client.post('/api/v1/income/import/', body, content_type='text/csv')
+            self.expect_created(response)
+            self.report('CSV import', options['rows'], time.perf_counter() - start)
+
+            self.stdout.write(f'summary problems: {len(verify_user_summary(user.id))}')
+        finally:
+            CustomUser.objects.filter(email=BENCH_EMAIL).delete()
+
+    def rows(self, count, rng):
+        today = date.today()
+        return [
+            {
+                'amount': str(Decimal(rng.randrange(100000, 10000000)) / 100),
+                'source': rng.choice(['Salary', 'Freelance', 'Dividends', 'Rental', 'Bonus']),
+                'date_received': (today - timedelta(days=rng.randrange(3650))).isoformat(),
+                'description': rng.choice(['', 'Imported from bank statement']),
+            }
+            for _ in range(count)
+        ]
+
+    def expect_created(self, response):
+        if response.status_code != 201:
+            raise RuntimeError(f'HTTP {response.status_code} {json.dumps(response.data)[:200]}')
+
+    def report(self, label, count, seconds):
+        self.stdout.write(f'{label:14} {count:7} rows in {seconds:6.2f}s  {count / seconds:9.0f} rows/s')
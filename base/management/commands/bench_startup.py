@@ -0,0 +1,66 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+WSGI_BOOT = (
+    "import bridger.wsgi\n"
+    "from django.urls import get_resolver\n"
+    "get_resolver().url_patterns\n"
+)
+
+# Importing the Gemini SDK up front reproduces the old eager startup path
+EAGER_IMPORT = "import google.generativeai\n"
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start time of manage.py check and WSGI worker boot in fresh interpreters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters per scenario.')
+        parser.add_argument('--no-eager', action='store_true',
+                            help='Skip the scenarios that import google.generativeai at startup for comparison.')
+
+    def handle(self, *args, **options):
+        manage_py = os.path.join(settings.BASE_DIR, 'manage.py')
+        check = f"import sys\nsys.argv = [{manage_py!r}, 'check']\nexec(open({manage_py!r}).read(), {{'__name__': '__main__'}})\n"
+
+        scenarios = [
+            ('manage.py check', check),
+            ('wsgi boot', WSGI_BOOT),
+        ]
+        if not options['no_eager']:
+            scenarios += [
+                ('manage.py check (eager genai)', EAGER_IMPORT + check),
+                ('wsgi boot (eager genai)', EAGER_IMPORT + WSGI_BOOT),
+            ]
+
+        for label, code in scenarios:
+            timings = [self.run(code) for _ in range(options['runs'])]
+            if None in timings:
+                self.stdout.write(f"{label:32} failed")
+                continue
+            self.stdout.write(
+                f"{label:32} median {statistics.median(timings) * 1000:7.1f}ms   min {min(timings) * 1000:7.1f}ms"
+            )
+
+    def run(self, code):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'bridger.settings'))
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=env,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        elapsed = time.perf_counter() - start
+        if result.returncode != 0:
+            self.stderr.write(result.stderr.decode(errors='replace'))
+            return None
+        return elapsed
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base.models import Budget, CustomUser
+from base.summaries import rebuild_budget_summary, rebuild_user_summary, verify_budget_summary, verify_user_summary
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user and per-budget summary tables from the source rows, or verify them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true',
+                            help='Report summaries that differ from the source rows instead of rebuilding them.')
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help='Only this user id and their budgets (repeatable).')
+
+    def handle(self, *args, **options):
+        users = CustomUser.objects.order_by('id')
+        budgets = Budget.objects.order_by('id')
+        if options['users']:
+            users = users.filter(id__in=options['users'])
+            budgets = budgets.filter(income__user_id__in=options['users'])
+
+        mismatches = 0
+        for user_id in users.values_list('id', flat=True).iterator():
+            if options['verify']:
+                mismatches += self.report(f'user {user_id}', verify_user_summary(user_id))
+            else:
+                rebuild_user_summary(user_id)
+
+        for budget_id in budgets.values_list('id', flat=True).iterator():
+            if options['verify']:
+                mismatches += self.report(f'budget {budget_id}', verify_budget_summary(budget_id))
+            else:
+                rebuild_budget_summary(budget_id)
+
+        if options['verify']:
+            if mismatches:
+                raise CommandError(f'{mismatches} summaries are out of date; run rebuild_summaries to fix them.')
+            self.stdout.write('All summaries match.')
+        else:
+            self.stdout.write('Summaries rebuilt.')
+
+    def report(self, label, problems):
+        for what, stored, actual in problems:
+            self.stderr.write(f'{label} {what}: stored {stored}, actual {actual}')
+        return len(problems)
@@ -0,0 +1,88 @@
+import time
+import traceback
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils import timezone
+
+from base.models import CategoryJob
+
+
+class Command(BaseCommand):
+    help = 'Run queued category generation jobs created by categories/create/ in async mode.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the queue once and exit instead of polling.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty.')
+        parser.add_argument('--max-attempts', type=int, default=3, help='Give up on a job after this many attempts.')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue jobs left running for this many seconds by a crashed worker.')
+
+    def handle(self, *args, **options):
+        # Imported here so the command module stays cheap to load
+        from base.urls.api import CategoryCreateView
+
+        self.view = CategoryCreateView()
+        self.max_attempts = options['max_attempts']
+
+        while True:
+            close_old_connections()
+            self.requeue_stale(options['stale_after'])
+
+            job = self.claim_next()
+            if job:
+                self.run(job)
+                continue
+
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+    def requeue_stale(self, stale_after):
+        cutoff = timezone.now() - timedelta(seconds=stale_after)
+        stale = CategoryJob.objects.filter(status=CategoryJob.RUNNING, started_at__lt=cutoff)
+        # The claim already counted the attempt the worker died in, so a job
+        # that keeps killing workers stops once it has used them all
+        stale.filter(attempts__gte=self.max_attempts).update(
+            status=CategoryJob.FAILED,
+            error='The worker stopped while running this job.',
+            finished_at=timezone.now(),
+        )
+        stale.update(status=CategoryJob.PENDING)
+
+    def claim_next(self):
+        # The conditional update makes the claim safe with several workers on any backend
+        for job in CategoryJob.objects.filter(status=CategoryJob.PENDING).order_by('created_at')[:10]:
+            claimed = CategoryJob.objects.filter(id=job.id, status=CategoryJob.PENDING).update(
+                status=CategoryJob.RUNNING,
+                started_at=timezone.now(),
+                attempts=job.attempts + 1,
+            )
+            if claimed:
+                job.refresh_from_db()
+                return job
+        return None
+
+    def run(self, job):
+        self.stdout.write(f"Running category job {job.id} (attempt {job.attempts})")
+        try:
+            response = self.view.create_categories(job.user, job.budget, job.description)
+        except Exception:
+            error = traceback.format_exc()
+            self.stderr.write(error)
+            if job.attempts < self.max_attempts:
+                job.status = CategoryJob.PENDING
+            else:
+                job.status = CategoryJob.FAILED
+                job.finished_at = timezone.now()
+            job.error = error
+            job.save(update_fields=['status', 'error', 'finished_at'])
+            return
+
+        job.result = response.data
+        job.status = CategoryJob.SUCCEEDED if response.status_code < 400 else CategoryJob.FAILED
+        job.error = None if response.status_code < 400 else response.data.get('detail')
+        job.finished_at = timezone.now()
+        job.save(update_fields=['result', 'status', 'error', 'finished_at'])
+        self.stdout.write(f"Category job {job.id} {job.status}")
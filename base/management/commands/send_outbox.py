@@ -0,0 +1,123 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.db.models import F
+from django.utils import timezone
+
+from base.models import EmailOutbox
+from base.utils import send_bulk_email
+
+
+class Command(BaseCommand):
+    help = 'Deliver queued emails from the outbox in batches, one SMTP session per batch.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit instead of polling.')
+        parser.add_argument('--batch-size', type=int, default=50, help='Emails claimed per batch.')
+        parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds to sleep when the outbox is empty.')
+        parser.add_argument('--max-attempts', type=int, default=5, help='Mark an email failed after this many attempts.')
+        parser.add_argument('--backoff', type=float, default=30.0, help='Base retry delay in seconds, doubled per attempt.')
+        parser.add_argument('--stale-after', type=int, default=600,
+                            help='Requeue emails left in sending for this many seconds by a crashed worker.')
+        parser.add_argument('--rate', type=float, default=None,
+                            help='Maximum emails per second (defaults to EMAIL_BULK_RATE).')
+
+    def handle(self, *args, **options):
+        self.options = options
+
+        while True:
+            close_old_connections()
+            self.requeue_stale(options['stale_after'])
+
+            batch = self.claim_batch(options['batch_size'])
+            if batch:
+                self.send_batch(batch)
+                continue
+            if options['once']:
+                break
+            time.sleep(options['poll_interval'])
+
+    def requeue_stale(self, stale_after):
+        # A worker died while sending these. That counts as an attempt, so an
+        # email that keeps crashing workers backs off and finally fails.
+        now = timezone.now()
+        cutoff = now - timedelta(seconds=stale_after)
+        for email in EmailOutbox.objects.filter(status=EmailOutbox.SENDING, next_attempt_at__lt=cutoff):
+            # Moving next_attempt_at off the old claim time keeps another worker from counting it too
+            counted = EmailOutbox.objects.filter(id=email.id, status=EmailOutbox.SENDING, next_attempt_at=email.next_attempt_at).update(
+                attempts=F('attempts') + 1,
+                next_attempt_at=now,
+            )
+            if counted:
+                email.attempts += 1
+                self.fail(email, 'The worker stopped while sending this email.')
+
+    def claim_batch(self, batch_size):
+        now = timezone.now()
+        ids = list(
+            EmailOutbox.objects.filter(status=EmailOutbox.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+
+        # Only rows still pending are claimed, so concurrent workers never send twice
+        EmailOutbox.objects.filter(id__in=ids, status=EmailOutbox.PENDING).update(
+            status=EmailOutbox.SENDING,
+            next_attempt_at=now,
+        )
+        return list(EmailOutbox.objects.filter(id__in=ids, status=EmailOutbox.SENDING, next_attempt_at=now))
+
+    def send_batch(self, batch):
+        unsettled = {email.id: email for email in batch}
+
+        def settle(result):
+            # Saved as each send finishes, so a later crash can't leave a delivered email to be sent again
+            email = batch[result['index']]
+            email.attempts += 1
+            if result['sent']:
+                email.status = EmailOutbox.SENT
+                email.sent_at = timezone.now()
+                email.last_error = None
+                email.save(update_fields=['status', 'sent_at', 'attempts', 'last_error'])
+            else:
+                self.fail(email, result['error'])
+            del unsettled[email.id]
+
+        try:
+            report = send_bulk_email(
+                ({
+                    'email_subject': email.subject,
+                    'email_body': email.body,
+                    'to_email': email.to_email,
+                    'from_email': email.from_email,
+                } for email in batch),
+                batch_size=len(batch),
+                rate=self.options['rate'],
+                on_result=settle,
+            )
+        except Exception as e:
+            # Whatever wasn't settled is retried with backoff like any failed send
+            for email in list(unsettled.values()):
+                email.attempts += 1
+                self.fail(email, e)
+            return
+
+        self.stdout.write(
+            f"Sent {report['sent']} of {report['total']} emails in {report['seconds']}s "
+            f"({report['messages_per_second']}/s, {report['sessions']} sessions)"
+        )
+
+    def fail(self, email, error):
+        if email.attempts >= self.options['max_attempts']:
+            email.status = EmailOutbox.FAILED
+        else:
+            email.status = EmailOutbox.PENDING
+            delay = self.options['backoff'] * 2 ** (email.attempts - 1)
+            email.next_attempt_at = timezone.now() + timedelta(seconds=delay)
+        email.last_error = str(error)
+        email.save(update_fields=['status', 'attempts', 'next_attempt_at', 'last_error'])
+        self.stderr.write(f"Failed to send email {email.id} to {email.to_email}: {error}")
@@ -1,4 +1,5 @@
 from django.db import models
+from django.utils import timezone
 from django.dispatch import receiver
 from django.db.models.signals import post_save
 from django.urls import reverse
@@ -30,6 +31,14 @@ class CustomUserManager(BaseUserManager):
 
 
 
+class OwnedQuerySet(models.QuerySet):
+    # Each model names the lookup from itself to the owning user in owner_field
+    def owned_by(self, user):
+        return self.filter(**{self.model.owner_field: user})
+
+
+
+
 AUTH_PROVIDERS ={'email':'email', 'google':'google', 'github':'github', 'linkedin':'linkedin'}
 class CustomUser(AbstractUser):
     email = models.EmailField(unique=True)
@@ -70,6 +79,17 @@ class Income(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    owner_field = 'user'
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Income lists are filtered by owner and ordered newest first
+            models.Index(fields=['user', 'date_received', 'id']),
+            # Sync reads what changed after a point in time
+            models.Index(fields=['user', 'updated_at', 'id']),
+        ]
+
     def __str__(self):
         return f"{self.source} - {self.amount}"
 
@@ -106,7 +126,7 @@ from django.db import models
 
 class Budget(models.Model):
     name = models.CharField(max_length=255)
-    income = models.ForeignKey(Income, on_delete=models.CASCADE)
+    income = models.OneToOneField(Income, on_delete=models.CASCADE, related_name='budget')
     total_expenses = models.DecimalField(max_digits=10, decimal_places=2)
     start_date = models.DateField()
     end_date = models.DateField()
@@ -114,6 +134,14 @@ class Budget(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    owner_field = 'income__user'
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id']),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -134,7 +162,16 @@ class Savings(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    owner_field = 'user'
+    objects = OwnedQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            # Goals are looked up by owner and name when categories change
+            models.Index(fields=['user', 'goal_name']),
+            models.Index(fields=['user', 'created_at', 'id']),
+            models.Index(fields=['user', 'updated_at', 'id']),
+        ]
 
     def __str__(self):
         return self.goal_name
@@ -155,12 +192,181 @@ class Category(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
     isDelete = models.BooleanField(default=False)
+    # Versions the income detail response (ETag), see UserIncomeDetailView
+    updated_at = models.DateTimeField(auto_now=True)
 
+    owner_field = 'budget__income__user'
+    objects = OwnedQuerySet.as_manager()
 
-
+    class Meta:
+        indexes = [
+            models.Index(fields=['budget', 'name']),
+        ]
 
     def __str__(self):
         return self.name
 
 
 
+
+class DescriptionCache(models.Model):
+    normalized_name = models.CharField(max_length=255)
+    prompt_version = models.CharField(max_length=20)
+    description = models.TextField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['prompt_version', 'normalized_name'], name='unique_description_cache_key'),
+        ]
+        indexes = [
+            # Pruning deletes by age
+            models.Index(fields=['created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.normalized_name} ({self.prompt_version})"
+
+
+
+
+class CategoryJob(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (SUCCEEDED, 'Succeeded'),
+        (FAILED, 'Failed'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    budget = models.ForeignKey(Budget, on_delete=models.CASCADE)
+    description = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    result = models.JSONField(blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
+
+    owner_field = 'user'
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Category job {self.id} ({self.status})"
+
+
+
+
+class EmailOutbox(models.Model):
+    PENDING = 'pending'
+    SENDING = 'sending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (SENDING, 'Sending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    to_email = models.EmailField()
+    from_email = models.EmailField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, null=True)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {self.to_email} ({self.status})"
+
+
+
+
+# Running totals kept in step with the rows they summarize by base/summaries.py,
+# so summary endpoints never aggregate a user's whole history
+
+class UserSummary(models.Model):
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    total_income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    income_count = models.IntegerField(default=0)
+    total_saved = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    total_target = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    savings_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Summary for {self.user_id}"
+
+
+
+
+class MonthlyIncomeSummary(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    month = models.DateField()  # first day of the month
+    total_income = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    income_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_monthly_income_summary'),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.month:%Y-%m}"
+
+
+
+
+class BudgetSummary(models.Model):
+    budget = models.OneToOneField(Budget, on_delete=models.CASCADE, primary_key=True, related_name='summary')
+    allocated = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    category_count = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"Summary for budget {self.budget_id}"
+
+
+
+
+class Tombstone(models.Model):
+    # Left behind by a deleted income, budget or savings goal so sync clients
+    # can drop their copy. Written by base/sync.py, pruned by prune_tombstones.
+    # No foreign key constraint: a user's own deletion cascades through their
+    # rows, which leave tombstones pointing at them.
+    user = models.ForeignKey(CustomUser, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    kind = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    owner_field = 'user'
+    objects = OwnedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'deleted_at', 'id']),
+            models.Index(fields=['deleted_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} deleted {self.deleted_at}"
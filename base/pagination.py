@@ -0,0 +1,99 @@
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first cursor pagination on (`ordering_field`, id).
+
+    Each page seeks past the last row of the previous one instead of using
+    OFFSET, so page 500 costs the same as page 1 and rows inserted while a
+    client scrolls don't shift later pages. The total is only counted when
+    the client asks for it with ?count=true.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    page_size = 20
+    max_page_size = 100
+
+    def __init__(self, ordering_field):
+        self.ordering_field = ordering_field
+
+    @classmethod
+    def requested(cls, request):
+        # Views keep their old response shape unless the client opts in
+        return cls.cursor_query_param in request.query_params or request.query_params.get('paginate') == 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.decode_cursor(request, queryset.model._meta.get_field(self.ordering_field))
+
+        self.count = None
+        if request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes'):
+            self.count = queryset.count()
+
+        field = self.ordering_field
+        queryset = queryset.order_by(f'-{field}', '-id')
+        if position is not None:
+            value, pk = position
+            # The <= bound lets the database seek on the (owner, field, id) index
+            queryset = queryset.filter(**{f'{field}__lte': value}).filter(
+                Q(**{f'{field}__lt': value}) | Q(id__lt=pk)
+            )
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.last = rows[-1] if rows else None
+        return rows
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request, field):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+            # A tampered value would otherwise only fail inside the query
+            value = field.to_python(value)
+            if value is None:
+                raise ValueError('Cursor has no position.')
+            return value, int(pk)
+        except (TypeError, ValueError, UnicodeDecodeError, ValidationError):
+            raise NotFound('Invalid cursor.')
+
+    def encode_cursor(self, row):
+        value = getattr(row, self.ordering_field).isoformat()
+        raw = json.dumps([value, row.id], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'paginate')
+        url = remove_query_param(url, self.count_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.last))
+
+    def get_paginated_response(self, data):
+        response = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            response['count'] = self.count
+        return Response(response)
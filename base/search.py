@@ -0,0 +1,133 @@
+import re
+
+from django.db import DatabaseError, connections
+from django.db.models import Q
+
+
+# Searchable text per model, with the owner column used to scope matches
+SEARCH_TABLES = {
+    'base_income': {'owner': 'user_id', 'columns': ['source', 'description']},
+    'base_savings': {'owner': 'user_id', 'columns': ['goal_name', 'description']},
+}
+
+_installed = {}
+
+
+def tokenize(text):
+    return re.findall(r'\w+', text or '')
+
+
+def sqlite_triggers(table, owner, columns):
+    fts = f'{table}_fts'
+    fields = ', '.join([owner] + columns)
+    new_values = ', '.join(f'new.{col}' for col in [owner] + columns)
+    old_values = ', '.join(f'old.{col}' for col in [owner] + columns)
+    insert_new = f"INSERT INTO {fts}(rowid, {fields}) VALUES (new.id, {new_values});"
+    delete_old = f"INSERT INTO {fts}({fts}, rowid, {fields}) VALUES ('delete', old.id, {old_values});"
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert_new} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete_old} END",
+        # Only text and owner changes touch the index, amount updates don't
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {fields} ON {table} BEGIN {delete_old} {insert_new} END",
+    ]
+
+
+def postgres_document(columns):
+    return "to_tsvector('simple', " + " || ' ' || ".join(f"coalesce({col}, '')" for col in columns) + ")"
+
+
+def install_search_index(using='default'):
+    """
+    Create the full-text index for income and savings text and keep it in
+    sync with the tables.
+
+    SQLite gets an external-content FTS5 table per model, maintained by
+    triggers. Postgres gets a GIN expression index over a tsvector, which the
+    database maintains itself. Other backends fall back to icontains.
+    """
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        existing = connection.introspection.table_names(cursor)
+        for table, spec in SEARCH_TABLES.items():
+            if table not in existing:
+                continue
+            fts = f'{table}_fts'
+            if connection.vendor == 'sqlite':
+                fields = ', '.join([spec['owner']] + spec['columns'])
+                created = fts not in existing
+                try:
+                    cursor.execute(
+                        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+                        f"{fields}, content='{table}', content_rowid='id', prefix='2 3')"
+                    )
+                except DatabaseError:
+                    # SQLite built without FTS5
+                    return
+                for statement in sqlite_triggers(table, spec['owner'], spec['columns']):
+                    cursor.execute(statement)
+                if created:
+                    # Index rows that existed before the triggers did
+                    cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            elif connection.vendor == 'postgresql':
+                cursor.execute(
+                    f"CREATE INDEX IF NOT EXISTS {fts}_idx ON {table} USING gin ({postgres_document(spec['columns'])})"
+                )
+    _installed.pop(using, None)
+
+
+def search_enabled(connection):
+    if connection.alias not in _installed:
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                tables = connection.introspection.table_names(cursor)
+            _installed[connection.alias] = all(f'{table}_fts' in tables for table in SEARCH_TABLES)
+        else:
+            _installed[connection.alias] = connection.vendor == 'postgresql'
+    return _installed[connection.alias]
+
+
+def search(queryset, text, owner_id):
+    """
+    Filter `queryset` (incomes or savings of `owner_id`) down to rows matching
+    every word of `text`, best matches first.
+    """
+    table = queryset.model._meta.db_table
+    spec = SEARCH_TABLES[table]
+    tokens = tokenize(text)
+    if not tokens:
+        return queryset
+
+    connection = connections[queryset.db]
+    if not search_enabled(connection):
+        # No full-text index on this backend, match every word anywhere in the text
+        for token in tokens:
+            match = Q()
+            for col in spec['columns']:
+                match |= Q(**{f'{col}__icontains': token})
+            queryset = queryset.filter(match)
+        return queryset
+
+    if connection.vendor == 'sqlite':
+        fts = f'{table}_fts'
+        # Scoping to the owner inside the MATCH lets FTS5 intersect posting
+        # lists instead of ranking everybody's matches. Words match as prefixes.
+        terms = ' '.join(f'"{token}"*' for token in tokens)
+        match = f'{spec["owner"]}:"{owner_id}" AND {{{" ".join(spec["columns"])}}}: ({terms})'
+        return queryset.extra(
+            tables=[fts],
+            where=[f'{fts}.rowid = {table}.id', f'{fts} MATCH %s'],
+            params=[match],
+            select={'rank': f'bm25({fts})'},
+            order_by=['rank'],
+        )
+
+    document = postgres_document([f'{table}.{col}' for col in spec['columns']])
+    query = "to_tsquery('simple', %s)"
+    terms = ' & '.join(f'{token}:*' for token in tokens)
+    return queryset.extra(
+        where=[f'{document} @@ {query}'],
+        params=[terms],
+        select={'rank': f'ts_rank({document}, {query})'},
+        select_params=[terms],
+        order_by=['-rank'],
+    )
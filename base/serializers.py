@@ -3,6 +3,7 @@ from .models import CustomUser as Userr
 from .models import *
 from rest_framework_simplejwt.tokens import RefreshToken
 import json
+from decimal import Decimal
 from dataclasses import field
 from rest_framework import serializers
 from string import ascii_lowercase, ascii_uppercase
@@ -121,12 +122,13 @@ class PasswordResetRequestSerializer(serializers.Serializer):
                 'email_subject': "Reset your Password",
                 'to_email': user.email
             }
-            send_normal_email(data)
+            queue_email(data)
 
         return super().validate(attrs)
     
 
 from django.contrib.auth.password_validation import validate_password
+from django.db import transaction
 from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.exceptions import ValidationError
 
@@ -161,19 +163,20 @@ class SetNewPasswordSerializer(serializers.Serializer):
             except ValidationError as e:
                 raise ValidationError(detail=str(e))
 
-            user.set_password(password)
-            user.save()
-
-            # Send email notifying the user of the password change
-            email_body = f"Hi {user.first_name}, your password For GALLERY has been successfully changed If This Was Not You Change It Back Immediately."
-            email_subject = "Password Change Notification"
-            to_email = user.email
-            data = {
-                'email_body': email_body,
-                'email_subject': email_subject,
-                'to_email': to_email
-            }
-            send_normal_email(data)
+            # Queue the notification in the same transaction as the password change
+            with transaction.atomic():
+                user.set_password(password)
+                user.save()
+
+                email_body = f"Hi {user.first_name}, your password For GALLERY has been successfully changed If This Was Not You Change It Back Immediately."
+                email_subject = "Password Change Notification"
+                to_email = user.email
+                data = {
+                    'email_body': email_body,
+                    'email_subject': email_subject,
+                    'to_email': to_email
+                }
+                queue_email(data)
 
             return user
         except Exception as e:
@@ -201,6 +204,17 @@ class CategorySerializer(serializers.ModelSerializer):
 
 
 
+class DashboardBudgetSerializer(BudgetSerializer):
+    categories = CategorySerializer(source='category_set', many=True, read_only=True)
+
+
+
+class DashboardIncomeSerializer(IncomeSerializer):
+    # null when the income has no budget yet
+    budget = DashboardBudgetSerializer(read_only=True)
+
+
+
 class SavingsSerializer(serializers.ModelSerializer):
     class Meta:
         model = Savings
@@ -208,6 +222,26 @@ class SavingsSerializer(serializers.ModelSerializer):
 
 
 
+class CategoryAllocationSerializer(serializers.Serializer):
+    name = serializers.CharField(max_length=255)
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, min_value=Decimal('0'))
+    delete = serializers.BooleanField(default=False)
+
+    def to_internal_value(self, data):
+        # Models still write amounts like "$1,200" inside JSON strings
+        if isinstance(data, dict) and isinstance(data.get('amount'), str):
+            data = dict(data, amount=data['amount'].replace('$', '').replace(',', '').strip())
+        return super().to_internal_value(data)
+
+
+
+class CategoryJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CategoryJob
+        fields = ['id', 'budget', 'description', 'status', 'result', 'error', 'attempts', 'created_at', 'started_at', 'finished_at']
+
+
+
 
 
 
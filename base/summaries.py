@@ -0,0 +1,295 @@
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Coalesce, TruncMonth
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from .models import Budget, BudgetSummary, Category, Income, MonthlyIncomeSummary, Savings, UserSummary
+
+
+ZERO = Decimal('0.00')
+
+# Fields whose values feed a summary, remembered when a row is loaded so a
+# save can subtract what it used to contribute without reading it again
+TRACKED_FIELDS = {
+    Income: ('user_id', 'amount', 'date_received'),
+    Savings: ('user_id', 'amount_saved', 'target_amount'),
+    Category: ('budget_id', 'amount'),
+}
+
+
+def month_of(day):
+    if isinstance(day, str):
+        day = parse_date(day)
+    return day.replace(day=1)
+
+
+def to_decimal(value):
+    return Decimal(str(value)) if value is not None else ZERO
+
+
+def cents(values):
+    # SQLite sums decimals as floats, so round aggregates back to the stored precision
+    return {name: value.quantize(Decimal('0.01')) if isinstance(value, Decimal) else value for name, value in values.items()}
+
+
+def next_month(month):
+    return date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+
+def contributions(model, state):
+    """
+    What one row adds to the summaries, as {(summary model, key): {field: amount}}.
+    """
+    if model is Income:
+        user_id, amount, received = state
+        if user_id is None:
+            return {}
+        amount = to_decimal(amount)
+        return {
+            (UserSummary, (('user_id', user_id),)): {'total_income': amount, 'income_count': 1},
+            (MonthlyIncomeSummary, (('user_id', user_id), ('month', month_of(received)))): {'total_income': amount, 'income_count': 1},
+        }
+    if model is Savings:
+        user_id, saved, target = state
+        if user_id is None:
+            return {}
+        return {
+            (UserSummary, (('user_id', user_id),)): {'total_saved': to_decimal(saved), 'total_target': to_decimal(target), 'savings_count': 1},
+        }
+    budget_id, amount = state
+    return {
+        (BudgetSummary, (('budget_id', budget_id),)): {'allocated': to_decimal(amount), 'category_count': 1},
+    }
+
+
+def apply_deltas(deltas, rebuild_missing=True):
+    rebuilt_users = set()
+    # User totals first: rebuilding them also rebuilds that user's months
+    for (summary_model, key), fields in sorted(deltas.items(), key=lambda item: item[0][0] is not UserSummary):
+        lookup = dict(key)
+        if summary_model is MonthlyIncomeSummary and lookup['user_id'] in rebuilt_users:
+            continue
+        fields = {name: value for name, value in fields.items() if value}
+        if not fields:
+            continue
+        updated = summary_model.objects.filter(**lookup).update(
+            updated_at=timezone.now(),
+            **{name: F(name) + value for name, value in fields.items()}
+        )
+        if not updated and rebuild_missing:
+            # First write since the summary was last built: compute it from the
+            # source rows, which already include this write
+            REBUILDERS[summary_model](**lookup)
+            if summary_model is UserSummary:
+                rebuilt_users.add(lookup['user_id'])
+
+
+def merge(target, deltas, sign):
+    for key, fields in deltas.items():
+        merged = target.setdefault(key, {})
+        for name, value in fields.items():
+            merged[name] = merged.get(name, 0) + sign * value
+
+
+def remember(sender, instance, **kwargs):
+    # Read from __dict__ so deferred fields aren't fetched one by one
+    values = instance.__dict__
+    fields = TRACKED_FIELDS[sender]
+    instance._summary_state = tuple(values[f] for f in fields) if all(f in values for f in fields) else None
+
+
+def row_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    new_state = tuple(getattr(instance, f) for f in TRACKED_FIELDS[sender])
+    old_state = None if created else instance._summary_state
+    if old_state == new_state:
+        return
+
+    deltas = {}
+    if old_state is not None:
+        merge(deltas, contributions(sender, old_state), -1)
+    elif not created:
+        # Loaded without the tracked fields, so rebuild what it touches
+        for summary_model, key in contributions(sender, new_state):
+            REBUILDERS[summary_model](**dict(key))
+        instance._summary_state = new_state
+        return
+    merge(deltas, contributions(sender, new_state), 1)
+    apply_deltas(deltas)
+    instance._summary_state = new_state
+
+
+def row_deleted(sender, instance, **kwargs):
+    deltas = {}
+    merge(deltas, contributions(sender, tuple(getattr(instance, f) for f in TRACKED_FIELDS[sender])), -1)
+    # A missing summary is rebuilt on its next read or write; creating one here
+    # could race a cascade that is deleting its budget
+    apply_deltas(deltas, rebuild_missing=False)
+
+
+def budget_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        BudgetSummary.objects.create(budget=instance)
+
+
+def upsert(model, lookup, values):
+    values['updated_at'] = timezone.now()
+    try:
+        with transaction.atomic():
+            obj, _ = model.objects.update_or_create(defaults=values, **lookup)
+    except IntegrityError:
+        # Another writer created it first
+        obj, _ = model.objects.update_or_create(defaults=values, **lookup)
+    return obj
+
+
+def compute_income(user_id):
+    return cents(Income.objects.filter(user_id=user_id).aggregate(
+        total_income=Coalesce(Sum('amount'), ZERO),
+        income_count=Count('id'),
+    ))
+
+
+def compute_savings(user_id):
+    return cents(Savings.objects.filter(user_id=user_id).aggregate(
+        total_saved=Coalesce(Sum('amount_saved'), ZERO),
+        total_target=Coalesce(Sum('target_amount'), ZERO),
+        savings_count=Count('id'),
+    ))
+
+
+def compute_months(user_id):
+    rows = (
+        Income.objects.filter(user_id=user_id)
+        .annotate(month=TruncMonth('date_received'))
+        .values('month')
+        .annotate(total_income=Sum('amount'), income_count=Count('id'))
+    )
+    return {row['month']: cents({'total_income': row['total_income'], 'income_count': row['income_count']}) for row in rows}
+
+
+def compute_budget(budget_id):
+    return cents(Category.objects.filter(budget_id=budget_id).aggregate(
+        allocated=Coalesce(Sum('amount'), ZERO),
+        category_count=Count('id'),
+    ))
+
+
+def rebuild_user_summary(user_id):
+    # The only full pass over a user's history; also rebuilds every month
+    with transaction.atomic():
+        months = compute_months(user_id)
+        MonthlyIncomeSummary.objects.filter(user_id=user_id).exclude(month__in=list(months)).delete()
+        for month, values in months.items():
+            upsert(MonthlyIncomeSummary, {'user_id': user_id, 'month': month}, values)
+        return upsert(UserSummary, {'user_id': user_id}, {**compute_income(user_id), **compute_savings(user_id)})
+
+
+def rebuild_month(user_id, month):
+    values = Income.objects.filter(
+        user_id=user_id, date_received__gte=month, date_received__lt=next_month(month)
+    ).aggregate(total_income=Coalesce(Sum('amount'), ZERO), income_count=Count('id'))
+    upsert(MonthlyIncomeSummary, {'user_id': user_id, 'month': month}, values)
+
+
+def rebuild_budget_summary(budget_id):
+    return upsert(BudgetSummary, {'budget_id': budget_id}, compute_budget(budget_id))
+
+
+# bulk_create and bulk_update don't send the signals above, so code that
+# writes that way catches the summaries up with one of these afterwards
+
+def bulk_written(user_id=None, budget_ids=(), savings_only=False):
+    # Rebuild what bulk writes touched: each budget in budget_ids, and the
+    # user's totals (just their savings ones with savings_only)
+    for budget_id in budget_ids:
+        rebuild_budget_summary(budget_id)
+    if user_id is not None:
+        if savings_only:
+            refresh_savings(user_id)
+        else:
+            rebuild_user_summary(user_id)
+
+
+def refresh_savings(user_id):
+    # Only reads the user's goals, not their income history
+    if not UserSummary.objects.filter(user_id=user_id).update(updated_at=timezone.now(), **compute_savings(user_id)):
+        rebuild_user_summary(user_id)
+
+
+def store_budget_summary(budget_id, values):
+    # For a caller that has just aggregated the budget itself (compute_budget)
+    if not BudgetSummary.objects.filter(budget_id=budget_id).update(updated_at=timezone.now(), **values):
+        upsert(BudgetSummary, {'budget_id': budget_id}, dict(values))
+
+
+def incomes_added(user_id, months):
+    # Adds bulk-inserted incomes without rereading history; `months` is {month: (total, count)}
+    deltas = {}
+    for month, (total, count) in months.items():
+        merge(deltas, {
+            (UserSummary, (('user_id', user_id),)): {'total_income': total, 'income_count': count},
+            (MonthlyIncomeSummary, (('user_id', user_id), ('month', month))): {'total_income': total, 'income_count': count},
+        }, 1)
+    apply_deltas(deltas)
+
+
+REBUILDERS = {
+    UserSummary: rebuild_user_summary,
+    MonthlyIncomeSummary: rebuild_month,
+    BudgetSummary: rebuild_budget_summary,
+}
+
+
+def get_user_summary(user):
+    try:
+        return UserSummary.objects.get(user=user)
+    except UserSummary.DoesNotExist:
+        return rebuild_user_summary(user.id)
+
+
+def get_budget_summary(budget):
+    try:
+        return budget.summary
+    except BudgetSummary.DoesNotExist:
+        return rebuild_budget_summary(budget.id)
+
+
+def verify_user_summary(user_id):
+    # Differences between the stored summaries and a fresh computation, as (what, stored, actual)
+    problems = []
+    actual = {**compute_income(user_id), **compute_savings(user_id)}
+    stored = UserSummary.objects.filter(user_id=user_id).values(*actual).first()
+    if stored != actual and (stored is not None or actual['income_count'] or actual['savings_count']):
+        problems.append(('user', stored, actual))
+
+    months = compute_months(user_id)
+    stored_months = {
+        row['month']: {'total_income': row['total_income'], 'income_count': row['income_count']}
+        for row in MonthlyIncomeSummary.objects.filter(user_id=user_id).values('month', 'total_income', 'income_count')
+        if row['income_count'] or row['total_income']
+    }
+    for month in sorted(set(months) | set(stored_months)):
+        if months.get(month) != stored_months.get(month):
+            problems.append((f'month {month:%Y-%m}', stored_months.get(month), months.get(month)))
+    return problems
+
+
+def verify_budget_summary(budget_id):
+    actual = compute_budget(budget_id)
+    stored = BudgetSummary.objects.filter(budget_id=budget_id).values(*actual).first()
+    return [] if stored == actual else [('budget', stored, actual)]
+
+
+def connect():
+    for model in TRACKED_FIELDS:
+        post_init.connect(remember, sender=model)
+        post_save.connect(row_saved, sender=model)
+        post_delete.connect(row_deleted, sender=model)
+    post_save.connect(budget_saved, sender=Budget)
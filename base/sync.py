@@ -0,0 +1,155 @@
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import post_delete
+from django.utils import timezone
+
+from .models import Budget, CustomUser, Income, Savings, Tombstone
+from .serializers import BudgetSerializer, IncomeSerializer, SavingsSerializer
+
+
+# What a sync returns, by the name it's returned under
+SYNC_KINDS = {
+    'income': (Income, IncomeSerializer),
+    'budgets': (Budget, BudgetSerializer),
+    'savings': (Savings, SavingsSerializer),
+}
+KIND_OF_MODEL = {model: kind for kind, (model, _) in SYNC_KINDS.items()}
+DELETED = 'deleted'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class ExpiredCursor(Exception):
+    pass
+
+
+def owner_id(sender, instance):
+    if sender is not Budget:
+        return instance.user_id
+    if Budget._meta.get_field('income').is_cached(instance):
+        return instance.income.user_id
+    # A budget deleted by its income's cascade goes first, so the income is still there
+    return Income.objects.filter(pk=instance.income_id).values_list('user_id', flat=True).first()
+
+
+def row_deleted(sender, instance, **kwargs):
+    user_id = owner_id(sender, instance)
+    if user_id is not None:
+        Tombstone.objects.create(user_id=user_id, kind=KIND_OF_MODEL[sender], object_id=instance.pk)
+
+
+def user_deleted(sender, instance, **kwargs):
+    # Nobody will sync their deletions now. The cascade may still be deleting
+    # their rows (and writing tombstones) after this, so clear up at commit.
+    user_id = instance.pk
+    transaction.on_commit(lambda: Tombstone.objects.filter(user_id=user_id).delete())
+
+
+def connect():
+    for model in KIND_OF_MODEL:
+        post_delete.connect(row_deleted, sender=model)
+    post_delete.connect(user_deleted, sender=CustomUser)
+
+
+def encode_cursor(positions):
+    raw = json.dumps({kind: [moment.isoformat(), pk] for kind, (moment, pk) in positions.items()}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(encoded):
+    try:
+        padded = encoded + '=' * (-len(encoded) % 4)
+        raw = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+        positions = {kind: (datetime.fromisoformat(moment), int(pk)) for kind, (moment, pk) in raw.items()}
+    except (TypeError, ValueError, AttributeError, UnicodeDecodeError):
+        raise InvalidCursor()
+    if set(positions) != set(SYNC_KINDS) | {DELETED} or any(timezone.is_naive(moment) for moment, _ in positions.values()):
+        raise InvalidCursor()
+    return positions
+
+
+def after(queryset, field, position):
+    # Everything past (field, id) = position; the >= bound lets the database seek on the index
+    if position is None:
+        return queryset.order_by(field, 'id')
+    moment, pk = position
+    return queryset.filter(**{f'{field}__gte': moment}).filter(
+        Q(**{f'{field}__gt': moment}) | Q(id__gt=pk)
+    ).order_by(field, 'id')
+
+
+def next_position(old, rows, field, full, settled):
+    """
+    Where the next sync of one kind starts.
+
+    A full page continues right after its last row. Otherwise everything up
+    to now has been sent, but the position only moves up to `settled`, a few
+    seconds back: a write whose transaction was still open during this sync
+    has an earlier timestamp than its commit, and would be skipped by a
+    position set to now. Rows in that window are sent again next time;
+    clients apply changes idempotently by id.
+    """
+    if full:
+        last = rows[-1]
+        return getattr(last, field), last.id
+    if old is None or old < (settled, 0):
+        return settled, 0
+    return old
+
+
+def changes_since(user, cursor=None, limit=None):
+    """
+    Incomes, budgets and savings of `user` created or changed since `cursor`,
+    and the ids of those deleted since then, at most `limit` of each.
+    Without a cursor every row is returned (deletions before now are moot).
+    """
+    limit = limit or settings.SYNC_PAGE_SIZE
+    now = timezone.now()
+    settled = now - timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+
+    if cursor:
+        positions = decode_cursor(cursor)
+        if positions[DELETED][0] < now - timedelta(days=settings.SYNC_TOMBSTONE_DAYS):
+            # Tombstones this old are pruned, deletions since may be missing
+            raise ExpiredCursor()
+    else:
+        positions = dict.fromkeys(SYNC_KINDS)
+        positions[DELETED] = (settled, 0)
+
+    data = {}
+    has_more = False
+    next_positions = {}
+    for kind, (model, serializer_class) in SYNC_KINDS.items():
+        rows = list(after(model.objects.owned_by(user), 'updated_at', positions[kind])[:limit + 1])
+        full = len(rows) > limit
+        rows = rows[:limit]
+        has_more = has_more or full
+        data[kind] = serializer_class(rows, many=True).data
+        next_positions[kind] = next_position(positions[kind], rows, 'updated_at', full, settled)
+
+    tombstones = list(after(Tombstone.objects.owned_by(user), 'deleted_at', positions[DELETED])[:limit + 1])
+    full = len(tombstones) > limit
+    tombstones = tombstones[:limit]
+    has_more = has_more or full
+    deleted = {kind: [] for kind in SYNC_KINDS}
+    for tombstone in tombstones:
+        deleted[tombstone.kind].append(tombstone.object_id)
+    next_positions[DELETED] = next_position(positions[DELETED], tombstones, 'deleted_at', full, settled)
+
+    data[DELETED] = deleted
+    data['cursor'] = encode_cursor(next_positions)
+    data['has_more'] = has_more
+    return data
+
+
+def prune_tombstones(days=None):
+    cutoff = timezone.now() - timedelta(days=days if days is not None else settings.SYNC_TOMBSTONE_DAYS)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
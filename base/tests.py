@@ -1,3 +1,1538 @@
-from django.test import TestCase
+import base64
+import json
+import math
+import os
+import re
+import subprocess
+import sys
+import time
+import types
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends.locmem import EmailBackend as LocMemEmailBackend
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.test import APIClient
+
+from base.allocation import rebalance_categories
+from base.description_cache import DescriptionCache, description_cache
+from base.llm import CircuitBreaker, FakeProvider, GeminiProvider, LLMError, Route, RoutedProvider, set_provider
+from base.models import Budget, Category, CategoryJob, CustomUser, EmailOutbox, Income, MonthlyIncomeSummary, Savings, Tombstone, UserSummary
+from base.summaries import verify_budget_summary, verify_user_summary
+from base.sync import encode_cursor
+from base.management.commands.send_outbox import Command as SendOutboxCommand
+from base.urls.api import DESCRIPTION_PROMPT_VERSION, CategoryCreateView
+from base.llm_metrics import instrumented_generate, llm_metrics, record_usage, track_request
+from base.utils import queue_email, send_bulk_email
 
 # Create your tests here.
+
+
+class QueryPlanTests(TestCase):
+    """
+    Runs EXPLAIN on every query an endpoint issues and fails when one of them
+    reads a whole table instead of going through an index.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+
+        # Some rows for another user so the planner has something to skip
+        for owner in (other, self.user):
+            for i in range(3):
+                income = Income.objects.create(user=owner, amount=Decimal('5000.00'), source=f'Job {i}', date_received=date(2024, 1, i + 1))
+                budget = Budget.objects.create(name=f'Budget {i}', income=income, total_expenses=income.amount,
+                                               start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+                Category.objects.create(budget=budget, name='Food', amount=Decimal('3000.00'))
+                Category.objects.create(budget=budget, name='Holiday Savings', amount=Decimal('2000.00'))
+            Savings.objects.create(user=owner, goal_name='Holiday Savings', amount_saved=Decimal('2000.00'))
+
+        self.income = Income.objects.filter(user=self.user).first()
+        self.budget = Budget.objects.get(income=self.income)
+        self.category = Category.objects.filter(budget=self.budget).first()
+        self.savings = Savings.objects.get(user=self.user)
+        self.spare_income = Income.objects.create(user=self.user, amount=Decimal('5000.00'), source='Bonus', date_received=date(2024, 2, 1))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        set_provider(FakeProvider())
+
+    def tearDown(self):
+        set_provider(None)
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                details = [row[-1] for row in cursor.fetchall()]
+                # "SCAN x USING INDEX" walks an index in order (e.g. for a LIMIT), a bare "SCAN x" reads every row
+                return [detail for detail in details if re.match(r'SCAN (base_|auth_)\w+$', detail)]
+            if connection.vendor == 'postgresql':
+                # Tiny test tables would always be read sequentially otherwise
+                cursor.execute('SET LOCAL enable_seqscan = off')
+                cursor.execute('EXPLAIN ' + sql)
+                return [row[0] for row in cursor.fetchall() if 'Seq Scan' in row[0]]
+        self.skipTest(f'No query plan check for {connection.vendor}')
+
+    def assertNoTableScans(self, method, url, data=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data, format='json')
+            if response.streaming:
+                # Streamed responses query while they're read
+                b''.join(response.streaming_content)
+        self.assertLess(response.status_code, 500, getattr(response, 'content', b''))
+
+        for query in ctx.captured_queries:
+            sql = query['sql']
+            if not re.match(r'\s*(SELECT|UPDATE|DELETE)\b', sql, re.IGNORECASE):
+                continue
+            scans = self.explain(sql)
+            self.assertEqual(scans, [], f'{method.upper()} {url} scans a whole table:\n{sql}')
+
+    def test_income_endpoints(self):
+        self.assertNoTableScans('get', '/api/v1/income/list/')
+        self.assertNoTableScans('get', '/api/v1/income/list/?name=Job')
+        self.assertNoTableScans('get', '/api/v1/income/list/?search=job')
+        self.assertNoTableScans('get', '/api/v1/income/list/?paginate=cursor&page_size=1&count=true')
+        self.assertNoTableScans('get', f'/api/v1/income/{self.income.id}/')
+        self.assertNoTableScans('put', f'/api/v1/income/update/{self.income.id}/', {'amount': '6000.00'})
+        self.assertNoTableScans('post', '/api/v1/income/', {'amount': '2000.00', 'source': 'Freelance'})
+
+    def test_budget_endpoints(self):
+        self.assertNoTableScans('post', '/api/v1/budget/create/', {'name': 'Feb', 'income': self.spare_income.id, 'end_date': '2024-02-28'})
+        self.assertNoTableScans('get', f'/api/v1/budget/{self.budget.id}/')
+        self.assertNoTableScans('put', f'/api/v1/budget/{self.budget.id}/update/', {'name': 'January'})
+
+    def test_category_endpoints(self):
+        self.assertNoTableScans('put', f'/api/v1/category/{self.category.id}/update/', {'description': 'Groceries'})
+        self.assertNoTableScans('post', '/api/v1/categories/create/', {'budget': self.budget.id, 'description': 'Move 50 to Food'})
+
+    def test_savings_endpoints(self):
+        self.assertNoTableScans('get', '/api/v1/savings/')
+        self.assertNoTableScans('get', '/api/v1/savings/?goal_name=Holiday')
+        self.assertNoTableScans('get', '/api/v1/savings/?search=holiday')
+        self.assertNoTableScans('get', '/api/v1/savings/?paginate=cursor')
+        self.assertNoTableScans('get', f'/api/v1/savings/{self.savings.id}/')
+        self.assertNoTableScans('put', f'/api/v1/savings/{self.savings.id}/update/', {'target_amount': '9000.00'})
+        self.assertNoTableScans('delete', f'/api/v1/savings/{self.savings.id}/delete/')
+
+    def test_delete_endpoints(self):
+        self.assertNoTableScans('delete', f'/api/v1/budget/{self.budget.id}/delete/')
+        self.assertNoTableScans('delete', f'/api/v1/income/delete/{self.spare_income.id}/')
+
+    def test_sync_endpoint(self):
+        self.assertNoTableScans('get', '/api/v1/sync/')
+        cursor = self.client.get('/api/v1/sync/').data['cursor']
+        self.assertNoTableScans('get', f'/api/v1/sync/?cursor={cursor}')
+
+    def test_summary_endpoints(self):
+        self.assertNoTableScans('get', '/api/v1/dashboard/')
+        self.assertNoTableScans('get', '/api/v1/summary/')
+        self.assertNoTableScans('get', f'/api/v1/budget/{self.budget.id}/summary/')
+        self.assertNoTableScans('get', '/api/v1/analytics/?start=2024-01&end=2024-03')
+
+    def test_export_endpoint(self):
+        self.assertNoTableScans('get', '/api/v1/export/')
+        self.assertNoTableScans('get', '/api/v1/export/?output=csv&type=income')
+
+    def test_bulk_endpoints(self):
+        food, holiday = Category.objects.filter(budget=self.budget).order_by('id')
+        self.assertNoTableScans('patch', f'/api/v1/budget/{self.budget.id}/categories/', [
+            {'id': food.id, 'amount': '2500.00'},
+            {'id': holiday.id, 'name': 'Trip Savings', 'amount': '2500.00'},
+        ])
+        self.assertNoTableScans('post', '/api/v1/income/import/', [{'amount': '1500.00', 'source': 'Tips', 'date_received': '2024-03-01'}])
+        self.assertNoTableScans('post', '/api/v1/batch/', {'requests': [
+            {'method': 'GET', 'path': 'summary/'},
+            {'method': 'GET', 'path': f'budget/{self.budget.id}/'},
+        ]})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        self.other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def income(self, user, source, description=None):
+        return Income.objects.create(user=user, amount=Decimal('5000.00'), source=source,
+                                     description=description, date_received=date(2024, 1, 1))
+
+    def search(self, text):
+        response = self.client.get('/api/v1/income/list/', {'search': text})
+        self.assertEqual(response.status_code, 200)
+        return [income['source'] for income in response.data]
+
+    def test_ranks_matches_and_scopes_to_owner(self):
+        self.income(self.user, 'Salary', 'Monthly pay from Acme')
+        self.income(self.user, 'Acme bonus', 'Acme year end bonus')
+        self.income(self.user, 'Freelance', 'Logo design')
+        self.income(self.other, 'Acme salary', 'Acme')
+
+        self.assertEqual(self.search('acme'), ['Acme bonus', 'Salary'])
+        self.assertEqual(self.search('acme pay'), ['Salary'])
+        # Words match as prefixes, like the icontains filter did
+        self.assertEqual(self.search('free'), ['Freelance'])
+
+    def test_index_follows_writes(self):
+        income = self.income(self.user, 'Salary')
+        income.source = 'Consulting'
+        income.save()
+        self.assertEqual(self.search('salary'), [])
+        self.assertEqual(self.search('consulting'), ['Consulting'])
+
+        income.delete()
+        self.assertEqual(self.search('consulting'), [])
+
+    def test_savings_search(self):
+        Savings.objects.create(user=self.user, goal_name='Holiday Savings', amount_saved=Decimal('0.00'))
+        Savings.objects.create(user=self.user, goal_name='Car Savings', amount_saved=Decimal('0.00'))
+        response = self.client.get('/api/v1/savings/', {'search': 'holi'})
+        self.assertEqual([savings['goal_name'] for savings in response.data], ['Holiday Savings'])
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Several incomes share a date so the id tiebreaker matters
+        for i in range(7):
+            Income.objects.create(user=self.user, amount=Decimal('5000.00'), source=f'Job {i}', date_received=date(2024, 1, 1 + i // 3))
+
+    def walk(self, url):
+        sources = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            sources += [income['source'] for income in response.data['results']]
+            url = response.data['next']
+        return sources
+
+    def test_pages_cover_every_row_newest_first(self):
+        expected = list(Income.objects.order_by('-date_received', '-id').values_list('source', flat=True))
+        self.assertEqual(self.walk('/api/v1/income/list/?paginate=cursor&page_size=2'), expected)
+
+    def test_inserts_do_not_shift_later_pages(self):
+        first = self.client.get('/api/v1/income/list/?paginate=cursor&page_size=3').data
+        Income.objects.create(user=self.user, amount=Decimal('5000.00'), source='New', date_received=date(2024, 2, 1))
+        rest = self.walk(first['next'])
+
+        seen = [income['source'] for income in first['results']] + rest
+        self.assertNotIn('New', seen)
+        self.assertEqual(len(seen), len(set(seen)), seen)
+        self.assertEqual(len(seen), 7)
+
+    def test_count_is_optional(self):
+        response = self.client.get('/api/v1/income/list/?paginate=cursor')
+        self.assertNotIn('count', response.data)
+        response = self.client.get('/api/v1/income/list/?paginate=cursor&count=true')
+        self.assertEqual(response.data['count'], 7)
+
+    def test_deep_pages_seek_instead_of_offset(self):
+        url = self.client.get('/api/v1/income/list/?paginate=cursor&page_size=3').data['next']
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get('/api/v1/income/list/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_tampered_cursor(self):
+        for value in [['notadate', 1], [None, 1], [{'a': 1}, 1], ['2024-01-01', 'x']]:
+            cursor = base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+            response = self.client.get('/api/v1/income/list/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, value)
+        response = self.client.get('/api/v1/savings/', {'cursor': base64.urlsafe_b64encode(b'["notadate", 1]').decode()})
+        self.assertEqual(response.status_code, 404)
+
+
+class OwnershipQueryCountTests(TestCase):
+    """
+    Detail, update and delete views fetch the object and check ownership in
+    one query. Only a miss pays for a second query to pick 404 or 403.
+    """
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+
+        self.income = Income.objects.create(user=self.user, amount=Decimal('5000.00'), source='Job', date_received=date(2024, 1, 1))
+        self.spare_income = Income.objects.create(user=self.user, amount=Decimal('5000.00'), source='Bonus', date_received=date(2024, 2, 1))
+        self.budget = Budget.objects.create(name='January', income=self.income, total_expenses=self.income.amount,
+                                            start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+        self.category = Category.objects.create(budget=self.budget, name='Holiday Savings', amount=Decimal('2000.00'))
+        self.savings = Savings.objects.create(user=self.user, goal_name='Holiday Savings', amount_saved=Decimal('2000.00'))
+        self.job = CategoryJob.objects.create(user=self.user, budget=self.budget, description='Save more')
+
+        other_income = Income.objects.create(user=other, amount=Decimal('5000.00'), source='Job', date_received=date(2024, 1, 1))
+        self.other_budget = Budget.objects.create(name='Theirs', income=other_income, total_expenses=other_income.amount,
+                                                  start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertQueries(self, count, method, url, data=None, status=None):
+        with self.assertNumQueries(count):
+            response = getattr(self.client, method)(url, data, format='json')
+        if status is not None:
+            self.assertEqual(response.status_code, status, response.content)
+        return response
+
+    def test_budget_views(self):
+        self.assertQueries(1, 'get', f'/api/v1/budget/{self.budget.id}/', status=200)
+        self.assertQueries(2, 'put', f'/api/v1/budget/{self.budget.id}/update/', {'name': 'Jan'}, status=200)
+        # Owner lookup, existing budget check, the serializer's income and
+        # one-to-one uniqueness validation, then a savepoint around the insert
+        # and its empty budget summary
+        self.assertQueries(8, 'post', '/api/v1/budget/create/',
+                           {'name': 'February', 'income': self.spare_income.id, 'end_date': '2024-02-28'}, status=201)
+
+    def test_budget_delete(self):
+        # Owner lookup, then the cascade over categories, jobs and the budget
+        # summary; categories are loaded so their delete signals can run. Last,
+        # the budget's tombstone for sync.
+        self.assertQueries(8, 'delete', f'/api/v1/budget/{self.budget.id}/delete/', status=204)
+
+    def test_misses_tell_missing_from_forbidden(self):
+        self.assertQueries(2, 'get', f'/api/v1/budget/{self.other_budget.id}/', status=403)
+        self.assertQueries(2, 'get', '/api/v1/budget/999999/', status=404)
+
+    def test_category_views(self):
+        self.assertQueries(2, 'put', f'/api/v1/category/{self.category.id}/update/', {'description': 'Trips'}, status=200)
+        self.assertQueries(2, 'post', '/api/v1/categories/create/?async=1',
+                           {'budget': self.budget.id, 'description': 'Save more'}, status=202)
+        self.assertQueries(1, 'get', f'/api/v1/categories/jobs/{self.job.id}/', status=200)
+
+    def test_income_views(self):
+        # Income joined with its budget, then the categories
+        self.assertQueries(2, 'get', f'/api/v1/income/{self.income.id}/', status=200)
+        # Lookup, then a savepoint around the update and the user and month totals
+        self.assertQueries(6, 'put', f'/api/v1/income/update/{self.income.id}/', {'amount': '6000.00'}, status=200)
+
+    def test_savings_views(self):
+        self.assertQueries(1, 'get', f'/api/v1/savings/{self.savings.id}/', status=200)
+        # Savings lookup, matching category lookup, then a savepoint around
+        # both updates and the user's savings totals
+        self.assertQueries(7, 'put', f'/api/v1/savings/{self.savings.id}/update/', {'target_amount': '9000.00'}, status=200)
+
+
+class DashboardTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+        Income.objects.create(user=other, amount=Decimal('5000.00'), source='Theirs', date_received=date(2024, 1, 1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_income(self, day, categories=2, with_budget=True):
+        income = Income.objects.create(user=self.user, amount=Decimal('5000.00'), source=f'Job {day}', date_received=date(2024, 1, day))
+        if with_budget:
+            budget = Budget.objects.create(name=f'Budget {day}', income=income, total_expenses=income.amount,
+                                           start_date=date(2024, 1, 1), end_date=date(2024, 1, 31))
+            for i in range(categories):
+                Category.objects.create(budget=budget, name=f'Category {i}', amount=Decimal('100.00'))
+        return income
+
+    def test_nests_budgets_and_categories(self):
+        self.add_income(1, categories=3)
+        self.add_income(2, with_budget=False)
+
+        response = self.client.get('/api/v1/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        results = response.data['results']
+        self.assertEqual([income['source'] for income in results], ['Job 2', 'Job 1'])
+        self.assertIsNone(results[0]['budget'])
+        self.assertEqual(results[1]['budget']['name'], 'Budget 1')
+        self.assertEqual(len(results[1]['budget']['categories']), 3)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        for day in range(1, 4):
+            self.add_income(day)
+        with self.assertNumQueries(2):
+            self.client.get('/api/v1/dashboard/')
+
+        for day in range(4, 16):
+            self.add_income(day, categories=5)
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/dashboard/?page_size=50')
+        self.assertEqual(len(response.data['results']), 15)
+
+    def test_paginates(self):
+        for day in range(1, 6):
+            self.add_income(day)
+        response = self.client.get('/api/v1/dashboard/?page_size=2')
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual([income['source'] for income in response.data['results']], ['Job 3', 'Job 2'])
+
+
+class SummaryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        set_provider(FakeProvider())
+
+    def tearDown(self):
+        set_provider(None)
+
+    def summary(self):
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/summary/')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def assertSummariesMatch(self):
+        call_command('rebuild_summaries', '--verify', stdout=StringIO(), stderr=StringIO())
+
+    def test_income_writes_update_totals(self):
+        this_month = date.today().replace(day=1)
+        self.client.post('/api/v1/income/', {'amount': '2000.00', 'source': 'Salary'}, format='json')
+        self.client.post('/api/v1/income/', {'amount': '3000.00', 'source': 'Bonus'}, format='json')
+        old = Income.objects.create(user=self.user, amount=Decimal('1500.00'), source='Old', date_received=date(2020, 5, 17))
+
+        data = self.summary()
+        self.assertEqual(data['total_income'], Decimal('6500.00'))
+        self.assertEqual(data['income_count'], 3)
+        self.assertEqual(data['income_this_month'], Decimal('5000.00'))
+        self.assertEqual([month['month'] for month in data['months']], [this_month, date(2020, 5, 1)])
+
+        # Moving an income to another month moves its amount too
+        self.client.put(f'/api/v1/income/update/{old.id}/', {'amount': '2500.00', 'date_received': str(date.today())}, format='json')
+        data = self.summary()
+        self.assertEqual(data['total_income'], Decimal('7500.00'))
+        self.assertEqual(data['income_this_month'], Decimal('7500.00'))
+        self.assertEqual(len(data['months']), 1)
+
+        self.client.delete(f'/api/v1/income/delete/{old.id}/')
+        self.assertEqual(self.summary()['total_income'], Decimal('5000.00'))
+        self.assertSummariesMatch()
+
+    def test_category_and_savings_writes_update_totals(self):
+        income = Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date.today())
+        budget = Budget.objects.create(name='Month', income=income, total_expenses=income.amount,
+                                       start_date=date.today(), end_date=date.today())
+
+        self.client.post('/api/v1/categories/create/', {'budget': budget.id, 'description': 'Plan my month'}, format='json')
+        response = self.client.get(f'/api/v1/budget/{budget.id}/summary/')
+        self.assertEqual(response.data['allocated'], Decimal('1000.00'))
+        self.assertEqual(response.data['category_count'], Category.objects.filter(budget=budget).count())
+        self.assertEqual(self.summary()['total_saved'], Savings.objects.get(user=self.user).amount_saved)
+
+        savings = Savings.objects.get(user=self.user)
+        self.client.delete(f'/api/v1/savings/{savings.id}/delete/')
+        data = self.summary()
+        self.assertEqual(data['savings_count'], 0)
+        self.assertEqual(data['total_saved'], Decimal('0.00'))
+        self.assertSummariesMatch()
+
+    def test_rebuild_fixes_drift(self):
+        Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date.today())
+        UserSummary.objects.filter(user=self.user).update(total_income=Decimal('1.00'))
+        with self.assertRaises(CommandError):
+            self.assertSummariesMatch()
+
+        call_command('rebuild_summaries', stdout=StringIO())
+        self.assertSummariesMatch()
+        self.assertEqual(self.summary()['total_income'], Decimal('1000.00'))
+
+
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+        Income.objects.create(user=other, amount=Decimal('9999.00'), source='Theirs', date_received=date(2024, 1, 5))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def income(self, amount, day, budget_categories=None):
+        income = Income.objects.create(user=self.user, amount=Decimal(amount), source='Job', date_received=day)
+        if budget_categories:
+            budget = Budget.objects.create(name='Budget', income=income, total_expenses=income.amount,
+                                           start_date=day, end_date=day)
+            for name, allocated in budget_categories:
+                Category.objects.create(budget=budget, name=name, amount=Decimal(allocated))
+        return income
+
+    def test_aggregates_by_month(self):
+        self.income('1000.00', date(2024, 1, 5), [('Rent', '600.00'), ('Food', '300.00')])
+        self.income('500.00', date(2024, 1, 20))
+        self.income('2000.00', date(2024, 3, 1), [('Rent', '1200.00')])
+        self.income('7000.00', date(2023, 12, 31))
+        Savings.objects.create(user=self.user, goal_name='Car Savings', amount_saved=Decimal('250.00'), target_amount=Decimal('1000.00'))
+
+        response = self.client.get('/api/v1/analytics/', {'start': '2024-01', 'end': '2024-03'})
+        self.assertEqual(response.status_code, 200)
+        data = response.data
+        self.assertEqual(data['income'], {
+            'months': ['2024-01', '2024-03'],
+            'totals': [Decimal('1500.00'), Decimal('2000.00')],
+            'counts': [2, 1],
+        })
+        self.assertEqual(data['budgets'], {
+            'months': ['2024-01', '2024-03'],
+            'total_expenses': [Decimal('1000.00'), Decimal('2000.00')],
+            'allocated': [Decimal('900.00'), Decimal('1200.00')],
+        })
+        self.assertEqual(data['categories'], {
+            'names': ['Rent', 'Food'],
+            'allocated': [Decimal('1800.00'), Decimal('300.00')],
+            'budgets': [2, 1],
+        })
+        self.assertEqual(data['savings']['progress'], [Decimal('0.25')])
+
+    def test_query_count_does_not_grow_with_history(self):
+        for day in range(1, 29):
+            self.income('1000.00', date(2024, 2, day), [('Rent', '100.00')] if day == 1 else None)
+        with self.assertNumQueries(6):
+            self.client.get('/api/v1/analytics/', {'start': '2024-01', 'end': '2024-12'})
+
+    def test_rejects_bad_ranges(self):
+        self.assertEqual(self.client.get('/api/v1/analytics/', {'start': '2024-13'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/analytics/', {'start': '2024-05', 'end': '2024-01'}).status_code, 400)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+        Income.objects.create(user=other, amount=Decimal('9999.00'), source='Theirs', date_received=date(2024, 1, 5))
+        income = Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job, main', date_received=date(2024, 1, 5))
+        Income.objects.create(user=self.user, amount=Decimal('50.00'), source='Gift', date_received=date(2024, 2, 1))
+        budget = Budget.objects.create(name='January', income=income, total_expenses=Decimal('1000.00'),
+                                       start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        Category.objects.create(budget=budget, name='Rent', amount=Decimal('600.00'))
+        Savings.objects.create(user=self.user, goal_name='Car Savings', amount_saved=Decimal('250.00'), target_amount=Decimal('1000.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def content(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_ndjson_streams_every_record_type(self):
+        response = self.client.get('/api/v1/export/')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        records = [json.loads(line) for line in self.content(response).splitlines()]
+        self.assertEqual([r['type'] for r in records], ['income', 'income', 'budgets', 'categories', 'savings'])
+        self.assertEqual(records[0]['source'], 'Job, main')
+        self.assertEqual(records[0]['amount'], '1000.00')
+        self.assertEqual(records[0]['date_received'], '2024-01-05')
+        self.assertEqual(records[3]['name'], 'Rent')
+        self.assertNotIn('Theirs', str(records))
+
+    def test_csv_exports_one_type(self):
+        response = self.client.get('/api/v1/export/', {'output': 'csv', 'type': 'income'})
+        self.assertIn('attachment', response['Content-Disposition'])
+        lines = self.content(response).splitlines()
+        self.assertEqual(lines[0], 'id,date_received,source,amount,description,created_at,updated_at')
+        self.assertEqual(len(lines), 3)
+        self.assertIn('"Job, main",1000.00', lines[1])
+
+    def test_rejects_unknown_options(self):
+        self.assertEqual(self.client.get('/api/v1/export/', {'output': 'xml'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/export/', {'type': 'users'}).status_code, 400)
+
+
+class IncomeImportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_json_import_updates_summaries(self):
+        Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        rows = [
+            {'amount': '2500.50', 'source': 'Bank', 'date_received': '2024-01-20'},
+            {'amount': 3000, 'source': 'Bank', 'date_received': '2024-02-01', 'description': 'Bonus'},
+        ]
+        with self.settings(INCOME_IMPORT_BATCH_SIZE=1):
+            response = self.client.post('/api/v1/income/import/', rows, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(Income.objects.filter(user=self.user).count(), 3)
+
+        summary = UserSummary.objects.get(user=self.user)
+        self.assertEqual((summary.total_income, summary.income_count), (Decimal('6500.50'), 3))
+        january = MonthlyIncomeSummary.objects.get(user=self.user, month=date(2024, 1, 1))
+        self.assertEqual((january.total_income, january.income_count), (Decimal('3500.50'), 2))
+        self.assertEqual(verify_user_summary(self.user.id), [])
+
+    def test_invalid_rows_roll_back_the_import(self):
+        rows = [
+            {'amount': '2000', 'source': 'Bank', 'date_received': '2024-01-20'},
+            {'amount': '12', 'source': 'Bank'},
+            {'amount': 'abc', 'source': '', 'date_received': '20-01-2024'},
+        ]
+        with self.settings(INCOME_IMPORT_BATCH_SIZE=1):
+            response = self.client.post('/api/v1/income/import/', rows, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['failed'], 2)
+        self.assertEqual([e['row'] for e in response.data['errors']], [2, 3])
+        self.assertEqual(set(response.data['errors'][1]['errors']), {'amount', 'source', 'date_received'})
+        self.assertFalse(Income.objects.filter(user=self.user).exists())
+
+    def test_csv_import_can_skip_invalid_rows(self):
+        body = (
+            '\ufeffamount,source,date_received,description\r\n'
+            '1500.00,"Shop, Ltd",2024-03-01,\r\n'
+            '1500.001,Shop,2024-03-02,Too precise\r\n'
+            '4000,Shop,,\r\n'
+        ).encode()
+        response = self.client.post('/api/v1/income/import/?skip_invalid=true', body, content_type='text/csv')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['rows'], response.data['created'], response.data['failed']), (3, 2, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 2)
+        self.assertTrue(Income.objects.filter(user=self.user, source='Shop, Ltd', description=None).exists())
+        self.assertEqual(verify_user_summary(self.user.id), [])
+
+    def test_rejects_empty_and_malformed_bodies(self):
+        self.assertEqual(self.client.post('/api/v1/income/import/', [], format='json').status_code, 400)
+        self.assertEqual(self.client.post('/api/v1/income/import/', {'amount': 5000}, format='json').status_code, 400)
+        for body in ['5', 'null', '"rows"', '{"incomes": null}', '{"incomes": 5}', '{"incomes": {"amount": 5000}}']:
+            response = self.client.post('/api/v1/income/import/', body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertIn('list of incomes', response.data['detail'])
+        self.assertFalse(Income.objects.filter(user=self.user).exists())
+
+
+class BatchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        set_provider(FakeProvider())
+
+    def tearDown(self):
+        set_provider(None)
+
+    def flow(self, description='Rent and food'):
+        return [
+            {'id': 'income', 'method': 'POST', 'path': 'income/', 'body': {'amount': '5000.00', 'source': 'Job', 'date_received': '2024-01-05'}},
+            {'id': 'budget', 'method': 'POST', 'path': 'budget/create/',
+             'body': {'income': '${income.id}', 'name': 'January', 'end_date': '2024-01-31'}},
+            {'id': 'categories', 'method': 'POST', 'path': 'categories/create/', 'body': {'budget': '${budget.id}', 'description': description}},
+            {'id': 'detail', 'method': 'GET', 'path': 'income/${income.id}/'},
+        ]
+
+    def test_conditional_headers_are_not_passed_on(self):
+        income = Income.objects.create(user=self.user, amount=Decimal('5000.00'), source='Job', date_received=date(2024, 1, 5))
+        budget = Budget.objects.create(name='January', income=income, total_expenses=income.amount,
+                                       start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        detail = self.client.get(f'/api/v1/budget/{budget.id}/')
+
+        response = self.client.post('/api/v1/batch/', {'requests': [{'method': 'GET', 'path': f'budget/{budget.id}/'}]},
+                                    format='json', HTTP_IF_NONE_MATCH=detail['ETag'], HTTP_IF_MODIFIED_SINCE=detail['Last-Modified'])
+        [result] = response.data['responses']
+        self.assertEqual(result['status'], 200)
+        self.assertEqual(result['body']['name'], 'January')
+
+    def test_runs_a_flow_with_references(self):
+        response = self.client.post('/api/v1/batch/', {'requests': self.flow()}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['committed'])
+        self.assertEqual([r['status'] for r in response.data['responses']], [201, 201, 200, 200])
+        income = Income.objects.get(user=self.user)
+        budget = Budget.objects.get(income=income)
+        detail = response.data['responses'][3]['body']
+        self.assertEqual(detail['income']['id'], income.id)
+        self.assertEqual(detail['budget']['id'], budget.id)
+        self.assertTrue(detail['categories'])
+
+    def test_atomic_batch_rolls_back_on_failure(self):
+        requests = self.flow(description='')
+        response = self.client.post('/api/v1/batch/', {'atomic': True, 'requests': requests}, format='json')
+        self.assertFalse(response.data['committed'])
+        self.assertEqual([r['status'] for r in response.data['responses']], [201, 201, 400, 424])
+        self.assertFalse(Income.objects.filter(user=self.user).exists())
+
+        # Without atomic the writes before the failure are kept
+        response = self.client.post('/api/v1/batch/', {'requests': requests}, format='json')
+        self.assertTrue(response.data['committed'])
+        self.assertEqual(Income.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(verify_user_summary(self.user.id), [])
+
+    def test_rejects_bad_operations(self):
+        response = self.client.post('/api/v1/batch/', {'requests': [
+            {'method': 'GET', 'path': 'income/${missing.id}/'},
+        ]}, format='json')
+        self.assertEqual(response.data['responses'][0]['status'], 400)
+
+        for operation in ({'method': 'GET', 'path': '/admin/'}, {'method': 'POST', 'path': 'batch/'},
+                          {'method': 'GET', 'path': 'nowhere/'}, {'method': 'TRACE', 'path': 'summary/'}):
+            response = self.client.post('/api/v1/batch/', {'requests': [operation]}, format='json')
+            self.assertGreaterEqual(response.data['responses'][0]['status'], 400)
+        self.assertEqual(self.client.post('/api/v1/batch/', {'requests': []}, format='json').status_code, 400)
+
+    def test_requires_authentication(self):
+        response = APIClient().post('/api/v1/batch/', {'requests': [{'method': 'GET', 'path': 'summary/'}]}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+
+class CategoryBulkUpdateTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        income = Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        self.budget = Budget.objects.create(name='January', income=income, total_expenses=Decimal('1000.00'),
+                                            start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        self.rent = Category.objects.create(budget=self.budget, name='Rent', amount=Decimal('600.00'))
+        self.food = Category.objects.create(budget=self.budget, name='Food', amount=Decimal('300.00'))
+        self.car = Category.objects.create(budget=self.budget, name='Car Savings', amount=Decimal('100.00'))
+        Savings.objects.create(user=self.user, goal_name='Car Savings', amount_saved=Decimal('100.00'), target_amount=Decimal('1000.00'))
+        self.url = f'/api/v1/budget/{self.budget.id}/categories/'
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_updates_categories_in_a_few_queries(self):
+        changes = [
+            {'id': self.rent.id, 'amount': '550.00', 'description': 'Flat'},
+            {'id': self.food.id, 'name': 'Groceries', 'amount': '350.00'},
+        ]
+        # Budget, categories, bulk update, aggregate, summary, plus the savepoint and its release
+        with self.assertNumQueries(7):
+            response = self.client.patch(self.url, {'categories': changes}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['allocated'], Decimal('1000.00'))
+        self.rent.refresh_from_db()
+        self.food.refresh_from_db()
+        self.assertEqual((self.rent.amount, self.rent.description), (Decimal('550.00'), 'Flat'))
+        self.assertEqual((self.food.name, self.food.amount), ('Groceries', Decimal('350.00')))
+        self.assertEqual(verify_budget_summary(self.budget.id), [])
+
+    def test_amounts_must_add_up_to_the_budget(self):
+        response = self.client.patch(self.url, [{'id': self.rent.id, 'amount': '700.00'}], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.rent.refresh_from_db()
+        self.assertEqual(self.rent.amount, Decimal('600.00'))
+
+    def test_reports_every_bad_entry(self):
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+        income = Income.objects.create(user=other, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        budget = Budget.objects.create(name='Theirs', income=income, total_expenses=Decimal('1000.00'),
+                                       start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        theirs = Category.objects.create(budget=budget, name='Rent', amount=Decimal('1000.00'))
+
+        response = self.client.patch(self.url, [
+            {'id': theirs.id, 'name': 'Mine now'},
+            {'id': self.rent.id, 'name': ''},
+            {'id': self.food.id, 'amount': '-1'},
+            {'id': self.food.id, 'name': 'Food again'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['index'] for e in response.data['errors']], [0, 1, 2, 3])
+        theirs.refresh_from_db()
+        self.assertEqual(theirs.name, 'Rent')
+
+        response = self.client.patch(f'/api/v1/budget/{budget.id}/categories/', [{'id': theirs.id, 'name': 'x'}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+    def test_ids_must_be_integers(self):
+        first = Category.objects.filter(budget=self.budget).order_by('id').first()
+        response = self.client.patch(self.url, [
+            {'id': True, 'name': 'Renamed'},
+            {'id': False, 'name': 'Renamed'},
+            {'id': str(first.id), 'name': 'Renamed'},
+            {'id': float(first.id), 'name': 'Renamed'},
+            {'name': 'Renamed'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([e['errors']['id'] for e in response.data['errors']], ['A valid integer is required.'] * 5)
+        self.assertFalse(Category.objects.filter(name='Renamed').exists())
+
+    def test_savings_category_keeps_its_goal(self):
+        response = self.client.patch(self.url, [
+            {'id': self.car.id, 'name': 'New Car Savings', 'amount': '150.00'},
+            {'id': self.food.id, 'amount': '250.00'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        goal = Savings.objects.get(user=self.user)
+        self.assertEqual((goal.goal_name, goal.amount_saved), ('New Car Savings', Decimal('150.00')))
+        self.assertEqual(verify_user_summary(self.user.id), [])
+
+
+@override_settings(SYNC_OVERLAP_SECONDS=0)
+class SyncTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+        Income.objects.create(user=other, amount=Decimal('9999.00'), source='Theirs', date_received=date(2024, 1, 5))
+        self.income = Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        self.budget = Budget.objects.create(name='January', income=self.income, total_expenses=Decimal('1000.00'),
+                                            start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        self.savings = Savings.objects.create(user=self.user, goal_name='Car Savings', amount_saved=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def sync(self, cursor=None):
+        response = self.client.get('/api/v1/sync/', {'cursor': cursor} if cursor else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_returns_only_changes_and_deletions(self):
+        first = self.sync()
+        self.assertEqual([row['source'] for row in first['income']], ['Job'])
+        self.assertEqual(len(first['budgets']), 1)
+        self.assertEqual(len(first['savings']), 1)
+        self.assertFalse(first['has_more'])
+
+        quiet = self.sync(first['cursor'])
+        self.assertEqual((quiet['income'], quiet['budgets'], quiet['savings']), ([], [], []))
+
+        bonus = Income.objects.create(user=self.user, amount=Decimal('2000.00'), source='Bonus', date_received=date(2024, 2, 1))
+        self.savings.amount_saved = Decimal('200.00')
+        self.savings.save()
+        self.client.delete(f'/api/v1/income/delete/{self.income.id}/')
+
+        changed = self.sync(quiet['cursor'])
+        self.assertEqual([row['id'] for row in changed['income']], [bonus.id])
+        self.assertEqual([row['amount_saved'] for row in changed['savings']], ['200.00'])
+        self.assertEqual(changed['deleted'], {'income': [self.income.id], 'budgets': [self.budget.id], 'savings': []})
+
+        self.assertEqual(self.sync(changed['cursor'])['deleted'], {'income': [], 'budgets': [], 'savings': []})
+
+    def test_pages_through_large_changes(self):
+        for day in range(1, 6):
+            Income.objects.create(user=self.user, amount=Decimal('1000.00'), source=f'Job {day}', date_received=date(2024, 3, day))
+        sources = []
+        cursor = None
+        with self.settings(SYNC_PAGE_SIZE=2):
+            while True:
+                data = self.sync(cursor)
+                sources += [row['source'] for row in data['income']]
+                cursor = data['cursor']
+                if not data['has_more']:
+                    break
+        self.assertEqual(sources, ['Job'] + [f'Job {day}' for day in range(1, 6)])
+
+    def test_rejects_bad_and_expired_cursors(self):
+        self.assertEqual(self.client.get('/api/v1/sync/', {'cursor': 'nonsense'}).status_code, 400)
+        old = timezone.now() - timedelta(days=365)
+        cursor = encode_cursor({kind: (old, 0) for kind in ['income', 'budgets', 'savings', 'deleted']})
+        self.assertEqual(self.client.get('/api/v1/sync/', {'cursor': cursor}).status_code, 410)
+
+    def test_deleting_a_user_leaves_no_tombstones(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+        self.assertFalse(Tombstone.objects.exists())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        self.income = Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        self.budget = Budget.objects.create(name='January', income=self.income, total_expenses=Decimal('1000.00'),
+                                            start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        self.category = Category.objects.create(budget=self.budget, name='Rent', amount=Decimal('600.00'))
+        self.savings = Savings.objects.create(user=self.user, goal_name='Car Savings', amount_saved=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_unchanged_detail_is_not_modified(self):
+        for url in [f'/api/v1/budget/{self.budget.id}/', f'/api/v1/savings/{self.savings.id}/', f'/api/v1/income/{self.income.id}/']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            again = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(again.status_code, 304, url)
+            self.assertEqual(again['ETag'], response['ETag'])
+            self.assertEqual(again.content, b'')
+
+    def test_income_etag_follows_categories(self):
+        url = f'/api/v1/income/{self.income.id}/'
+        etag = self.client.get(url)['ETag']
+
+        self.category.name = 'Housing'
+        self.category.save()
+        renamed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(renamed.status_code, 200)
+        self.assertNotEqual(renamed['ETag'], etag)
+
+        etag = renamed['ETag']
+        self.category.delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_timestamps_only_on_single_row_details(self):
+        for url in [f'/api/v1/budget/{self.budget.id}/', f'/api/v1/savings/{self.savings.id}/']:
+            response = self.client.get(url)
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertNotIn('Last-Modified', self.client.get(f'/api/v1/income/{self.income.id}/'))
+
+    def test_deleted_category_is_not_hidden_by_if_modified_since(self):
+        url = f'/api/v1/income/{self.income.id}/'
+        self.client.get(url)
+        since = http_date(timezone.now().timestamp() + 60)
+        self.category.delete()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=since)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['categories'], [])
+
+    def test_income_freshness_check_is_one_query(self):
+        url = f'/api/v1/income/{self.income.id}/'
+        etag = self.client.get(url)['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(len(queries), 1)
+
+    def test_someone_elses_income_is_still_forbidden(self):
+        other = CustomUser.objects.create_user(email='other@example.com', username='other', password='Abcdef1@')
+        client = APIClient()
+        client.force_authenticate(other)
+        etag = self.client.get(f'/api/v1/income/{self.income.id}/')['ETag']
+        self.assertEqual(client.get(f'/api/v1/income/{self.income.id}/', HTTP_IF_NONE_MATCH=etag).status_code, 403)
+
+
+class DescriptionCacheTests(TestCase):
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = DescriptionCache(max_entries=2)
+        cache.set_many({'Rent': 'Housing costs', 'Food': 'Groceries'}, 'v1')
+        cache.get_many(['Rent'], 'v1')
+        cache.set_many({'Transport': 'Bus fare'}, 'v1')
+
+        self.assertEqual(cache.stats()['memory_entries'], 2)
+        self.assertEqual(cache.stats()['evictions'], 1)
+        # Food fell out of memory but is still in the table
+        self.assertEqual(cache.get_many(['Rent', 'Food'], 'v1'), {'Rent': 'Housing costs', 'Food': 'Groceries'})
+        self.assertEqual((cache.memory_hits, cache.db_hits), (2, 1))
+
+    def test_entries_expire_after_ttl(self):
+        cache = DescriptionCache(ttl=60)
+        cache.set_many({'Rent': 'Housing costs'}, 'v1')
+        self.assertEqual(cache.get_many(['Rent'], 'v1'), {'Rent': 'Housing costs'})
+
+        later = timezone.now() + timedelta(seconds=61)
+        with mock.patch('base.description_cache.timezone.now', return_value=later):
+            self.assertEqual(cache.get_many(['Rent'], 'v1'), {})
+        self.assertEqual(cache.misses, 1)
+        self.assertEqual(cache.stats()['memory_entries'], 0)
+
+    def test_falls_back_to_the_table(self):
+        DescriptionCache().set_many({'Car Savings': 'Saving for a car'}, 'v1')
+
+        # Another worker starts with an empty memory tier
+        cache = DescriptionCache()
+        self.assertEqual(cache.get_many(['  car   SAVINGS '], 'v1'), {'  car   SAVINGS ': 'Saving for a car'})
+        self.assertEqual((cache.memory_hits, cache.db_hits), (0, 1))
+        with CaptureQueriesContext(connection) as queries:
+            cache.get_many(['Car Savings'], 'v1')
+        self.assertEqual(len(queries), 0)
+
+    def test_prompt_version_is_part_of_the_key(self):
+        cache = DescriptionCache()
+        cache.set_many({'Rent': 'Housing costs'}, 'v1')
+        self.assertEqual(cache.get_many(['Rent'], 'v2'), {})
+        cache.set_many({'Rent': 'Monthly rent'}, 'v2')
+        self.assertEqual(cache.get_many(['Rent'], 'v1'), {'Rent': 'Housing costs'})
+        self.assertEqual(cache.get_many(['Rent'], 'v2'), {'Rent': 'Monthly rent'})
+
+
+class RebalanceTests(TestCase):
+    def amounts(self, categories):
+        return {cat['name']: (cat['amount'], cat['delete']) for cat in categories}
+
+    def test_shortfall_goes_to_extra(self):
+        categories = rebalance_categories([
+            {'name': 'Rent', 'amount': Decimal('500'), 'delete': False},
+            {'name': 'extra', 'amount': Decimal('100'), 'delete': False},
+        ], Decimal('1000'))
+        self.assertEqual(self.amounts(categories), {'Rent': (Decimal('500.00'), False), 'extra': (Decimal('500.00'), False)})
+
+        categories = rebalance_categories([{'name': 'Rent', 'amount': Decimal('500'), 'delete': False}], Decimal('1000'))
+        self.assertEqual(self.amounts(categories), {'Rent': (Decimal('500.00'), False), 'Extra': (Decimal('500.00'), False)})
+
+    def test_overspend_is_scaled_down_to_the_cent(self):
+        categories = rebalance_categories([
+            {'name': 'Rent', 'amount': Decimal('500'), 'delete': False},
+            {'name': 'Food', 'amount': Decimal('400'), 'delete': False},
+            {'name': 'Fun', 'amount': Decimal('300'), 'delete': False},
+            {'name': 'Old', 'amount': Decimal('900'), 'delete': True},
+        ], Decimal('1000'))
+        kept = [cat['amount'] for cat in categories if not cat['delete']]
+        self.assertEqual(sum(kept), Decimal('1000.00'))
+        self.assertEqual(kept, [Decimal('416.67'), Decimal('333.33'), Decimal('250.00')])
+
+    def test_deleted_extra_takes_the_shortfall(self):
+        categories = rebalance_categories([
+            {'name': 'Rent', 'amount': Decimal('500'), 'delete': False},
+            {'name': 'Extra', 'amount': Decimal('500'), 'delete': True},
+        ], Decimal('1000'))
+        self.assertEqual(
+            [(cat['name'], cat['amount'], cat['delete']) for cat in categories],
+            [('Rent', Decimal('500.00'), False), ('Extra', Decimal('500.00'), False)],
+        )
+
+    def test_endpoint_keeps_extra_the_model_deleted(self):
+        user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        income = Income.objects.create(user=user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        budget = Budget.objects.create(name='January', income=income, total_expenses=Decimal('1000.00'),
+                                       start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        Category.objects.create(budget=budget, name='Rent', amount=Decimal('500.00'), description='Housing')
+        Category.objects.create(budget=budget, name='Extra', amount=Decimal('500.00'), description='Leftovers')
+        set_provider(FakeProvider(responses=[{'match': 'Update the following', 'response': json.dumps({'categories': [
+            {'name': 'Rent', 'amount': 500, 'delete': False},
+            {'name': 'Extra', 'amount': 0, 'delete': True},
+        ]})}]))
+        self.addCleanup(set_provider, None)
+        client = APIClient()
+        client.force_authenticate(user)
+
+        response = client.post('/api/v1/categories/create/', {'budget': budget.id, 'description': 'Drop Extra'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(Category.objects.filter(budget=budget).values_list('name', 'amount')),
+            {'Rent': Decimal('500.00'), 'Extra': Decimal('500.00')},
+        )
+
+
+class CategoryJobWorkerTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        income = Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        self.budget = Budget.objects.create(name='January', income=income, total_expenses=Decimal('1000.00'),
+                                            start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        Category.objects.create(budget=self.budget, name='Rent', amount=Decimal('1000.00'), description='Housing')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        set_provider(FakeProvider())
+        self.addCleanup(set_provider, None)
+
+    def enqueue(self):
+        response = self.client.post('/api/v1/categories/create/?async=1', {'budget': self.budget.id, 'description': 'Plan my month'}, format='json')
+        self.assertEqual(response.status_code, 202)
+        return CategoryJob.objects.get(id=response.data['job'])
+
+    def work(self, *args):
+        call_command('run_category_jobs', '--once', *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_enqueued_job_runs_and_succeeds(self):
+        job = self.enqueue()
+        self.assertEqual((job.status, job.attempts), (CategoryJob.PENDING, 0))
+        self.work()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (CategoryJob.SUCCEEDED, 1))
+        self.assertEqual(job.result, {'detail': 'Categories updated successfully.'})
+        self.assertIsNotNone(job.finished_at)
+        self.assertGreater(Category.objects.filter(budget=self.budget).count(), 1)
+        self.assertEqual(self.client.get(f'/api/v1/categories/jobs/{job.id}/').data['status'], CategoryJob.SUCCEEDED)
+
+    def test_unusable_answer_fails_the_job(self):
+        set_provider(FakeProvider(responses=[]))
+        job = self.enqueue()
+        with self.assertLogs('base.urls.api', 'WARNING'):
+            self.work()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (CategoryJob.FAILED, 1))
+        self.assertIn('no valid categories', job.error)
+
+    def test_crash_midway_rolls_back_and_retries_until_max_attempts(self):
+        job = self.enqueue()
+        with mock.patch('base.urls.api.CategoryCreateView.handle_savings', side_effect=RuntimeError('boom')) as handle_savings:
+            self.work('--max-attempts', '2')
+
+        job.refresh_from_db()
+        self.assertEqual(handle_savings.call_count, 2)
+        self.assertEqual((job.status, job.attempts), (CategoryJob.FAILED, 2))
+        self.assertIn('RuntimeError: boom', job.error)
+        # The categories written before the crash went with the transaction
+        self.assertEqual(list(Category.objects.filter(budget=self.budget).values_list('name', 'amount')), [('Rent', Decimal('1000.00'))])
+
+    def test_job_left_running_by_a_dead_worker_is_requeued(self):
+        job = self.enqueue()
+        CategoryJob.objects.filter(id=job.id).update(status=CategoryJob.RUNNING, attempts=1,
+                                                    started_at=timezone.now() - timedelta(hours=1))
+        self.work()
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (CategoryJob.SUCCEEDED, 2))
+
+    def test_job_that_keeps_killing_workers_gives_up(self):
+        job = self.enqueue()
+        CategoryJob.objects.filter(id=job.id).update(status=CategoryJob.RUNNING, attempts=3,
+                                                    started_at=timezone.now() - timedelta(hours=1))
+        with mock.patch('base.urls.api.CategoryCreateView.create_categories') as create_categories:
+            self.work('--max-attempts', '3')
+
+        job.refresh_from_db()
+        create_categories.assert_not_called()
+        self.assertEqual((job.status, job.attempts), (CategoryJob.FAILED, 3))
+        self.assertIn('worker stopped', job.error)
+        self.assertIsNotNone(job.finished_at)
+
+
+class ParseCategoriesTests(TestCase):
+    def parse(self, text):
+        return CategoryCreateView().parse_categories(text)
+
+    def assertRejected(self, text):
+        with self.assertLogs('base.urls.api', 'WARNING'):
+            self.assertEqual(self.parse(text), [])
+
+    def test_reads_categories_and_delete_flags(self):
+        text = '```json\n' + json.dumps({'categories': [
+            {'name': 'Rent', 'amount': '$1,200.50'},
+            {'name': 'Gym', 'amount': 0, 'delete': True},
+        ]}) + '\n```'
+        self.assertEqual(self.parse(text), [
+            {'name': 'Rent', 'amount': Decimal('1200.50'), 'delete': False},
+            {'name': 'Gym', 'amount': Decimal('0.00'), 'delete': True},
+        ])
+
+    def test_rejects_non_json(self):
+        self.assertRejected('Rent: 500\nFood: 300')
+
+    def test_rejects_missing_categories_list(self):
+        self.assertRejected(json.dumps({'plan': []}))
+        self.assertRejected(json.dumps({'categories': 'Rent'}))
+
+    def test_drops_invalid_entries_only(self):
+        with self.assertLogs('base.urls.api', 'WARNING') as logs:
+            categories = self.parse(json.dumps({'categories': [
+                {'name': 'Rent', 'amount': 500},
+                {'name': 'Food', 'amount': -20},
+                {'amount': 100},
+            ]}))
+        self.assertEqual(categories, [{'name': 'Rent', 'amount': Decimal('500.00'), 'delete': False}])
+        self.assertEqual(len(logs.output), 2)
+
+
+class LLMRoutingTests(TestCase):
+    def provider(self, name, answer='ok', **kwargs):
+        provider = FakeProvider(responses=[{'match': '', 'response': answer}], **kwargs)
+        provider.name = name
+        return provider
+
+    def test_breaker_opens_then_lets_one_trial_through(self):
+        breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30)
+        with mock.patch('base.llm.time.monotonic', return_value=100.0) as clock:
+            breaker.record_failure()
+            self.assertEqual(breaker.state, 'closed')
+            breaker.record_failure()
+            self.assertEqual(breaker.state, 'open')
+            self.assertFalse(breaker.allow())
+
+            clock.return_value = 130.0
+            self.assertEqual(breaker.state, 'half-open')
+            self.assertTrue(breaker.allow())
+            self.assertFalse(breaker.allow())
+            # A failed trial opens it again straight away
+            breaker.record_failure()
+            self.assertEqual(breaker.state, 'open')
+
+            clock.return_value = 160.0
+            self.assertTrue(breaker.allow())
+            breaker.record_success()
+            self.assertEqual((breaker.state, breaker.failures), ('closed', 0))
+
+    def test_failed_call_falls_back_and_opens_the_breaker(self):
+        broken = self.provider('broken', error_rate=1.0)
+        router = RoutedProvider([
+            Route(broken, breaker=CircuitBreaker(failure_threshold=1)),
+            Route(self.provider('backup', 'from backup')),
+        ])
+        self.assertEqual(router.generate('Plan my month'), 'from backup')
+        self.assertEqual(router.generate('Plan my month'), 'from backup')
+        # The open breaker kept the second call away from the broken provider
+        self.assertEqual(broken.calls, 1)
+        self.assertEqual([route['breaker'] for route in router.stats()], ['open', 'closed'])
+
+    def test_all_providers_failing_raises(self):
+        router = RoutedProvider([Route(self.provider('a', error_rate=1.0)), Route(self.provider('b', error_rate=1.0))])
+        with self.assertRaises(LLMError):
+            router.generate('Plan my month')
+
+    def test_slow_provider_is_hedged(self):
+        slow = self.provider('slow', 'from slow', latency=1.0)
+        fast = self.provider('fast', 'from fast')
+        router = RoutedProvider([Route(slow), Route(fast)], hedge_delay=0.05)
+        started = time.monotonic()
+        self.assertEqual(router.generate('Plan my month'), 'from fast')
+        self.assertLess(time.monotonic() - started, 0.5)
+        self.assertEqual((slow.calls, fast.calls), (1, 1))
+
+    def test_measured_providers_go_first(self):
+        unsampled, slower, faster = Route(self.provider('a')), Route(self.provider('b')), Route(self.provider('c'))
+        slower.latency, faster.latency = 0.2, 0.1
+        router = RoutedProvider([unsampled, slower, faster])
+        self.assertEqual(router.candidates(), [faster, slower, unsampled])
+
+
+class CountingEmailBackend(LocMemEmailBackend):
+    # Collects mail in mail.outbox like locmem, counting sessions and bouncing
+    # bounce@ addresses; once `max_sessions` have been opened it can't connect
+    opened = 0
+    max_sessions = None
+
+    def open(self):
+        if self.max_sessions is not None and CountingEmailBackend.opened >= self.max_sessions:
+            raise OSError('Connection refused')
+        CountingEmailBackend.opened += 1
+        return True
+
+    def send_messages(self, messages):
+        if any(address.startswith('bounce@') for message in messages for address in message.to):
+            raise OSError('550 mailbox unavailable')
+        return super().send_messages(messages)
+
+
+@override_settings(EMAIL_BACKEND='base.tests.CountingEmailBackend', EMAIL_BULK_RATE=0)
+class SendOutboxTests(TestCase):
+    def setUp(self):
+        CountingEmailBackend.opened = 0
+        self.addCleanup(setattr, CountingEmailBackend, 'max_sessions', None)
+
+    def queue(self, to_email, **kwargs):
+        return EmailOutbox.objects.create(subject='Digest', body='Your month', to_email=to_email, from_email='app@example.com', **kwargs)
+
+    def send(self, *args):
+        call_command('send_outbox', '--once', *args, stdout=StringIO(), stderr=StringIO())
+
+    def test_claims_only_due_pending_rows(self):
+        due = self.queue('a@example.com')
+        later = self.queue('b@example.com', next_attempt_at=timezone.now() + timedelta(hours=1))
+        sent = self.queue('c@example.com', status=EmailOutbox.SENT)
+
+        command = SendOutboxCommand()
+        self.assertEqual([email.id for email in command.claim_batch(10)], [due.id])
+        self.assertEqual(
+            dict(EmailOutbox.objects.values_list('id', 'status')),
+            {due.id: EmailOutbox.SENDING, later.id: EmailOutbox.PENDING, sent.id: EmailOutbox.SENT},
+        )
+        # Claimed rows aren't handed to another worker
+        self.assertEqual(command.claim_batch(10), [])
+
+    def test_batch_shares_one_connection(self):
+        for i in range(5):
+            self.queue(f'user{i}@example.com')
+        self.send()
+
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(EmailOutbox.objects.filter(status=EmailOutbox.SENT, attempts=1).count(), 5)
+
+    def test_failures_back_off_then_give_up(self):
+        email = self.queue('bounce@example.com')
+        self.queue('ok@example.com')
+
+        self.send('--backoff', '60', '--max-attempts', '3')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.PENDING, 1))
+        self.assertIn('550', email.last_error)
+        self.assertAlmostEqual((email.next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+        self.assertEqual(EmailOutbox.objects.get(to_email='ok@example.com').status, EmailOutbox.SENT)
+
+        # Not due yet, so nothing is retried
+        self.send('--backoff', '60', '--max-attempts', '3')
+        email.refresh_from_db()
+        self.assertEqual(email.attempts, 1)
+
+        EmailOutbox.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+        self.send('--backoff', '60', '--max-attempts', '3')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.PENDING, 2))
+        self.assertAlmostEqual((email.next_attempt_at - timezone.now()).total_seconds(), 120, delta=5)
+
+        EmailOutbox.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+        self.send('--backoff', '60', '--max-attempts', '3')
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts), (EmailOutbox.FAILED, 3))
+
+    def test_server_down_retries_every_claimed_row(self):
+        CountingEmailBackend.max_sessions = 0
+        for i in range(3):
+            self.queue(f'user{i}@example.com')
+        self.send('--backoff', '60')
+
+        self.assertEqual(
+            list(EmailOutbox.objects.values_list('status', 'attempts', 'last_error').distinct()),
+            [(EmailOutbox.PENDING, 1, 'Connection refused')],
+        )
+        self.assertFalse(EmailOutbox.objects.filter(next_attempt_at__lte=timezone.now()).exists())
+
+    def test_sends_are_kept_when_the_batch_fails_later(self):
+        delivered = self.queue('a@example.com')
+        self.queue('b@example.com')
+        self.queue('c@example.com')
+
+        def send_one_then_crash(messages, on_result, **kwargs):
+            next(iter(messages))
+            on_result({'index': 0, 'to_email': 'a@example.com', 'sent': True, 'error': None})
+            raise RuntimeError('worker lost its database connection')
+
+        with mock.patch('base.management.commands.send_outbox.send_bulk_email', side_effect=send_one_then_crash):
+            self.send('--backoff', '60')
+
+        delivered.refresh_from_db()
+        self.assertEqual((delivered.status, delivered.attempts), (EmailOutbox.SENT, 1))
+        self.assertEqual(
+            list(EmailOutbox.objects.exclude(id=delivered.id).values_list('status', 'attempts').distinct()),
+            [(EmailOutbox.PENDING, 1)],
+        )
+        self.assertFalse(EmailOutbox.objects.filter(status=EmailOutbox.SENDING).exists())
+
+    def test_stale_sending_rows_count_as_an_attempt(self):
+        claimed_at = timezone.now() - timedelta(hours=1)
+        crashed = self.queue('a@example.com', status=EmailOutbox.SENDING, next_attempt_at=claimed_at)
+        last_try = self.queue('b@example.com', status=EmailOutbox.SENDING, next_attempt_at=claimed_at, attempts=2)
+        self.send('--backoff', '60', '--max-attempts', '3')
+
+        crashed.refresh_from_db()
+        self.assertEqual((crashed.status, crashed.attempts), (EmailOutbox.PENDING, 1))
+        self.assertIn('worker stopped', crashed.last_error)
+        self.assertAlmostEqual((crashed.next_attempt_at - timezone.now()).total_seconds(), 60, delta=5)
+        last_try.refresh_from_db()
+        self.assertEqual((last_try.status, last_try.attempts), (EmailOutbox.FAILED, 3))
+        self.assertEqual(mail.outbox, [])
+
+
+@override_settings(EMAIL_BACKEND='base.tests.CountingEmailBackend', EMAIL_BULK_RATE=0)
+class BulkEmailTests(TestCase):
+    def setUp(self):
+        CountingEmailBackend.opened = 0
+        self.addCleanup(setattr, CountingEmailBackend, 'max_sessions', None)
+
+    def message(self, to_email):
+        return {'email_subject': 'Digest', 'email_body': 'Your month', 'to_email': to_email, 'from_email': 'app@example.com'}
+
+    def test_many_messages_share_one_connection(self):
+        report = send_bulk_email(self.message(f'user{i}@example.com') for i in range(10))
+        self.assertEqual((report['sent'], report['failed'], report['sessions']), (10, 0, 1))
+        self.assertEqual(CountingEmailBackend.opened, 1)
+        self.assertEqual([message.to for message in mail.outbox], [[f'user{i}@example.com'] for i in range(10)])
+
+    def test_failures_are_recorded_per_recipient(self):
+        recipients = ['a@example.com', 'bounce@example.com', 'b@example.com']
+        report = send_bulk_email(self.message(to_email) for to_email in recipients)
+
+        self.assertEqual([(result['to_email'], result['sent']) for result in report['results']],
+                         [('a@example.com', True), ('bounce@example.com', False), ('b@example.com', True)])
+        self.assertIn('550', report['results'][1]['error'])
+        # The session is reopened after a failure
+        self.assertEqual(report['sessions'], 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+    def test_unreachable_server_fails_messages_instead_of_raising(self):
+        CountingEmailBackend.max_sessions = 0
+        report = send_bulk_email(self.message(f'user{i}@example.com') for i in range(3))
+        self.assertEqual((report['sent'], report['failed'], report['sessions']), (0, 3, 0))
+        self.assertEqual({result['error'] for result in report['results']}, {'Connection refused'})
+
+    def test_failed_reconnect_keeps_earlier_results(self):
+        CountingEmailBackend.max_sessions = 1
+        recipients = ['a@example.com', 'bounce@example.com', 'b@example.com', 'c@example.com']
+        report = send_bulk_email(self.message(to_email) for to_email in recipients)
+
+        self.assertEqual([(result['index'], result['sent']) for result in report['results']], [(0, True), (1, False), (2, False), (3, False)])
+        self.assertEqual([result['error'] for result in report['results'][2:]], ['Connection refused'] * 2)
+        self.assertEqual([message.to for message in mail.outbox], [['a@example.com']])
+
+    def test_queue_email_stores_without_sending(self):
+        with override_settings(EMAIL_HOST_USER='app@example.com'):
+            email = queue_email({'email_subject': 'Welcome', 'email_body': 'Hi', 'to_email': 'new@example.com'})
+        self.assertEqual((email.status, email.from_email, email.attempts), (EmailOutbox.PENDING, 'app@example.com', 0))
+        self.assertEqual(mail.outbox, [])
+
+
+class DescriptionGenerationTests(TestCase):
+    def setUp(self):
+        description_cache.clear()
+        self.addCleanup(set_provider, None)
+
+    @override_settings(CATEGORY_DESCRIPTION_CONCURRENCY=8, CATEGORY_DESCRIPTION_TIMEOUT=5)
+    def test_descriptions_are_fetched_concurrently(self):
+        set_provider(FakeProvider(latency=0.2))
+        names = [f'Concurrent {i}' for i in range(6)]
+        started = time.monotonic()
+        descriptions = CategoryCreateView().generate_descriptions(names)
+
+        # Six calls of 0.2s each, run side by side
+        self.assertLess(time.monotonic() - started, 0.6)
+        self.assertEqual(descriptions, {name: 'A category for planned spending in this budget.' for name in names})
+
+    @override_settings(CATEGORY_DESCRIPTION_TIMEOUT=0.05)
+    def test_slow_description_gets_placeholder(self):
+        set_provider(FakeProvider(latency=0.3))
+        user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        income = Income.objects.create(user=user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        budget = Budget.objects.create(name='January', income=income, total_expenses=Decimal('1000.00'),
+                                       start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        client = APIClient()
+        client.force_authenticate(user)
+
+        with self.assertLogs('base.urls.api', 'WARNING') as logs:
+            response = client.post('/api/v1/categories/create/', {'budget': budget.id, 'description': 'Plan my month'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Description generation failed for Rent', logs.output[0])
+        self.assertEqual(set(Category.objects.filter(budget=budget).values_list('description', flat=True)), {'No description available.'})
+        # Placeholders aren't cached, so the next request asks again
+        self.assertEqual(description_cache.get_many(['Rent'], DESCRIPTION_PROMPT_VERSION), {})
+
+
+class LazyGeminiImportTests(TestCase):
+    def test_startup_does_not_import_the_sdk(self):
+        code = (
+            'import sys, django; django.setup(); '
+            'import base.urls.api_urls, base.llm; '
+            'base.llm.get_provider(); '
+            'print("google.generativeai" in sys.modules)'
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE='bridger.settings', LLM_PROVIDER='gemini')
+        result = subprocess.run([sys.executable, '-c', code], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.strip().splitlines()[-1], 'False')
+
+    def test_sdk_is_configured_once_on_first_use(self):
+        genai = mock.Mock()
+        google = types.ModuleType('google')
+        google.generativeai = genai
+        provider = GeminiProvider(model_name='gemini-test', api_key='key')
+        with mock.patch.dict(sys.modules, {'google': google, 'google.generativeai': genai}):
+            self.assertIs(provider.get_model(), provider.get_model())
+        genai.configure.assert_called_once_with(api_key='key')
+        genai.GenerativeModel.assert_called_once_with('gemini-test')
+
+
+class CategoryReconcileTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        description_cache.clear()
+        self.addCleanup(set_provider, None)
+
+    def budget_with(self, count):
+        income = Income.objects.create(user=self.user, amount=Decimal('1000.00'), source='Job', date_received=date(2024, 1, 5))
+        budget = Budget.objects.create(name='January', income=income, total_expenses=Decimal('1000.00'),
+                                       start_date=date(2024, 1, 5), end_date=date(2024, 1, 31))
+        Category.objects.bulk_create([
+            Category(budget=budget, name=f'Category {i}', amount=Decimal('10.00'), description='Seeded') for i in range(count - 1)
+        ] + [Category(budget=budget, name='Car Savings', amount=Decimal('1000.00') - 10 * (count - 1), description='Seeded')])
+        return budget
+
+    def plan(self, budget, categories):
+        set_provider(FakeProvider(responses=[
+            {'match': 'Update the following', 'response': json.dumps({'categories': categories})},
+            {'match': 'Generate a unique description', 'response': 'A category.'},
+        ]))
+        return self.client.post('/api/v1/categories/create/', {'budget': budget.id, 'description': 'Rework it'}, format='json')
+
+    def rework(self, budget):
+        # Update every category but one, delete that one and add a new one
+        names = list(Category.objects.filter(budget=budget).exclude(name='Car Savings').values_list('name', flat=True))
+        categories = [{'name': name, 'amount': 20, 'delete': False} for name in names[1:]]
+        categories += [
+            {'name': names[0], 'amount': 0, 'delete': True},
+            {'name': 'Car Savings', 'amount': 100, 'delete': False},
+            {'name': f'New for {budget.id}', 'amount': 900 - 20 * (len(names) - 1), 'delete': False},
+        ]
+        return self.plan(budget, categories)
+
+    def test_writes_do_not_grow_with_the_category_count(self):
+        small, large = self.budget_with(3), self.budget_with(12)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.rework(small).status_code, 200)
+        with self.assertNumQueries(len(queries)):
+            self.assertEqual(self.rework(large).status_code, 200)
+
+        self.assertEqual(Category.objects.filter(budget=large).count(), 12)
+        self.assertEqual(verify_budget_summary(large.id), [])
+        self.assertEqual(Savings.objects.get(user=self.user, goal_name='Car Savings').amount_saved, Decimal('100.00'))
+
+    def test_unreachable_llm_is_a_503(self):
+        budget = self.budget_with(3)
+        set_provider(RoutedProvider([Route(FakeProvider(error_rate=1.0), breaker=CircuitBreaker(failure_threshold=1))]))
+        for _ in range(2):
+            # First every call fails, then the breaker is open
+            with self.assertLogs('base.urls.api', 'WARNING'):
+                response = self.client.post('/api/v1/categories/create/', {'budget': budget.id, 'description': 'Rework it'}, format='json')
+            self.assertEqual(response.status_code, 503)
+            self.assertIn('unavailable', response.data['detail'])
+            self.assertEqual(response['Retry-After'], str(math.ceil(settings.LLM_BREAKER_RESET)))
+
+    def test_unusable_answer_is_a_500(self):
+        budget = self.budget_with(3)
+        with self.assertLogs('base.urls.api', 'WARNING'):
+            response = self.plan(budget, 'Rent: 500')
+        self.assertEqual(response.status_code, 500)
+        self.assertIn('no valid categories', response.data['detail'])
+
+    def test_failure_partway_leaves_nothing_behind(self):
+        budget = self.budget_with(3)
+        Savings.objects.create(user=self.user, goal_name='Car Savings', amount_saved=Decimal('980.00'))
+        before = list(Category.objects.filter(budget=budget).order_by('id').values_list('name', 'amount', 'description'))
+
+        # Fails after the categories and savings have been written
+        with mock.patch('base.urls.api.bulk_written', side_effect=RuntimeError('boom')):
+            with self.assertRaises(RuntimeError):
+                self.rework(budget)
+
+        self.assertEqual(list(Category.objects.filter(budget=budget).order_by('id').values_list('name', 'amount', 'description')), before)
+        self.assertEqual(list(Savings.objects.filter(user=self.user).values_list('goal_name', 'amount_saved')), [('Car Savings', Decimal('980.00'))])
+
+
+class TokenCountingProvider(FakeProvider):
+    # Reports token usage the way the real providers do
+    def generate(self, prompt, timeout=None, json_mode=False):
+        text = super().generate(prompt, timeout=timeout, json_mode=json_mode)
+        record_usage(prompt_tokens=12, response_tokens=34)
+        return text
+
+
+class LLMMetricsTests(TestCase):
+    def setUp(self):
+        llm_metrics.reset()
+        self.addCleanup(llm_metrics.reset)
+        self.addCleanup(set_provider, None)
+
+    def test_calls_record_latency_sizes_and_tokens(self):
+        provider = TokenCountingProvider(responses=[{'match': '', 'response': 'twelve chars'}], latency=0.05)
+        with self.assertLogs('base.llm', 'DEBUG') as logs:
+            with track_request('test') as calls:
+                self.assertEqual(instrumented_generate(provider, 'Describe Rent', 'description'), 'twelve chars')
+
+        [call] = calls
+        self.assertEqual((call.kind, call.provider, call.outcome), ('description', 'fake', 'success'))
+        self.assertGreaterEqual(call.duration, 0.05)
+        self.assertEqual((call.prompt_chars, call.response_chars), (13, 12))
+        self.assertEqual((call.prompt_tokens, call.response_tokens), (12, 34))
+        self.assertIn("'prompt_tokens': 12", logs.output[0])
+
+        snapshot = llm_metrics.snapshot()
+        self.assertEqual(snapshot['tokens'], [{'kind': 'description', 'provider': 'fake', 'prompt': 12, 'response': 34}])
+        self.assertEqual(snapshot['duration_seconds'][0]['count'], 1)
+        self.assertGreaterEqual(snapshot['duration_seconds'][0]['sum'], 0.05)
+
+    def test_failed_calls_are_counted(self):
+        with track_request('test') as calls:
+            with self.assertRaises(LLMError):
+                instrumented_generate(FakeProvider(error_rate=1.0), 'Plan', 'categories', attempt=2)
+        self.assertEqual(calls[0].outcome, 'error')
+        self.assertEqual(llm_metrics.snapshot()['calls'], [{'kind': 'categories', 'provider': 'fake', 'outcome': 'error', 'count': 1}])
+        self.assertEqual(llm_metrics.snapshot()['tokens'], [])
+
+    def test_metrics_endpoint_is_admin_only(self):
+        set_provider(FakeProvider())
+        user = CustomUser.objects.create_user(email='owner@example.com', username='owner', password='Abcdef1@')
+        client = APIClient()
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/api/v1/metrics/llm/').status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = client.get('/api/v1/metrics/llm/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data), {'llm', 'description_cache'})
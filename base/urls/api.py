@@ -2,9 +2,11 @@ from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.views import APIView
+from django.db import transaction
 from django.utils import timezone
 from base.models import *
 from base.serializers import *
+from base.utils import NotOwned, bulk_update_stamped, get_owned, not_modified, set_validators, version_validators
 from rest_framework import generics
 from rest_framework.exceptions import PermissionDenied
 
@@ -39,13 +41,64 @@ class IncomeCreateView(APIView):
 
         serializer = IncomeSerializer(data=data)
         if serializer.is_valid():
-            serializer.save()
+            # The summary rows are updated by the save signal, in the same transaction
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 
-from django.db.models import Q, F
+import csv
+from rest_framework.parsers import JSONParser
+from base.imports import CSVParser, import_incomes
+
+
+class IncomeImportView(APIView):
+    """
+    Import many incomes in one request, either as a JSON array (or
+    {"incomes": [...]}) or as text/csv with amount, source, date_received
+    and description columns. The CSV body is read as it's validated and
+    inserted, so it can be much larger than the JSON one.
+
+    Nothing is saved if any row is invalid, unless ?skip_invalid=true.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, CSVParser]
+
+    def post(self, request, *args, **kwargs):
+        rows = request.data
+        if isinstance(rows, dict) and 'incomes' in rows:
+            rows = rows['incomes']
+        elif isinstance(rows, dict) and not rows:
+            # Empty body
+            rows = []
+        # A JSON list or the CSV parser's reader; anything else isn't rows
+        if not isinstance(rows, (list, csv.DictReader)):
+            return Response({'detail': 'Send a list of incomes, as the body or under "incomes".'}, status=status.HTTP_400_BAD_REQUEST)
+
+        skip_invalid = request.query_params.get('skip_invalid', '').lower() in ('1', 'true', 'yes')
+        try:
+            result = import_incomes(request.user, rows, skip_invalid=skip_invalid)
+        except (csv.Error, UnicodeDecodeError) as e:
+            return Response({'detail': f'Could not read the CSV: {e}'}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not result['rows']:
+            return Response({'detail': 'No incomes to import.'}, status=status.HTTP_400_BAD_REQUEST)
+        if result['failed'] and not skip_invalid:
+            return Response(result, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+
+
+from django.db.models import Count, Q, F, Max, Sum
+from django.db.models.functions import TruncMonth
+from datetime import datetime, timedelta
+from base.pagination import KeysetPagination
+from base.search import search
+from base.export import EXPORTS, stream_csv, stream_ndjson
+from django.http import StreamingHttpResponse
+from base.summaries import bulk_written, next_month, get_budget_summary, get_user_summary
 
 
 from rest_framework import generics
@@ -62,13 +115,23 @@ class UserIncomeListView(generics.ListAPIView):
 
     def get_queryset(self):
         name = self.request.query_params.get('name')
+        query = self.request.query_params.get('search')
         incomes = Income.objects.filter(user=self.request.user)
+        if query:
+            # Full-text search, best matches first
+            return search(incomes, query, self.request.user.id)
         if name:
             incomes = incomes.filter(Q(source__icontains=name) | Q(description__icontains=name))
-        return incomes
+        return incomes.order_by('-date_received', '-id')
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        # Search results are ordered by relevance, so only plain lists get cursors
+        if KeysetPagination.requested(request) and not request.query_params.get('search'):
+            paginator = KeysetPagination('date_received')
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -86,19 +149,14 @@ class UserIncomeListView(generics.ListAPIView):
 class UserIncomeUpdateView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get_object(self, pk):
+    def put(self, request, pk):
         try:
-            income = Income.objects.get(id=pk)
+            income = get_owned(Income.objects, pk, request.user)
         except Income.DoesNotExist:
             return Response({'detail': 'Income Entry Not Found.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if income.user != self.request.user:
+        except NotOwned:
             return Response({'detail': 'Access Denied !.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        return income
-
-    def put(self, request, pk):
-        income = self.get_object(pk)
         data = request.data.copy()
         
         # Check if the amount is within the specified range
@@ -114,7 +172,8 @@ class UserIncomeUpdateView(APIView):
         
         serializer = IncomeSerializer(income, data=data, partial=True)
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -134,27 +193,17 @@ from rest_framework.exceptions import PermissionDenied, NotFound
 class UserIncomeDeleteView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def get_object(self, pk):
+    def delete(self, request, pk):
         try:
-            income = Income.objects.get(id=pk)
+            income = get_owned(Income.objects, pk, request.user)
         except Income.DoesNotExist:
-            return Response({'detail': 'Not Found.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        if income.user != self.request.user:
+            return Response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except NotOwned:
             return Response({'detail': 'Access Denied.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        return income
+        income.delete()
 
-    def delete(self, request, pk):
-        income = get_object_or_404(Income, id=pk)
-        
-        if income.user == self.request.user:
-            income.delete()
-  
-            return Response({'detail': 'Deleted successfully.'}, status=status.HTTP_400_BAD_REQUEST)
-        else:
-
-            return Response({'detail': 'Access Denied.'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'detail': 'Deleted successfully.'}, status=status.HTTP_400_BAD_REQUEST)
 
 
 
@@ -178,25 +227,25 @@ class BudgetCreateView(APIView):
         income_id = data.get('income')
         
         try:
-            income = Income.objects.get(id=income_id)
-            
-            # Check if the income entry is already associated with a budget
-            if Budget.objects.filter(income=income).exists():
-                return Response({'detail': 'This income entry is already associated with a budget.'}, status=status.HTTP_400_BAD_REQUEST)
-            
             # Ensure the income entry belongs to the current user
-            if income.user != request.user:
-                return Response({'detail': 'You do not have permission to use this income entry.'}, status=status.HTTP_403_FORBIDDEN)
-            
-            # Automatically set the total_expenses to the income amount
-            data['total_expenses'] = income.amount
+            income = get_owned(Income.objects, income_id, request.user)
         except Income.DoesNotExist:
             return Response({'detail': 'Income entry not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except NotOwned:
+            return Response({'detail': 'You do not have permission to use this income entry.'}, status=status.HTTP_403_FORBIDDEN)
+
+        # Check if the income entry is already associated with a budget
+        if Budget.objects.filter(income=income).exists():
+            return Response({'detail': 'This income entry is already associated with a budget.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Automatically set the total_expenses to the income amount
+        data['total_expenses'] = income.amount
         
         serializer = BudgetSerializer(data=data)
         
         if serializer.is_valid():
-            serializer.save()
+            with transaction.atomic():
+                serializer.save()
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -214,12 +263,11 @@ class BudgetDeleteView(APIView):
 
     def delete(self, request, pk, *args, **kwargs):
         try:
-            budget = Budget.objects.get(pk=pk)
+            # The income comes along for the deletion tombstone, which records its owner
+            budget = get_owned(Budget.objects.select_related('income'), pk, request.user)
         except Budget.DoesNotExist:
             return Response({'detail': 'Budget not found.'}, status=status.HTTP_404_NOT_FOUND)
-        
-        income = budget.income
-        if income.user != request.user:
+        except NotOwned:
             return Response({'detail': 'You do not have permission to delete this budget.'}, status=status.HTTP_403_FORBIDDEN)
         
         budget.delete()
@@ -358,7 +406,27 @@ from rest_framework.response import Response
 from rest_framework.views import APIView
 from datetime import date
 from decimal import Decimal, InvalidOperation
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor, wait
+import contextvars
+import json
+import logging
+import math
+from base.description_cache import description_cache
+from base.allocation import rebalance_categories
+from base.llm import LLMError, get_provider
+from base.llm_metrics import instrumented_generate, llm_metrics, track_request
+from django.urls import reverse
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+# Bump when the description prompt changes so cached descriptions are regenerated
+DESCRIPTION_PROMPT_VERSION = 'v1'
+
+CATEGORY_PLAN_SCHEMA = json.dumps({
+    'categories': [{'name': 'string', 'amount': 'number', 'delete': 'boolean'}],
+})
 
 
 
@@ -369,10 +437,6 @@ import google.generativeai as genai
 class CategoryCreateView(APIView):
     permission_classes = [IsAuthenticated]
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        genai.configure(api_key=settings.GOOGLE_API_KEY)
-
     def post(self, request, *args, **kwargs):
         budget_id = request.data.get('budget')
         description = request.data.get('description')
@@ -381,22 +445,39 @@ class CategoryCreateView(APIView):
             return Response({'detail': 'Budget and description are required.'}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            budget = Budget.objects.get(id=budget_id)
+            budget = get_owned(Budget.objects, budget_id, request.user)
         except Budget.DoesNotExist:
             return Response({'detail': 'Budget not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        if budget.income.user != request.user:
+        except NotOwned:
             return Response({'detail': 'You do not have permission to create categories for this budget.'}, status=status.HTTP_403_FORBIDDEN)
 
+        # Opt-in async mode: queue the generation for the run_category_jobs worker
+        if str(request.data.get('async', request.query_params.get('async', ''))).lower() in ('1', 'true', 'yes'):
+            job = CategoryJob.objects.create(user=request.user, budget=budget, description=description)
+            return Response({
+                'job': job.id,
+                'status': job.status,
+                'status_url': reverse('category-job-detail', args=[job.id]),
+            }, status=status.HTTP_202_ACCEPTED)
+
+        return self.create_categories(request.user, budget, description)
+
+    def create_categories(self, user, budget, description):
+        with track_request(f'categories/create (budget {budget.id})'):
+            return self.generate_categories(user, budget, description)
+
+    def generate_categories(self, user, budget, description):
         # Fetch existing categories
         existing_categories = Category.objects.filter(budget=budget)
         existing_categories_text = "\n".join([f"{cat.name}: {cat.amount}" for cat in existing_categories])
         # print(f"these are the existing categories ....{existing_categories_text}") 
-        total_amount = Decimal('0.00')
         categories_data = []
 
-        while total_amount <= budget.total_expenses:
-            model = genai.GenerativeModel('gemini-1.0-pro-latest')
+        # Take the first usable answer and fix the total locally instead of
+        # asking Gemini again until the amounts happen to add up
+        provider = get_provider()
+        answered = False
+        for attempt in range(settings.CATEGORY_LLM_MAX_ATTEMPTS):
             prompt = f"""Update the following budget categories based on the description: '{description}'. 
             Do not generate new categories unless explicitly specified. 
             Ensure the total amount does not exceed {budget.total_expenses}. This is a very strict command: do not
@@ -405,137 +486,218 @@ class CategoryCreateView(APIView):
             Existing categories and amounts are:
             {existing_categories_text}
 
-            **Note:** VERY VERY IMOORTANT TO READ THIS !!!!!!!!!!!!!!!!!!!!!To delete a category, append the word "DELETE" to its end (e.g., "TransportDELETE: Amount").
+            **Note:** To delete a category, include it with "delete": true.
 
             **Note:** If there is any residual amount after updating existing categories, save it into a category called "Extra".
 
-            Return the data in the following format:
-            Category1: Amount1
-            Category2: Amount2
-            ...
-            CategoryN: AmountN
+            Return only JSON matching this schema:
+            {CATEGORY_PLAN_SCHEMA}
             """
-                        
-            
-            response = model.generate_content(prompt)
-
-            # Extract the text part of the response
-            if not hasattr(response, '_result'):
-                return Response({'detail': 'Error parsing Gemini response.'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-
-            response_text = response._result.candidates[0].content.parts[0].text
-            print("Response Text:", response_text)  # Debug print
-
-            # Parse the relevant portion
-            categories_data = []
-
-            lines = response_text.strip().split('\n')
-            for line in lines:
-                if ':' in line:
-                    try:
-                        name, amount_str = line.split(':')
-                        name = name.strip()
-                        amount = Decimal(amount_str.strip().strip('$'))
-                        categories_data.append({'name': name, 'amount': amount})
-                    except (InvalidOperation, AttributeError, ValueError) as e:
-                        print(f"Invalid amount format: {line} ({e})")
-                        continue
 
-            if not categories_data:
-                return Response({'detail': 'Error parsing Gemini response (no valid categories found).'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            try:
+                response_text = instrumented_generate(provider, prompt, 'categories', attempt=attempt + 1, json_mode=True)
+            except LLMError as e:
+                logger.warning("LLM call failed: %s", e)
+                continue
+            answered = True
 
-            total_amount = sum([cat['amount'] for cat in categories_data])
+            categories_data = self.parse_categories(response_text)
 
-            if total_amount == budget.total_expenses:
+            if categories_data:
                 break
 
-        updated_categories = []
-        marked_for_deletion = []
+        if not answered:
+            # Every provider failed or has its breaker open: an outage, not a bad answer
+            return Response(
+                {'detail': 'The AI service is unavailable right now. Please try again shortly.'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={'Retry-After': str(math.ceil(settings.LLM_BREAKER_RESET))},
+            )
+        if not categories_data:
+            return Response({'detail': 'Error parsing Gemini response (no valid categories found).'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+        categories_data = rebalance_categories(categories_data, budget.total_expenses)
+
+        # Look up existing categories by name instead of scanning the list per entry
+        existing_by_name = {}
+        for cat in existing_categories:
+            existing_by_name.setdefault(cat.name, cat)
+
+        # Work out every description this request needs and fetch them together
+        names_to_describe = []
+        for category_data in categories_data:
+            name = category_data['name']
+            if not category_data['delete']:
+                matching_category = existing_by_name.get(name)
+                if not matching_category or not matching_category.description:
+                    names_to_describe.append(name)
+            if 'savings' in name.lower():
+                names_to_describe.append(name)
+        descriptions = self.generate_descriptions(names_to_describe)
+
+        updated_categories = {}
+        new_categories = {}
+        marked_for_deletion = {}
 
         # Identify categories to be deleted and updated
         for category_data in categories_data:
             name = category_data['name']
             amount = category_data['amount']
-            if name.endswith('DELETE'):
-                name = name.replace('DELETE', '').strip()
-                category_data['name'] = name
-                matching_category = next((cat for cat in existing_categories if cat.name == name), None)
+            if category_data['delete']:
+                matching_category = existing_by_name.get(name)
                 if matching_category:
-                    matching_category.isDelete = True
-                    marked_for_deletion.append(matching_category)
+                    marked_for_deletion[matching_category.id] = matching_category
+                    updated_categories.pop(matching_category.id, None)
             else:
-                matching_category = next((cat for cat in existing_categories if cat.name == name), None)
+                matching_category = existing_by_name.get(name)
                 if matching_category:
+                    if matching_category.id in marked_for_deletion:
+                        continue
                     matching_category.amount = amount
                     if not matching_category.description:
-                        matching_category.description = self.generate_description(name)
-                    updated_categories.append(matching_category)
+                        matching_category.description = descriptions[name]
+                    updated_categories[matching_category.id] = matching_category
                 else:
-                    updated_categories.append(Category(
+                    new_categories[name] = Category(
                         name=name,
                         amount=amount,
                         budget=budget,
-                        description=self.generate_description(name),
-                        created_at=date.today()
-                    ))
+                        description=descriptions[name],
+                    )
+
+        # Apply the whole reconciliation as one unit with a fixed number of writes
+        with transaction.atomic():
+            if marked_for_deletion:
+                Category.objects.filter(id__in=list(marked_for_deletion)).delete()
+                logger.info("Deleted %s categories from budget %s", len(marked_for_deletion), budget.id)
 
-        # Save updated categories and mark for deletion
-        for category in marked_for_deletion:
-            print(f"Marking category for deletion: {category.name}")  # Debug print
-            category.save()
-            self.handle_savings_deletion(request.user, category)
-            category.delete()
-        print(f"Number of categories marked for deletion: {len(marked_for_deletion)}")
+            if updated_categories:
+                bulk_update_stamped(Category, updated_categories.values(), ['amount', 'description'])
+            if new_categories:
+                Category.objects.bulk_create(list(new_categories.values()))
 
-        for category in updated_categories:
-            category.save()
+            # Handle savings updates
+            self.handle_savings(user, categories_data, marked_for_deletion.values(), descriptions)
 
-        # Handle savings updates
-        self.handle_savings(request.user, categories_data)
+            bulk_written(user.id, [budget.id], savings_only=True)
 
         return Response({'detail': 'Categories updated successfully.'}, status=status.HTTP_200_OK)
 
-    def generate_description(self, category_name):
+    def parse_categories(self, response_text):
+        # Validate the structured answer, keeping every entry that passes the schema
+        text = response_text.strip()
+        if text.startswith('```'):
+            text = text.split('\n', 1)[-1].rsplit('```', 1)[0]
+        try:
+            payload = json.loads(text)
+        except ValueError as e:
+            logger.warning("Response is not valid JSON (%s)", e)
+            return []
+
+        entries = payload.get('categories') if isinstance(payload, dict) else payload
+        if not isinstance(entries, list):
+            logger.warning("Response JSON has no categories list")
+            return []
+
+        categories_data = []
+        for entry in entries:
+            serializer = CategoryAllocationSerializer(data=entry)
+            if serializer.is_valid():
+                categories_data.append(dict(serializer.validated_data))
+            else:
+                logger.warning("Invalid category entry: %s (%s)", entry, serializer.errors)
+        return categories_data
+
+    def generate_description(self, category_name, timeout=None):
         prompt = f"Generate a unique description for a budget category named '{category_name}'."
-        response = genai.GenerativeModel('gemini-1.0-pro-latest').generate_content(prompt)
-        if not hasattr(response, '_result'):
-            return "No description available."
-        
-        response_text = response._result.candidates[0].content.parts[0].text.strip()
+        response_text = instrumented_generate(get_provider(), prompt, 'description', timeout=timeout).strip()
         return response_text if response_text else "No description available."
 
-    def handle_savings(self, user, categories_data):
-        # Fetch all savings for the user
-        savings_objects = Savings.objects.filter(user=user)
+    def generate_descriptions(self, category_names):
+        # Run the description calls concurrently so the request waits for the
+        # slowest call instead of the sum of all of them
+        names = list(dict.fromkeys(category_names))
+        if not names:
+            return {}
+
+        # Most category names repeat across users, so serve what we can from the cache
+        descriptions = description_cache.get_many(names, DESCRIPTION_PROMPT_VERSION)
+        names = [name for name in names if name not in descriptions]
+        if not names:
+            return descriptions
+
+        concurrency = max(1, min(settings.CATEGORY_DESCRIPTION_CONCURRENCY, len(names)))
+        timeout = settings.CATEGORY_DESCRIPTION_TIMEOUT
+        executor = ThreadPoolExecutor(max_workers=concurrency)
+        futures = {
+            executor.submit(contextvars.copy_context().run, self.generate_description, name, timeout): name
+            for name in names
+        }
+
+        # Each call carries its own timeout; this deadline is only a backstop for queued calls
+        deadline = timeout * math.ceil(len(names) / concurrency) if timeout else None
+        done, _ = wait(futures, timeout=deadline)
+        executor.shutdown(wait=False, cancel_futures=True)
 
+        generated = {}
+        for future, name in futures.items():
+            if future in done and future.exception() is None:
+                generated[name] = future.result()
+            else:
+                logger.warning("Description generation failed for %s", name)
+                descriptions[name] = "No description available."
+
+        description_cache.set_many(
+            {name: text for name, text in generated.items() if text != "No description available."},
+            DESCRIPTION_PROMPT_VERSION
+        )
+        descriptions.update(generated)
+        return descriptions
+
+    def handle_savings(self, user, categories_data, deleted_categories, descriptions):
+        savings_data = {}
         for category_data in categories_data:
-            name = category_data['name']
-            amount = category_data.get('amount', None)
-            if 'savings' in name.lower():                # Check if a savings object with the same goal_name exists
-                savings_object = next((s for s in savings_objects if s.goal_name == name), None)
-                if savings_object:
-                    # Update existing savings object
-                    savings_object.amount_saved = amount
-                    savings_object.description = self.generate_description(name)
-                    savings_object.save()
-                else:
-                    # Create a new savings object
-                    Savings.objects.create(
-                        user=user,
-                        goal_name=name,
-                        target_amount=Decimal('0.00'),  # target_amount to be handled later
-                        amount_saved=amount,
-                        description=self.generate_description(name),
-                        created_at=date.today(),
-                        updated_at=date.today()
-                    )
+            if 'savings' in category_data['name'].lower():
+                savings_data[category_data['name']] = category_data.get('amount', None)
+        deleted_categories = list(deleted_categories)
+
+        # Fetch only the savings this request touches, keyed by goal name
+        names = set(savings_data) | {category.name for category in deleted_categories}
+        savings_by_name = {}
+        for savings_object in Savings.objects.filter(user=user, goal_name__in=names).order_by('id'):
+            savings_by_name.setdefault(savings_object.goal_name, savings_object)
+
+        changed_savings = {}
+        new_savings = []
+
+        # Deleted categories give their amount back from the matching savings goal
+        for category in deleted_categories:
+            savings_object = savings_by_name.get(category.name)
+            if savings_object:
+                savings_object.amount_saved -= category.amount
+                changed_savings[savings_object.id] = savings_object
+
+        for name, amount in savings_data.items():
+            savings_object = savings_by_name.get(name)
+            if savings_object:
+                # Update existing savings object
+                savings_object.amount_saved = amount
+                savings_object.description = descriptions.get(name, "No description available.")
+                changed_savings[savings_object.id] = savings_object
+            else:
+                # Create a new savings object
+                new_savings.append(Savings(
+                    user=user,
+                    goal_name=name,
+                    target_amount=Decimal('0.00'),  # target_amount to be handled later
+                    amount_saved=amount,
+                    description=descriptions.get(name, "No description available."),
+                ))
 
-    def handle_savings_deletion(self, user, category):
-        # Fetch the savings object
-        savings_object = Savings.objects.filter(user=user, goal_name=category.name).first()
-        if savings_object:
-            savings_object.amount_saved -= category.amount
-            savings_object.save()
+        if changed_savings:
+            bulk_update_stamped(Savings, changed_savings.values(), ['amount_saved', 'description'])
+        if new_savings:
+            Savings.objects.bulk_create(new_savings)
 
 
 
@@ -555,16 +717,20 @@ class BudgetDetailView(APIView):
 
     def get(self, request, pk, *args, **kwargs):
         try:
-            budget = Budget.objects.get(pk=pk)
+            budget = get_owned(Budget.objects, pk, request.user)
         except Budget.DoesNotExist:
             return Response({'detail': 'Budget not found.'}, status=status.HTTP_404_NOT_FOUND)
-        
-        income = budget.income
-        if income.user != request.user:
+        except NotOwned:
             return Response({'detail': 'You do not have permission to view this budget.'}, status=status.HTTP_403_FORBIDDEN)
-        
+
+        # Answer a client that already has this version before serializing anything
+        etag, last_modified = version_validators(budget.id, budget.updated_at)
+        unchanged = not_modified(request, etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+
         serializer = BudgetSerializer(budget)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, last_modified)
 
 
 
@@ -590,12 +756,10 @@ class BudgetUpdateView(APIView):
 
     def put(self, request, pk, *args, **kwargs):
         try:
-            budget = Budget.objects.get(pk=pk)
+            budget = get_owned(Budget.objects, pk, request.user)
         except Budget.DoesNotExist:
             return Response({'detail': 'Budget not found.'}, status=status.HTTP_404_NOT_FOUND)
-        
-        income = budget.income
-        if income.user != request.user:
+        except NotOwned:
             return Response({'detail': 'You do not have permission to edit this budget.'}, status=status.HTTP_403_FORBIDDEN)
         
         data = request.data.copy()
@@ -624,19 +788,43 @@ class BudgetUpdateView(APIView):
 
 
 class UserIncomeDetailView(APIView):
+    """
+    An income with its budget and the budget's categories.
+
+    The response is versioned by the income's and budget's updated_at plus
+    the categories' newest updated_at and their count (so a deleted
+    category changes it too). A conditional GET checks that version with
+    one aggregate query and answers 304 without loading or serializing
+    the rows. Only an ETag is sent: no single timestamp moves when a
+    category is deleted, so Last-Modified could answer 304 for a stale
+    copy.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, pk):
+        if 'HTTP_IF_NONE_MATCH' in request.META:
+            version = (
+                Income.objects.owned_by(request.user).filter(pk=pk)
+                .values_list('id', 'updated_at', 'budget__updated_at')
+                .annotate(categories_updated=Max('budget__category__updated_at'), category_count=Count('budget__category'))
+                .first()
+            )
+            # Missing or not theirs: the normal lookup below gives the right error
+            if version is not None:
+                etag, _ = version_validators(*version)
+                unchanged = not_modified(request, etag)
+                if unchanged is not None:
+                    return unchanged
+
         try:
-            income = Income.objects.get(id=pk)
+            income = get_owned(Income.objects.select_related('budget'), pk, request.user)
         except Income.DoesNotExist:
             return Response({'detail': 'Income not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        if income.user != request.user:
+        except NotOwned:
             raise PermissionDenied("You do not have permission to access this income entry.")
 
-        budget = Budget.objects.get(income=income)
-        categories = Category.objects.filter(budget=budget)
+        budget = getattr(income, 'budget', None)
+        categories = list(Category.objects.filter(budget=budget)) if budget else []
 
         income_serializer = IncomeSerializer(income, many=False)
         budget_serializer = BudgetSerializer(budget, many=False)
@@ -644,11 +832,295 @@ class UserIncomeDetailView(APIView):
 
         response_data = {
             'income': income_serializer.data,
-            'budget': budget_serializer.data,
+            'budget': budget_serializer.data if budget else None,
             'categories': categories_serializer.data,
         }
 
-        return Response(response_data, status=status.HTTP_200_OK) 
+        # Same parts, in the same order, as the aggregate above
+        etag, _ = version_validators(
+            income.id,
+            income.updated_at,
+            budget.updated_at if budget else None,
+            max((category.updated_at for category in categories), default=None),
+            len(categories),
+        )
+        return set_validators(Response(response_data, status=status.HTTP_200_OK), etag) 
+
+
+
+
+
+class DashboardView(generics.ListAPIView):
+    # Every income with its budget and categories nested, newest first. Each page
+    # costs two queries however many incomes and categories it holds.
+    permission_classes = [IsAuthenticated]
+    serializer_class = DashboardIncomeSerializer
+
+    def get_queryset(self):
+        return (
+            Income.objects.owned_by(self.request.user)
+            .select_related('budget')
+            .prefetch_related('budget__category_set')
+        )
+
+    def list(self, request, *args, **kwargs):
+        paginator = KeysetPagination('date_received')
+        page = paginator.paginate_queryset(self.get_queryset(), request, view=self)
+        return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
+
+
+
+
+class UserSummaryView(APIView):
+    # Totals come from the summary rows, so this never reads the user's history
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        summary = get_user_summary(request.user)
+        this_month = timezone.now().date().replace(day=1)
+        months = list(
+            MonthlyIncomeSummary.objects.filter(user=request.user, income_count__gt=0)
+            .order_by('-month')[:12]
+        )
+        current = next((month for month in months if month.month == this_month), None)
+
+        return Response({
+            'total_income': summary.total_income,
+            'income_count': summary.income_count,
+            'income_this_month': current.total_income if current else Decimal('0.00'),
+            'total_saved': summary.total_saved,
+            'total_target': summary.total_target,
+            'savings_count': summary.savings_count,
+            'months': [
+                {'month': month.month, 'total_income': month.total_income, 'income_count': month.income_count}
+                for month in months
+            ],
+        }, status=status.HTTP_200_OK)
+
+
+
+
+
+class BudgetSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            budget = get_owned(Budget.objects.select_related('summary'), pk, request.user)
+        except Budget.DoesNotExist:
+            return Response({'detail': 'Budget not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except NotOwned:
+            return Response({'detail': 'You do not have permission to view this budget.'}, status=status.HTTP_403_FORBIDDEN)
+
+        summary = get_budget_summary(budget)
+        return Response({
+            'budget': budget.id,
+            'total_expenses': budget.total_expenses,
+            'allocated': summary.allocated,
+            'unallocated': budget.total_expenses - summary.allocated,
+            'category_count': summary.category_count,
+        }, status=status.HTTP_200_OK)
+
+
+
+
+
+class AnalyticsView(APIView):
+    """
+    Month-by-month income, budget allocation by category and savings
+    progress for ?start=YYYY-MM&end=YYYY-MM (inclusive, default the last 12
+    months), aggregated in the database and returned as parallel arrays.
+
+    Monthly income comes from the maintained MonthlyIncomeSummary rows, so
+    its cost depends on the number of months, not on how many incomes the
+    user has. Budgets and categories (one budget per income at most) are
+    aggregated directly.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            start, end = self.get_range(request)
+        except ValueError:
+            return Response({'detail': 'start and end must be months formatted as YYYY-MM.'}, status=status.HTTP_400_BAD_REQUEST)
+        if start >= end:
+            return Response({'detail': 'start must not be after end.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+
+        # Builds the monthly rows once for users whose summaries predate them
+        get_user_summary(user)
+        income = (
+            MonthlyIncomeSummary.objects.filter(user=user, month__gte=start, month__lt=end, income_count__gt=0)
+            .order_by('month')
+            .values('month', 'total_income', 'income_count')
+        )
+        # Finding the user's budgets goes through their incomes, so do it once
+        # and aggregate the categories by budget id from there
+        budgets = list(
+            Budget.objects.owned_by(user).filter(start_date__gte=start, start_date__lt=end)
+            .annotate(month=TruncMonth('start_date'))
+            .values_list('id', 'month', 'total_expenses')
+        )
+        budget_ids = [budget_id for budget_id, _, _ in budgets]
+        allocated_by_budget = dict(
+            Category.objects.filter(budget_id__in=budget_ids)
+            .values('budget_id')
+            .annotate(total=Sum('amount'))
+            .values_list('budget_id', 'total')
+        )
+        categories = list(
+            Category.objects.filter(budget_id__in=budget_ids)
+            .values('name')
+            .annotate(total=Sum('amount'), budgets=Count('budget', distinct=True))
+            .order_by('-total', 'name')
+        )
+        savings = list(Savings.objects.filter(user=user).order_by('goal_name').values_list('goal_name', 'amount_saved', 'target_amount'))
+        income = list(income)
+
+        # Roll the per-budget numbers up to months
+        months = {}
+        for budget_id, month, total_expenses in budgets:
+            totals = months.setdefault(month, [Decimal('0.00'), Decimal('0.00')])
+            totals[0] += total_expenses
+            totals[1] += allocated_by_budget.get(budget_id) or Decimal('0.00')
+        budget_months = sorted(months)
+
+        return Response({
+            'start': start.strftime('%Y-%m'),
+            'end': (end - timedelta(days=1)).strftime('%Y-%m'),
+            'income': {
+                'months': [row['month'].strftime('%Y-%m') for row in income],
+                'totals': [row['total_income'] for row in income],
+                'counts': [row['income_count'] for row in income],
+            },
+            'budgets': {
+                'months': [month.strftime('%Y-%m') for month in budget_months],
+                'total_expenses': [months[month][0] for month in budget_months],
+                'allocated': [months[month][1] for month in budget_months],
+            },
+            'categories': {
+                'names': [row['name'] for row in categories],
+                'allocated': [row['total'] or Decimal('0.00') for row in categories],
+                'budgets': [row['budgets'] for row in categories],
+            },
+            'savings': {
+                'goals': [goal for goal, _, _ in savings],
+                'saved': [saved for _, saved, _ in savings],
+                'targets': [target for _, _, target in savings],
+                'progress': [round(saved / target, 4) if target else None for _, saved, target in savings],
+            },
+        }, status=status.HTTP_200_OK)
+
+    def get_range(self, request):
+        # [start, end) as the first day of the first month and of the month after the last
+        end = next_month(self.parse_month(request.query_params.get('end')) or timezone.now().date().replace(day=1))
+        start = self.parse_month(request.query_params.get('start')) or date(end.year - 1, end.month, 1)
+        return start, end
+
+    def parse_month(self, value):
+        if not value:
+            return None
+        return datetime.strptime(value, '%Y-%m').date()
+
+
+
+
+class ExportView(APIView):
+    """
+    Stream the user's full history as ?output=ndjson (default, every record
+    type, one JSON object per line tagged with its type) or ?output=csv (one
+    record type per file, picked with ?type=income|budgets|categories|savings).
+    ?type also narrows an NDJSON export.
+
+    Rows are read in chunks straight off the database cursor and written as
+    they arrive, so memory stays flat however many rows the user has. The
+    query param is `output` because DRF keeps `format` for renderer selection.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        output = request.query_params.get('output', 'ndjson')
+        record_type = request.query_params.get('type')
+        if output not in ('csv', 'ndjson'):
+            return Response({'detail': 'output must be csv or ndjson.'}, status=status.HTTP_400_BAD_REQUEST)
+        if record_type is not None and record_type not in EXPORTS:
+            return Response({'detail': f'type must be one of {", ".join(EXPORTS)}.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        stamp = timezone.now().strftime('%Y%m%d')
+        if output == 'csv':
+            record_type = record_type or 'income'
+            response = StreamingHttpResponse(stream_csv(request.user, record_type), content_type='text/csv; charset=utf-8')
+            filename = f'bridger-{record_type}-{stamp}.csv'
+        else:
+            record_types = [record_type] if record_type else list(EXPORTS)
+            response = StreamingHttpResponse(stream_ndjson(request.user, record_types), content_type='application/x-ndjson')
+            filename = f'bridger-export-{stamp}.ndjson'
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        # Stop proxies from buffering the whole export before passing it on
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+
+
+
+from base.sync import ExpiredCursor, InvalidCursor, changes_since
+
+
+class SyncView(APIView):
+    """
+    Incremental sync for offline clients. The first call (no cursor)
+    returns every income, budget and savings goal; each response carries a
+    cursor, and calling again with ?cursor= returns only rows changed since,
+    plus the ids deleted since under "deleted". Keep calling while has_more
+    is true. A cursor older than SYNC_TOMBSTONE_DAYS gets 410 and the client
+    starts over without one.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            data = changes_since(request.user, request.query_params.get('cursor'))
+        except InvalidCursor:
+            return Response({'detail': 'Invalid cursor.'}, status=status.HTTP_400_BAD_REQUEST)
+        except ExpiredCursor:
+            return Response({'detail': 'Cursor expired, sync again without one.'}, status=status.HTTP_410_GONE)
+        return Response(data, status=status.HTTP_200_OK)
+
+
+
+
+from base.batch import run_batch
+
+
+class BatchView(APIView):
+    """
+    Run several API calls in one round trip:
+
+        {"atomic": true, "requests": [
+            {"id": "income", "method": "POST", "path": "income/", "body": {...}},
+            {"method": "POST", "path": "budget/create/", "body": {"income": "${income.id}", ...}},
+            {"method": "GET", "path": "income/${income.id}/"}
+        ]}
+
+    Requests run in order through the normal views, as the calling user.
+    Paths are relative to /api/v1/. ${id.field} in a path or body is replaced
+    with that field of an earlier request's response. The batch stops at the
+    first failure, and with "atomic" everything before it is rolled back too.
+    """
+    permission_classes = [IsAuthenticated]
+    batchable = False
+
+    def post(self, request):
+        operations = request.data.get('requests') if isinstance(request.data, dict) else None
+        if not isinstance(operations, list) or not operations:
+            return Response({'detail': 'Send a non-empty list of requests.'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(operations) > settings.BATCH_MAX_REQUESTS:
+            return Response({'detail': f'A batch can hold at most {settings.BATCH_MAX_REQUESTS} requests.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        atomic = str(request.data.get('atomic', '')).lower() in ('1', 'true', 'yes')
+        return Response(run_batch(request, operations, atomic=atomic), status=status.HTTP_200_OK)
 
 
 
@@ -659,12 +1131,10 @@ class CategoryUpdateView(APIView):
 
     def put(self, request, pk):
         try:
-            category = Category.objects.get(id=pk)
+            category = get_owned(Category.objects, pk, request.user)
         except Category.DoesNotExist:
             return Response({'detail': 'Category not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        budget = category.budget
-        if budget.income.user != request.user:
+        except NotOwned:
             raise PermissionDenied("You do not have permission to update this category.")
 
         data = request.data
@@ -678,6 +1148,138 @@ class CategoryUpdateView(APIView):
 
 
 
+from base.summaries import compute_budget, store_budget_summary
+
+
+class CategoryBulkUpdateView(APIView):
+    """
+    Edit many categories of one budget at once:
+
+        {"categories": [{"id": 4, "name": "Groceries", "amount": "350.00"}, ...]}
+
+    Each entry may change name, description and amount. Ownership is checked
+    once for the budget, the rows are written with one bulk_update, and if
+    any amount changed the budget's categories must still add up to its
+    total_expenses. Any error leaves every category as it was.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def patch(self, request, pk):
+        changes = request.data.get('categories') if isinstance(request.data, dict) else request.data
+        if not isinstance(changes, list) or not changes:
+            return Response({'detail': 'Send a non-empty list of categories.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            try:
+                # Locking the budget serialises concurrent edits of its categories
+                budget = get_owned(Budget.objects.select_for_update(), pk, request.user)
+            except Budget.DoesNotExist:
+                return Response({'detail': 'Budget not found.'}, status=status.HTTP_404_NOT_FOUND)
+            except NotOwned:
+                return Response({'detail': 'You do not have permission to update this budget.'}, status=status.HTTP_403_FORBIDDEN)
+
+            ids = [change.get('id') for change in changes if isinstance(change, dict)]
+            categories = Category.objects.filter(budget=budget, id__in=[i for i in ids if self.is_id(i)]).in_bulk()
+
+            errors, fields, renamed_savings = self.apply_changes(changes, categories)
+            if errors:
+                return Response({'detail': 'No categories were updated.', 'errors': errors}, status=status.HTTP_400_BAD_REQUEST)
+
+            updated = [categories[change['id']] for change in changes]
+            if fields:
+                bulk_update_stamped(Category, updated, sorted(fields))
+
+            # One aggregate both checks the allocation and refreshes the summary
+            totals = compute_budget(budget.id)
+            if 'amount' in fields and totals['allocated'] != budget.total_expenses:
+                transaction.set_rollback(True)
+                return Response({
+                    'detail': f'Category amounts add up to {totals["allocated"]}, they must add up to the budget total of {budget.total_expenses}.',
+                }, status=status.HTTP_400_BAD_REQUEST)
+            store_budget_summary(budget.id, totals)
+
+            if renamed_savings:
+                self.sync_savings(request.user, renamed_savings)
+
+        return Response({
+            'budget': budget.id,
+            'total_expenses': budget.total_expenses,
+            'allocated': totals['allocated'],
+            'categories': CategorySerializer(updated, many=True).data,
+        }, status=status.HTTP_200_OK)
+
+    @staticmethod
+    def is_id(value):
+        # JSON true/false arrive as bools, which are ints (and equal 1 and 0) to Python
+        return isinstance(value, int) and not isinstance(value, bool)
+
+    def apply_changes(self, changes, categories):
+        errors = []
+        fields = set()
+        # Savings categories keep their goal in step: {old name: (new name, amount)}
+        savings = {}
+        seen = set()
+        for index, change in enumerate(changes):
+            if not isinstance(change, dict):
+                errors.append({'index': index, 'errors': {'non_field_errors': 'Expected an object with an id.'}})
+                continue
+            if not self.is_id(change.get('id')):
+                errors.append({'index': index, 'id': change.get('id'), 'errors': {'id': 'A valid integer is required.'}})
+                continue
+            category = categories.get(change['id'])
+            if category is None or change['id'] in seen:
+                detail = 'Category listed twice.' if category is not None else 'Category not found in this budget.'
+                errors.append({'index': index, 'id': change.get('id'), 'errors': {'id': detail}})
+                continue
+            seen.add(change['id'])
+
+            row_errors = {}
+            old_name = category.name
+            if 'name' in change:
+                name = str(change['name'] or '').strip()
+                if not name:
+                    row_errors['name'] = 'This field may not be blank.'
+                elif len(name) > 255:
+                    row_errors['name'] = 'Ensure this field has no more than 255 characters.'
+                elif name != category.name:
+                    category.name = name
+                    fields.add('name')
+            if 'description' in change and change['description'] != category.description:
+                category.description = change['description']
+                fields.add('description')
+            if 'amount' in change:
+                try:
+                    amount = Decimal(str(change['amount']))
+                except InvalidOperation:
+                    amount = None
+                if amount is None or not amount.is_finite() or amount < 0:
+                    row_errors['amount'] = 'Enter a valid amount.'
+                elif amount != amount.quantize(Decimal('0.01')) or amount >= Decimal('100000000'):
+                    row_errors['amount'] = 'Ensure that there are no more than 10 digits in total and 2 decimal places.'
+                elif amount != category.amount:
+                    category.amount = amount
+                    fields.add('amount')
+
+            if row_errors:
+                errors.append({'index': index, 'id': category.id, 'errors': row_errors})
+            elif 'savings' in old_name.lower() and (category.name != old_name or 'amount' in change):
+                savings[old_name] = (category.name, category.amount)
+        return errors, fields, savings
+
+    def sync_savings(self, user, renamed_savings):
+        # Same rule as category generation: a savings category's amount is what the goal has saved
+        goals = list(Savings.objects.filter(user=user, goal_name__in=list(renamed_savings)))
+        for goal in goals:
+            goal.goal_name, amount = renamed_savings[goal.goal_name]
+            if amount is not None:
+                goal.amount_saved = amount
+        if goals:
+            bulk_update_stamped(Savings, goals, ['goal_name', 'amount_saved'])
+            bulk_written(user.id, savings_only=True)
+
+
+
+
 
 
 
@@ -695,11 +1297,10 @@ class SavingsUpdateView(APIView):
 
     def put(self, request, pk):
         try:
-            savings = Savings.objects.get(id=pk)
+            savings = get_owned(Savings.objects, pk, request.user)
         except Savings.DoesNotExist:
             return Response({'detail': 'Savings entry not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        if savings.user != request.user:
+        except NotOwned:
             raise PermissionDenied("You do not have permission to update this savings entry.")
 
         data = request.data
@@ -722,19 +1323,17 @@ class SavingsUpdateView(APIView):
                 return Response({'detail': 'You can\'t set the target below the amount already saved.'}, status=status.HTTP_400_BAD_REQUEST)
 
         # Check if a matching category exists and is owned by the same user
-        matching_category = Category.objects.filter(
-            budget__income__user=request.user,
-            name=savings.goal_name
-        ).first()
-
-        if matching_category:
-            matching_category.name = goal_name
-            matching_category.save()
+        matching_category = Category.objects.owned_by(request.user).filter(name=savings.goal_name).first()
 
         savings.goal_name = goal_name
         savings.target_amount = target_amount
         savings.description = description
-        savings.save()
+
+        with transaction.atomic():
+            if matching_category:
+                matching_category.name = goal_name
+                matching_category.save()
+            savings.save()
 
         serializer = SavingsSerializer(savings)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -753,13 +1352,21 @@ class UserSavingsListView(generics.ListAPIView):
 
     def get_queryset(self):
         name = self.request.query_params.get('goal_name')
+        query = self.request.query_params.get('search')
         savings = Savings.objects.filter(user=self.request.user)
+        if query:
+            return search(savings, query, self.request.user.id)
         if name:
             savings = savings.filter(Q(goal_name__icontains=name))
-        return savings
+        return savings.order_by('-created_at', '-id')
 
     def list(self, request, *args, **kwargs):
         queryset = self.get_queryset()
+        if KeysetPagination.requested(request) and not request.query_params.get('search'):
+            paginator = KeysetPagination('created_at')
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            return paginator.get_paginated_response(self.get_serializer(page, many=True).data)
+
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = self.get_serializer(page, many=True)
@@ -782,15 +1389,19 @@ class UserSavingsDetailView(APIView):
 
     def get(self, request, pk):
         try:
-            savings = Savings.objects.get(id=pk)
+            savings = get_owned(Savings.objects, pk, request.user)
         except Savings.DoesNotExist:
             return Response({'detail': 'Savings entry not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        if savings.user != request.user:
+        except NotOwned:
             raise PermissionDenied("You do not have permission to access this savings entry.")
 
+        etag, last_modified = version_validators(savings.id, savings.updated_at)
+        unchanged = not_modified(request, etag, last_modified)
+        if unchanged is not None:
+            return unchanged
+
         serializer = SavingsSerializer(savings)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return set_validators(Response(serializer.data, status=status.HTTP_200_OK), etag, last_modified)
 
 
 
@@ -801,37 +1412,72 @@ class SavingsDeleteView(APIView):
 
     def delete(self, request, pk):
         try:
-            savings = Savings.objects.get(id=pk)
+            savings = get_owned(Savings.objects, pk, request.user)
         except Savings.DoesNotExist:
             return Response({'detail': 'Savings entry not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-        if savings.user != request.user:
+        except NotOwned:
             raise PermissionDenied("You do not have permission to delete this savings entry.")
 
         goal_name = savings.goal_name
 
         # Find matching category
-        matching_categories = Category.objects.filter(name=goal_name, budget__income__user=request.user)
+        matching_categories = Category.objects.owned_by(request.user).filter(name=goal_name).select_related('budget')
 
-        for category in matching_categories:
-            budget = category.budget
+        # The category moves, the delete and the summary updates commit together
+        with transaction.atomic():
+            for category in matching_categories:
+                budget = category.budget
 
-            # Check for existing 'Extra' category in the same budget
-            extra_category, created = Category.objects.get_or_create(
-                budget=budget,
-                name='Extra',
-                defaults={'description': 'Extra funds', 'amount': Decimal('0.00')}
-            )
+                # Check for existing 'Extra' category in the same budget
+                extra_category, created = Category.objects.get_or_create(
+                    budget=budget,
+                    name='Extra',
+                    defaults={'description': 'Extra funds', 'amount': Decimal('0.00')}
+                )
 
-            # Transfer amount from the matched category to the 'Extra' category
-            extra_category.amount += category.amount
-            extra_category.save()
+                # Transfer amount from the matched category to the 'Extra' category
+                extra_category.amount += category.amount
+                extra_category.save()
 
-            # Delete the matched category
-            category.delete()
+                # Delete the matched category
+                category.delete()
 
-        # Finally, delete the savings object
-        savings.delete()
+            # Finally, delete the savings object
+            savings.delete()
 
         return Response({'detail': 'Savings and associated categories deleted successfully.'}, status=status.HTTP_200_OK)
 
+
+
+
+class CategoryJobDetailView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pk):
+        try:
+            job = get_owned(CategoryJob.objects, pk, request.user)
+        except CategoryJob.DoesNotExist:
+            return Response({'detail': 'Job not found.'}, status=status.HTTP_404_NOT_FOUND)
+        except NotOwned:
+            raise PermissionDenied("You do not have permission to view this job.")
+
+        serializer = CategoryJobSerializer(job)
+        return Response(serializer.data, status=status.HTTP_200_OK)
+
+
+
+
+from rest_framework.permissions import IsAdminUser
+
+class LLMMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        provider = get_provider()
+        data = {
+            'llm': llm_metrics.snapshot(),
+            'description_cache': description_cache.stats(),
+        }
+        if hasattr(provider, 'stats'):
+            data['providers'] = provider.stats()
+        return Response(data, status=status.HTTP_200_OK)
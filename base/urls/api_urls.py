@@ -6,13 +6,24 @@ urlpatterns = [
 
 
     path('categories/create/', CategoryCreateView.as_view(), name = "make-categories"),
+    path('categories/jobs/<int:pk>/', CategoryJobDetailView.as_view(), name='category-job-detail'),
+    path('metrics/llm/', LLMMetricsView.as_view(), name='llm-metrics'),
 
     path('budget/create/', BudgetCreateView.as_view(), name='budget-create'),
     path('income/', IncomeCreateView.as_view(), name='income-create'),
     path('income/list/', UserIncomeListView.as_view(), name='user-income-list'),
+    path('income/import/', IncomeImportView.as_view(), name='income-import'),
     path('savings/', UserSavingsListView.as_view(), name='user-savings-list'),
     path('savings/<int:pk>/', UserSavingsDetailView.as_view(), name='user-savings-detail'),
 
+    path('dashboard/', DashboardView.as_view(), name='dashboard'),
+    path('summary/', UserSummaryView.as_view(), name='user-summary'),
+    path('analytics/', AnalyticsView.as_view(), name='analytics'),
+    path('export/', ExportView.as_view(), name='export'),
+    path('batch/', BatchView.as_view(), name='batch'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('budget/<int:pk>/summary/', BudgetSummaryView.as_view(), name='budget-summary'),
+    path('budget/<int:pk>/categories/', CategoryBulkUpdateView.as_view(), name='category-bulk-update'),
     path('income/<str:pk>/', UserIncomeDetailView.as_view(), name='user-income-detail'),
     path('budget/<int:pk>/', BudgetDetailView.as_view(), name='budget-detail'),
     path('category/<int:pk>/update/', CategoryUpdateView.as_view(), name='category-update'),
@@ -1,17 +1,171 @@
-from django.core.mail import EmailMessage
+from django.core.mail import EmailMessage, get_connection
+import hashlib
 import random
+import time
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from django.conf import settings
+from django.utils import timezone
 from django.contrib.sites.shortcuts import get_current_site
+from .models import EmailOutbox
 
 
 
 
 
-def send_normal_email(data):
-    email=EmailMessage(
+def build_email(data, connection=None):
+    return EmailMessage(
         subject=data['email_subject'],
         body=data['email_body'],
-        from_email=settings.EMAIL_HOST_USER,
-        to=[data['to_email']]
+        from_email=data.get('from_email') or settings.EMAIL_HOST_USER,
+        to=[data['to_email']],
+        connection=connection
+    )
+
+
+def send_normal_email(data, connection=None):
+    build_email(data, connection).send()
+
+
+def send_bulk_email(messages, batch_size=None, rate=None, backend=None, on_result=None, **connection_kwargs):
+    """
+    Send many emails over as few SMTP sessions as possible.
+
+    `messages` is any iterable of the dicts send_normal_email takes and is
+    consumed lazily, so a generator over a queryset works. The session is
+    reopened every `batch_size` messages and after a failure, and sends are
+    paced to `rate` messages per second when it's set. Returns per-message
+    results (in input order) along with throughput numbers; if a session
+    can't be opened, the messages not sent yet are reported as failed rather
+    than raising. `on_result` is called with each result as soon as it's
+    known. `backend` and any extra keyword arguments are passed to
+    get_connection().
+    """
+    batch_size = batch_size or settings.EMAIL_BULK_BATCH_SIZE
+    rate = settings.EMAIL_BULK_RATE if rate is None else rate
+
+    messages = iter(messages)
+    results = []
+    sent = 0
+    sessions = 0
+    connection = None
+    in_session = 0
+    start = time.perf_counter()
+
+    def report(index, data, error=None):
+        result = {'index': index, 'to_email': data.get('to_email'), 'sent': error is None, 'error': error}
+        results.append(result)
+        if on_result:
+            on_result(result)
+
+    try:
+        for index, data in enumerate(messages):
+            if rate:
+                wait = start + index / rate - time.perf_counter()
+                if wait > 0:
+                    time.sleep(wait)
+
+            if connection is None:
+                try:
+                    connection = get_connection(backend, **connection_kwargs)
+                    connection.open()
+                except Exception as e:
+                    # Without a session nothing else can go out either
+                    connection = None
+                    report(index, data, str(e))
+                    for rest, rest_data in enumerate(messages, start=index + 1):
+                        report(rest, rest_data, str(e))
+                    break
+                sessions += 1
+                in_session = 0
+
+            try:
+                build_email(data, connection).send()
+            except Exception as e:
+                report(index, data, str(e))
+                # The session may be broken, start a fresh one for the next message
+                connection.close()
+                connection = None
+                continue
+
+            sent += 1
+            in_session += 1
+            report(index, data)
+
+            if in_session >= batch_size:
+                connection.close()
+                connection = None
+    finally:
+        if connection is not None:
+            connection.close()
+
+    seconds = time.perf_counter() - start
+    return {
+        'results': results,
+        'total': len(results),
+        'sent': sent,
+        'failed': len(results) - sent,
+        'sessions': sessions,
+        'seconds': round(seconds, 3),
+        'messages_per_second': round(len(results) / seconds, 1) if seconds else 0.0,
+    }
+
+
+class NotOwned(Exception):
+    pass
+
+
+def get_owned(queryset, pk, user):
+    # Fetch the object with the ownership check in the same query. Only a miss
+    # costs a second query, to tell a missing object (DoesNotExist) from
+    # somebody else's (NotOwned).
+    model = queryset.model
+    try:
+        return queryset.owned_by(user).get(pk=pk)
+    except model.DoesNotExist:
+        if model._default_manager.filter(pk=pk).exists():
+            raise NotOwned()
+        raise
+
+
+def bulk_update_stamped(model, objs, fields):
+    # bulk_update skips auto_now, so stamp updated_at on the rows ourselves
+    objs = list(objs)
+    now = timezone.now()
+    for obj in objs:
+        obj.updated_at = now
+    model.objects.bulk_update(objs, [*fields, 'updated_at'])
+
+
+def version_validators(*parts):
+    # ETag from every part of a response's version, Last-Modified from the newest timestamp in it
+    etag = quote_etag(hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest())
+    timestamps = [part for part in parts if hasattr(part, 'timestamp')]
+    return etag, max(timestamps) if timestamps else None
+
+
+def not_modified(request, etag, last_modified=None):
+    # A 304 when the client's If-None-Match / If-Modified-Since says it has this version, else None
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None
+    )
+    return set_validators(response, etag, last_modified) if response is not None else None
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+def queue_email(data):
+    # Store the email in the outbox instead of talking to SMTP inside the request.
+    # Call this inside the same transaction as the change that triggers the email;
+    # the send_outbox worker delivers it.
+    return EmailOutbox.objects.create(
+        subject=data['email_subject'],
+        body=data['email_body'],
+        to_email=data['to_email'],
+        from_email=data.get('from_email') or settings.EMAIL_HOST_USER,
     )
-    email.send()
\ No newline at end of file
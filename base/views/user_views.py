@@ -4,7 +4,7 @@ from rest_framework.decorators import permission_classes
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from rest_framework import generics
 from ..serializers import *
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from rest_framework.pagination import PageNumberPagination
 from rest_framework import status
 from django.contrib.auth.hashers import make_password
@@ -136,25 +136,27 @@ class RegisterUser(APIView):
 
         # Create user
         try:
-            user = Userr.objects.create_user(
-                first_name=data['name'],
-                username=data['email'],
-                email=data['email'],
-                password=data['password'],
-            )
-
-
-
-
-            email_body = f"Hi {user.first_name}, Welcome To Gallery The Best Social App ! Remember To Leave A Review On Your Experience."
-            email_subject = "WELCOME HOME"
-            to_email = user.email
-            data = {
-                'email_body': email_body,
-                'email_subject': email_subject,
-                'to_email': to_email
-            }
-            send_normal_email(data)
+            # The welcome email is queued in the same transaction as the new user
+            with transaction.atomic():
+                user = Userr.objects.create_user(
+                    first_name=data['name'],
+                    username=data['email'],
+                    email=data['email'],
+                    password=data['password'],
+                )
+
+
+
+
+                email_body = f"Hi {user.first_name}, Welcome To Gallery The Best Social App ! Remember To Leave A Review On Your Experience."
+                email_subject = "WELCOME HOME"
+                to_email = user.email
+                data = {
+                    'email_body': email_body,
+                    'email_subject': email_subject,
+                    'to_email': to_email
+                }
+                queue_email(data)
         except IntegrityError:
             message = {'detail': 'User with this email already exists.'}
             return Response(message, status=status.HTTP_400_BAD_REQUEST)
@@ -240,11 +240,61 @@ STATIC_URL = 'static/'
 # settings.py
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 
+# JSON output mode for category generation needs a Gemini 1.5 family model
+GEMINI_MODEL = os.getenv('GEMINI_MODEL', 'gemini-1.5-flash')
+
+# LLM backend for category generation: 'gemini', 'openai', or 'fake' for offline development and
+# benchmarks. A comma separated list (e.g. 'gemini,openai') routes between providers by recent
+# latency, with fallback, circuit breakers and optional hedged requests.
+LLM_PROVIDER = os.getenv('LLM_PROVIDER', 'gemini')
+LLM_PROVIDER_TIMEOUTS = {
+    'gemini': float(os.getenv('GEMINI_TIMEOUT', 20)),
+    'openai': float(os.getenv('OPENAI_TIMEOUT', 20)),
+}
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY')) if os.getenv('LLM_HEDGE_DELAY') else None
+LLM_BREAKER_FAILURES = int(os.getenv('LLM_BREAKER_FAILURES', 5))
+LLM_BREAKER_RESET = float(os.getenv('LLM_BREAKER_RESET', 30))
+OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
+OPENAI_MODEL = os.getenv('OPENAI_MODEL', 'gpt-4o-mini')
+LLM_FAKE_LATENCY = float(os.getenv('LLM_FAKE_LATENCY', 0))
+LLM_FAKE_JITTER = float(os.getenv('LLM_FAKE_JITTER', 0))
+LLM_FAKE_ERROR_RATE = float(os.getenv('LLM_FAKE_ERROR_RATE', 0))
+LLM_FAKE_RESPONSES = os.getenv('LLM_FAKE_RESPONSES')  # optional JSON file of recorded responses
+
+# Per-request LLM summaries are logged by the base.llm logger at DEBUG (LLM_LOG_LEVEL=DEBUG to see them)
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'base.llm': {
+            'handlers': ['console'],
+            'level': os.getenv('LLM_LOG_LEVEL', 'INFO'),
+        },
+    },
+}
 
+# Category descriptions are fetched concurrently, each call with its own timeout (seconds)
+CATEGORY_DESCRIPTION_CONCURRENCY = int(os.getenv('CATEGORY_DESCRIPTION_CONCURRENCY', 8))
+CATEGORY_DESCRIPTION_TIMEOUT = float(os.getenv('CATEGORY_DESCRIPTION_TIMEOUT', 15))
 
+# Hard cap on Gemini calls per category request; amounts are rebalanced locally
+CATEGORY_LLM_MAX_ATTEMPTS = int(os.getenv('CATEGORY_LLM_MAX_ATTEMPTS', 2))
 
-# Use the SMTP backend for sending emails
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Generated descriptions are cached in memory (LRU) and in the DescriptionCache table
+DESCRIPTION_CACHE_MAX_ENTRIES = int(os.getenv('DESCRIPTION_CACHE_MAX_ENTRIES', 1024))
+DESCRIPTION_CACHE_MAX_ROWS = int(os.getenv('DESCRIPTION_CACHE_MAX_ROWS', 10000))
+DESCRIPTION_CACHE_TTL = int(os.getenv('DESCRIPTION_CACHE_TTL', 30 * 24 * 60 * 60))
+
+
+
+
+# Use the SMTP backend for sending emails. Point EMAIL_BACKEND at the console or
+# file backend (with EMAIL_FILE_PATH) to exercise bulk sends offline.
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = os.getenv('EMAIL_FILE_PATH', os.path.join(BASE_DIR, 'sent_emails'))
 
 # SMTP server settings for Google's Gmail
 EMAIL_HOST = 'smtp.gmail.com'
@@ -256,6 +306,26 @@ EMAIL_USE_SSL = False  # Use True for SSL
 EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD')
 
+# Bulk sends reopen the SMTP session every EMAIL_BULK_BATCH_SIZE messages and
+# are throttled to EMAIL_BULK_RATE messages per second (0 means unthrottled)
+EMAIL_BULK_BATCH_SIZE = int(os.getenv('EMAIL_BULK_BATCH_SIZE', 100))
+EMAIL_BULK_RATE = float(os.getenv('EMAIL_BULK_RATE', 0))
+
+# Bulk income imports insert INCOME_IMPORT_BATCH_SIZE rows per statement and
+# list at most INCOME_IMPORT_MAX_ERRORS bad rows in the response
+INCOME_IMPORT_BATCH_SIZE = int(os.getenv('INCOME_IMPORT_BATCH_SIZE', 1000))
+INCOME_IMPORT_MAX_ERRORS = int(os.getenv('INCOME_IMPORT_MAX_ERRORS', 100))
+
+# Most sub-requests one call to the batch endpoint may carry
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+
+# Sync returns up to SYNC_PAGE_SIZE rows of each kind per call, re-sends the
+# last SYNC_OVERLAP_SECONDS of changes so slow transactions aren't missed, and
+# keeps deletion tombstones for SYNC_TOMBSTONE_DAYS (older cursors must resync)
+SYNC_PAGE_SIZE = int(os.getenv('SYNC_PAGE_SIZE', 500))
+SYNC_OVERLAP_SECONDS = int(os.getenv('SYNC_OVERLAP_SECONDS', 5))
+SYNC_TOMBSTONE_DAYS = int(os.getenv('SYNC_TOMBSTONE_DAYS', 90))
+
 
 
 